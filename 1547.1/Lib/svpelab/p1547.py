@@ -31,18 +31,58 @@ Questions can be directed to support@sunspec.org
 """
 
 import os
-import xml.etree.ElementTree as ET
+import re
+import sys
 import csv
 import math
-import xlsxwriter
 import traceback
 from datetime import datetime, timedelta
 from collections import OrderedDict
 import time
+import threading
+import contextlib
 import collections
-import numpy as np
-import pandas as pd
-import random
+import weakref
+import importlib
+import copy
+import struct
+import logging
+
+
+class LazyModule(object):
+    """
+    Placeholder for a module that is only imported the first time one of its attributes is used.
+
+    numpy, pandas and ElementTree are only needed by the offline/vectorized paths and by the ride-through
+    classes, so the scripts should not pay for them when they import p1547. On the first access the module
+    is imported and the global name of this placeholder is rebound to it, so later accesses cost nothing.
+    """
+    def __init__(self, name, alias):
+        """
+        :param name:    module to import, e.g. 'pandas'
+        :param alias:   global name of the placeholder in this module, e.g. 'pd'
+        """
+        self.__dict__['name'] = name
+        self.__dict__['alias'] = alias
+
+    def load(self):
+        module = importlib.import_module(self.__dict__['name'])
+        globals()[self.__dict__['alias']] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __repr__(self):
+        return '<lazy module %r>' % self.__dict__['name']
+
+
+np = LazyModule('numpy', 'np')
+pd = LazyModule('pandas', 'pd')
+ET = LazyModule('xml.etree.ElementTree', 'ET')
+
+# Log of the library when it is used outside of the SVP (see OfflineScript)
+logger = logging.getLogger(__name__)
 
 # import sys
 # import os
@@ -87,20 +127,128 @@ This section is for EUT parameters needed such as V, P, Q, etc.
 """
 
 
+def params(info):
+    """
+    Declare the parameters of the library in the script information, as der.params(info) for the equipment
+    :param info:    script.ScriptInfo object of the script
+    """
+    info.param_group('p1547', label='P1547 Library Parameters', glob=True)
+    info.param('p1547.sampler_period', label='Background sampling period of the Tr values (s), 0 to disable',
+               default=0.0)
+
+
 def VersionValidation(script_version):
     if script_version != VERSION:
         raise p1547Error(f'Error in p1547 library version is {VERSION} while script version is {script_version}.'
                          f'Update library and script version accordingly.')
 
 
+# Type of the EUT parameters (eut.*) kept in the EutParams snapshot
+EUT_PARAM_TYPES = OrderedDict([
+    ('cat', str),
+    ('cat2', str),
+    ('sink_power', str),
+    ('phases', str),
+    ('imbalance_resp', str),
+    ('abs_enabled', str),
+    ('v_nom', float),
+    ('v_low', float),
+    ('v_high', float),
+    ('v_ll', float),
+    ('v_in_nom', float),
+    ('v_in_min', float),
+    ('v_in_max', float),
+    ('s_rated', float),
+    ('p_rated', float),
+    ('p_rated_prime', float),
+    ('p_min', float),
+    ('p_min_prime', float),
+    ('var_rated', float),
+    ('f_nom', float),
+    ('f_min', float),
+    ('f_max', float),
+    ('pf_msa', float),
+    ('startup_time', float),
+    ('wait_time', float),
+    ('scale_voltage', str),
+    ('scale_current', str),
+    ('offset_voltage', str),
+    ('offset_current', str),
+])
+
+
+class EutParams(object):
+    """
+    Immutable snapshot of the EUT parameters (eut.* parameters of the test configuration). The parameters are read
+    and converted once per test script object by get_eut_params(), then shared by the library classes and the
+    scripts. A parameter which is not defined is None.
+    """
+    __slots__ = tuple(EUT_PARAM_TYPES.keys())
+
+    def __init__(self, **values):
+        for name, param_type in EUT_PARAM_TYPES.items():
+            value = values.get(name)
+            if value is not None:
+                try:
+                    value = param_type(value)
+                except (TypeError, ValueError):
+                    raise p1547Error('Incorrect value of eut.%s: %s' % (name, value))
+            object.__setattr__(self, name, value)
+
+    @classmethod
+    def from_ts(cls, ts):
+        return cls(**{name: ts.param_value('eut.%s' % name) for name in EUT_PARAM_TYPES})
+
+    def __setattr__(self, name, value):
+        raise AttributeError('EutParams is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('EutParams is immutable')
+
+    def __repr__(self):
+        return 'EutParams(%s)' % ', '.join('%s=%r' % (name, getattr(self, name)) for name in self.__slots__)
+
+    def param_value(self, name):
+        """
+        :param name:    parameter name with or without the eut. prefix (e.g. eut.v_nom)
+        :return: value of the parameter
+        """
+        if name.startswith('eut.'):
+            name = name[len('eut.'):]
+        return getattr(self, name)
+
+
+# Snapshots of the EUT parameters by test script object
+eut_params_cache = weakref.WeakKeyDictionary()
+
+
+def get_eut_params(ts):
+    """
+    Get the EUT parameters snapshot of a test script object. It is created at the first call of the test run.
+    :param ts:  test script object
+    :return: EutParams object
+    """
+    try:
+        params = eut_params_cache.get(ts)
+    except TypeError:
+        # Test script objects which cannot be weakly referenced are not cached
+        return EutParams.from_ts(ts)
+    if params is None:
+        params = EutParams.from_ts(ts)
+        eut_params_cache[ts] = params
+    return params
+
+
 class EutParameters(object):
     def __init__(self, ts):
         self.ts = ts
         try:
-            self.v_nom = ts.param_value('eut.v_nom')
-            self.s_rated = ts.param_value('eut.s_rated')
-            self.v_high = ts.param_value('eut.v_high')
-            self.v_low = ts.param_value('eut.v_low')
+            params = get_eut_params(ts)
+            self.eut_params = params
+            self.v_nom = params.v_nom
+            self.s_rated = params.s_rated
+            self.v_high = params.v_high
+            self.v_low = params.v_low
 
             '''
             Minimum required accuracy (MRA) (per Table 3 of IEEE Std 1547-2018)
@@ -125,8 +273,8 @@ class EutParameters(object):
             '''
             self.MRA = {
                 'V': 0.01 * self.v_nom,
-                'Q': 0.05 * ts.param_value('eut.s_rated'),
-                'P': 0.05 * ts.param_value('eut.s_rated'),
+                'Q': 0.05 * params.s_rated,
+                'P': 0.05 * params.s_rated,
                 'F': 0.01,
                 'T': 0.01,
                 'PF': 0.01
@@ -136,35 +284,32 @@ class EutParameters(object):
             self.MRA_F_trans = 0.1
             self.MRA_T_trans = 2. / 60.
 
-            if ts.param_value('eut.f_nom'):
-                self.f_nom = ts.param_value('eut.f_nom')
+            if params.f_nom:
+                self.f_nom = params.f_nom
             else:
                 self.f_nom = None
 
-            if ts.param_value('eut.f_max'):
-                self.f_max = ts.param_value('eut.f_max')
+            if params.f_max:
+                self.f_max = params.f_max
             else:
                 self.f_max = None
-            if ts.param_value('eut.f_min'):
-                self.f_min = ts.param_value('eut.f_min')
+            if params.f_min:
+                self.f_min = params.f_min
             else:
                 self.f_min = None
 
-            if ts.param_value('eut.phases') is not None:
-                self.phases = ts.param_value('eut.phases')
-            else:
-                self.phases = None
-            if ts.param_value('eut.p_rated') is not None:
-                self.p_rated = ts.param_value('eut.p_rated')
-                self.p_rated_prime = ts.param_value('eut.p_rated_prime')  # absorption power
+            self.phases = params.phases
+            if params.p_rated is not None:
+                self.p_rated = params.p_rated
+                self.p_rated_prime = params.p_rated_prime  # absorption power
                 if self.p_rated_prime is None:
                     self.p_rated_prime = -self.p_rated
-                self.p_min = ts.param_value('eut.p_min')
-                self.var_rated = ts.param_value('eut.var_rated')
+                self.p_min = params.p_min
+                self.var_rated = params.var_rated
             else:
                 self.var_rated = None
             # self.imbalance_angle_fix = imbalance_angle_fix
-            self.absorb = ts.param_value('eut.abs_enabled')
+            self.absorb = params.abs_enabled
 
         except Exception as e:
             self.ts.log_error('Incorrect Parameter value : %s' % e)
@@ -185,15 +330,25 @@ class UtilParameters:
         self.filename = None
         self.double_letter_label = None
         self.script_complete_name = 'UNDEFINED IN TEST CLASS'
+        self.absorb_power = False
+        # Characteristic curves built for the current curve and power level (see get_characteristic())
+        self.characteristics = {}
 
     def reset_curve(self, curve=1):
         self.curve = curve
+        self.characteristics = {}
         self.ts.log_debug(f'P1547 Librairy curve has been set {curve}')
 
     def reset_pwr(self, pwr=1.0):
         self.pwr = pwr
+        self.characteristics = {}
         self.ts.log_debug(f'P1547 Librairy power level has been set {round(pwr * 100)}%')
 
+    def reset_absorb(self, absorb_power=False):
+        self.absorb_power = absorb_power
+        self.characteristics = {}
+        self.ts.log_debug(f'P1547 Librairy absorb power has been set {absorb_power}')
+
     def reset_filename(self, filename):
         self.filename = filename
 
@@ -266,9 +421,73 @@ class DataLogging:
         self.initial_value = {}
         self.tr_value = collections.OrderedDict()
         self.current_step_label = None
+        self.sampler = None
+        # data acquisition object of the sampler, it is started with the first step of each daq (see start())
+        self.sampler_daq = None
+        # The test script may run on its own clock (e.g. p1547_sim.SimulatedScript)
+        self.clock = getattr(self.ts, 'clock', None) or SystemClock()
+        self.scheduler = DeadlineScheduler(sleep=self.ts.sleep, spin=self.clock.spin, clock=self.clock.monotonic_ns)
 
     # def __config__(self):
 
+    def start_sampler(self, daq, period=None):
+        """
+        Start the background sampling of the measurements used for the Tr values (see RingBufferSampler)
+        :param daq:     data acquisition object from svpelab library
+        :param period:  sampling period in seconds, by default the p1547.sampler_period parameter. The sampler is
+                        not used when the period is None or 0.
+        :return: nothing
+        """
+        self.stop_sampler()
+        self.sampler_daq = daq
+        if period is None:
+            period = self.ts.param_value('p1547.sampler_period')
+        if daq is None or not period:
+            return
+        channels = []
+        for meas_value in self.meas_values:
+            channels += [label for label in self.get_measurement_label(meas_value) if label not in channels]
+        self.sampler = RingBufferSampler(daq=daq, channels=channels, period=period, ts=self.ts)
+        self.sampler.start()
+        self.ts.log('Background sampling of %s every %s s' % (channels, period))
+
+    def log_jitter_stats(self):
+        """
+        Log the lateness statistics of the Tr samples of the run and compare them with the time accuracy of the
+        transient measurements (MRA_T_trans)
+        :return: dictionary from DeadlineScheduler.get_stats()
+        """
+        stats = self.scheduler.get_stats()
+        if stats is None:
+            return None
+        self.ts.log('Tr sample timing (%d samples): p50 = %0.2f ms, p99 = %0.2f ms, max = %0.2f ms, MRA_T_trans = '
+                    '%0.2f ms' % (stats['count'], stats['p50'] * 1e3, stats['p99'] * 1e3, stats['max'] * 1e3,
+                                  self.MRA_T_trans * 1e3))
+        if stats['max'] > self.MRA_T_trans:
+            self.ts.log_warning('Tr sample timing exceeded MRA_T_trans')
+        return stats
+
+    def stop_sampler(self):
+        if self.sampler is not None:
+            self.sampler.stop()
+            self.sampler = None
+
+    def teardown(self):
+        """
+        End of the test script (finally block): log the timing of the Tr samples and stop the background sampling
+        """
+        self.log_jitter_stats()
+        self.stop_sampler()
+        self.sampler_daq = None
+
+    def daq_lock(self):
+        """
+        :return: the sampler lock to serialize the DAQ calls, or a context doing nothing without sampler
+        """
+        if self.sampler is not None:
+            return self.sampler.lock
+        return contextlib.nullcontext()
+
     def reset_time_settings(self, tr, number_tr=2):
         self.tr = tr
         self.ts.log_debug(f'P1547 Time response has been set to {self.tr} seconds')
@@ -465,7 +684,31 @@ class DataLogging:
             self.ts.log_error('phases=%s' % self.phases)
             #raise p1547Error('Error in get_measurement_total() : %s' % (str(e)))
 
-       
+    def get_measurement_array(self, dataset, type_meas):
+        """
+        Sum or average the EUT values from all phases for every row of a recorded dataset. This is the vectorized
+        counterpart of get_measurement_total() used when the data comes from a file instead of the DAQ.
+
+        :param dataset:     pandas DataFrame of a dataset written by ds.to_csv()
+        :param type_meas:   Either V, P, Q, F or PF
+        :return: numpy array with one value per row of the dataset
+        """
+        labels = [label for label in self.get_measurement_label(type_meas) if label in dataset.columns]
+        if not labels:
+            # Datasets without the DAQ channels only hold the soft channel written by start()
+            if '%s_MEAS' % type_meas not in dataset.columns:
+                raise p1547Error('No %s measurement found in dataset' % type_meas)
+            return dataset['%s_MEAS' % type_meas].to_numpy(dtype=float)
+
+        values = dataset[labels].to_numpy(dtype=float)
+        if type_meas == 'F':
+            # No need to do data average for frequency
+            return values[:, 0]
+        value = values.sum(axis=1)
+        if type_meas == 'V':
+            # average value of V
+            value = value / len(labels)
+        return value
 
     def get_rslt_sum_col_name(self):
         """
@@ -532,11 +775,16 @@ class DataLogging:
         # TODO : In a more sophisticated approach, get_initial['timestamp'] will come from a
         #  reliable secure thread or data acquisition timestamp
 
-        self.initial_value['timestamp'] = datetime.now()
+        self.initial_value['timestamp'] = self.clock.now()
+        self.initial_value['monotonic_ns'] = self.clock.monotonic_ns()
         self.current_step_label = step_label
-        daq.data_sample()
-        self.data = daq.data_capture_read()
-        daq.sc['event'] = self.current_step_label
+        if self.sampler_daq is not daq:
+            self.start_sampler(daq=daq)
+        with self.daq_lock():
+            daq.data_sample()
+            self.data = daq.data_capture_read()
+        # The initial sample is tagged with the bare step label so it can be located in the dataset afterward
+        daq.sc['EVENT'] = self.current_step_label
         if isinstance(self.x_criteria, list):
             for xs in self.x_criteria:
                 self.initial_value[xs] = {'x_value': self.get_measurement_total(type_meas=xs, log=False)}
@@ -561,7 +809,8 @@ class DataLogging:
                 self.initial_value[ys] = {'y_value': self.get_measurement_total(data=data, type_meas=ys, log=False)}
                 daq.sc['%s_MEAS' % ys] = self.initial_value[ys]["y_value"]
         """
-        daq.data_sample()
+        with self.daq_lock():
+            daq.data_sample()
 
     def record_timeresponse(self, daq):
         """
@@ -582,11 +831,10 @@ class DataLogging:
         y = list(self.y_criteria.keys())
         # self.tr = tr
 
-        first_tr = self.initial_value['timestamp'] + timedelta(seconds=self.tr)
-        tr_list = [first_tr]
+        initial_ns = self.initial_value['monotonic_ns']
+        tr_deadlines = [initial_ns + int(round(k * self.tr * 1e9)) for k in range(1, self.n_tr + 2)]
 
         for i in range(self.n_tr):
-            tr_list.append(tr_list[i] + timedelta(seconds=self.tr))
             for meas_value in self.meas_values:
                 self.tr_value['%s_TR_%s' % (meas_value, i)] = None
                 if meas_value in x:
@@ -597,16 +845,18 @@ class DataLogging:
                     self.tr_value['%s_TR_%s_MAX' % (meas_value, i)] = None
         tr_iter = 1
 
-        for tr_ in tr_list:
-            now = datetime.now()
-            if now <= tr_:
-                time_to_sleep = tr_ - datetime.now()
-                self.ts.log('Waiting %s seconds to get the next Tr data for analysis...' %
-                            time_to_sleep.total_seconds())
-                self.ts.sleep(time_to_sleep.total_seconds())
-            daq.data_sample()  # sample new data
-            data = daq.data_capture_read()  # Return dataset created from last data capture
+        for tr_deadline in tr_deadlines:
+            time_to_sleep = (tr_deadline - self.clock.monotonic_ns()) / 1e9
+            if time_to_sleep > 0:
+                self.ts.log('Waiting %s seconds to get the next Tr data for analysis...' % time_to_sleep)
+            tr_actual = self.scheduler.wait_until(tr_deadline)
+            if self.sampler is not None:
+                self.set_sampled_measurements(daq, tr_iter)
+            # The event is set before sampling so the Tr row of the dataset carries its own label
             daq.sc['EVENT'] = "{0}_TR_{1}".format(self.current_step_label, tr_iter)
+            with self.daq_lock():
+                daq.data_sample()  # sample new data
+                data = daq.data_capture_read()  # Return dataset created from last data capture
 
             # update daq.sc values for Y_TARGET, Y_TARGET_MIN, and Y_TARGET_MAX
 
@@ -621,22 +871,380 @@ class DataLogging:
                     self.ts.log_error('Test script exception: %s' % traceback.format_exc())
                     self.ts.log_debug('Measured value (%s) not recorded: %s' % (meas_value, e))
 
-            # self.tr_value[tr_iter]["timestamp"] = tr_
-            self.tr_value[f'timestamp_{tr_iter}'] = tr_
+            # Intended and actual times of the Tr sample since the start of the step
+            self.tr_value[f'TIME_TR_{tr_iter}_INTENDED'] = (tr_deadline - initial_ns) / 1e9
+            self.tr_value[f'TIME_TR_{tr_iter}_ACTUAL'] = (tr_actual - initial_ns) / 1e9
+            # The sampler values are interpolated at the intended time
+            if self.sampler is not None:
+                elapsed = self.tr_value[f'TIME_TR_{tr_iter}_INTENDED']
+            else:
+                elapsed = self.tr_value[f'TIME_TR_{tr_iter}_ACTUAL']
+            self.tr_value[f'timestamp_{tr_iter}'] = self.initial_value['timestamp'] + timedelta(seconds=elapsed)
             self.tr_value['LAST_ITER'] = tr_iter - 1
             tr_iter = tr_iter + 1
 
         self.tr_value['FIRST_ITER'] = 1
+        if self.sampler is not None:
+            errors = [self.tr_value['SAMPLING_ERROR_TR_%s' % i] for i in range(1, tr_iter)]
+            self.tr_value['SAMPLING_ERROR'] = max(errors)
+            self.ts.log_debug('Tr sampling error of %s = %0.4f s' % (self.current_step_label, max(errors)))
 
         return self.tr_value
 
+    def set_sampled_measurements(self, daq, tr_iter):
+        """
+        Interpolate the measurements at exactly initial timestamp + tr_iter * Tr from the ring buffer of the sampler
+        and write them in the soft channels
+        :param daq:         data acquisition object from svpelab library
+        :param tr_iter:     time response iteration (1 is the first Tr)
+        :return: nothing
+        """
+        tr_time = self.initial_value['monotonic_ns'] / 1e9 + tr_iter * self.tr
+        if not self.sampler.wait_for(tr_time):
+            self.ts.log_warning('No background sample after Tr %s, the last sample is used' % tr_iter)
+        frame, error = self.sampler.interpolate(tr_time)
+        for meas_value in self.meas_values:
+            daq.sc['%s_MEAS' % meas_value] = round(float(self.get_measurement_array(frame, meas_value)[0]), 3)
+        self.tr_value['SAMPLING_ERROR_TR_%s' % tr_iter] = float(error[0])
+
         # except Exception as e:
         #    raise p1547Error('Error in get_tr_data(): %s' % (str(e)))
 
 
+"""
+This section is for the sampling and timing of the time responses
+"""
+
+
+class SystemClock(object):
+    """
+    Clock of the test station. The test script may provide another clock with the same methods as its 'clock'
+    attribute (see p1547_sim.VirtualClock).
+    """
+    # Busy wait at the end of the DeadlineScheduler waits in seconds
+    spin = 0.002
+
+    @staticmethod
+    def monotonic_ns():
+        return time.monotonic_ns()
+
+    @staticmethod
+    def now():
+        return datetime.now()
+
+
+class DeadlineScheduler(object):
+    """
+    Wait for deadlines of the monotonic clock (not affected by NTP or wall clock changes). The wait is a coarse sleep
+    up to a short time before the deadline followed by a busy wait, and the lateness of every wake up is kept for
+    the jitter statistics of the run.
+    """
+
+    def __init__(self, sleep=None, spin=0.002, clock=None):
+        """
+        :param sleep:   sleep function used for the coarse wait (e.g. ts.sleep), time.sleep by default
+        :param spin:    duration of the busy wait in seconds
+        :param clock:   monotonic clock function in nanoseconds, time.monotonic_ns by default
+        """
+        self.sleep = sleep if sleep is not None else time.sleep
+        self.spin_ns = int(spin * 1e9)
+        self.clock = clock if clock is not None else time.monotonic_ns
+        self.lateness_ns = []
+
+    def wait_until(self, deadline_ns):
+        """
+        :param deadline_ns:     deadline given by the clock
+        :return: actual wake up time given by the clock
+        """
+        remaining_ns = deadline_ns - self.clock()
+        if remaining_ns > self.spin_ns:
+            self.sleep((remaining_ns - self.spin_ns) / 1e9)
+        while self.clock() < deadline_ns:
+            pass
+        actual_ns = self.clock()
+        self.lateness_ns.append(actual_ns - deadline_ns)
+        return actual_ns
+
+    def get_stats(self):
+        """
+        :return: dictionary with the number of waits and the p50, p99 and max lateness in seconds (None without waits)
+        """
+        if not self.lateness_ns:
+            return None
+        lateness = np.asarray(self.lateness_ns, dtype=float) / 1e9
+        return {'count': lateness.size,
+                'p50': float(np.percentile(lateness, 50)),
+                'p99': float(np.percentile(lateness, 99)),
+                'max': float(lateness.max())}
+
+    def reset(self):
+        self.lateness_ns = []
+
+
+class RingBufferSampler(object):
+    """
+    Background thread reading the DAQ channels at a fixed period into a timestamped ring buffer. The values at any
+    instant covered by the buffer (e.g. initial timestamp + k * Tr) are linearly interpolated between the samples, so
+    they don't depend on the sleep jitter or the DAQ latency of the main thread.
+
+    The samples use daq.data_read() so they are not added to the data capture. Calls to the DAQ from DataLogging are
+    serialized with the sampler lock.
+    """
+
+    def __init__(self, daq, channels, period=0.1, duration=600., ts=None):
+        """
+        :param daq:         data acquisition object from svpelab library
+        :param channels:    DAQ channels to buffer (e.g. ['AC_VRMS_1', 'AC_Q_1'])
+        :param period:      sampling period in seconds
+        :param duration:    time span kept in the buffer in seconds
+        :param ts:          test script object used for logging
+        """
+        self.daq = daq
+        self.channels = list(channels)
+        self.period = period
+        self.size = int(math.ceil(duration / period)) + 1
+        self.times = np.full(self.size, np.nan)
+        self.values = np.full((self.size, len(self.channels)), np.nan)
+        self.count = 0
+        self.ts = ts
+        self.lock = threading.RLock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='p1547-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+
+    def is_running(self):
+        return self._thread is not None
+
+    def _run(self):
+        next_time = time.monotonic()
+        while not self._stop_event.is_set():
+            try:
+                self.sample()
+            except Exception as e:
+                if self.ts is not None:
+                    self.ts.log_error('Background sampling error: %s' % e)
+            next_time += self.period
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                self._stop_event.wait(delay)
+            else:
+                # Late: restart the schedule instead of sampling in bursts
+                next_time = time.monotonic()
+
+    def sample(self):
+        """
+        Read the DAQ and store the values. The sample time is the middle of the read call.
+        """
+        with self.lock:
+            t_start = time.monotonic()
+            data = self.daq.data_read()
+            t_end = time.monotonic()
+            row = [data.get(channel) for channel in self.channels]
+            index = self.count % self.size
+            self.times[index] = (t_start + t_end) / 2.
+            self.values[index] = [np.nan if value is None else value for value in row]
+            self.count += 1
+
+    def snapshot(self):
+        """
+        :return: copies of the sample times and values in chronological order
+        """
+        with self.lock:
+            if self.count <= self.size:
+                return self.times[:self.count].copy(), self.values[:self.count].copy()
+            index = self.count % self.size
+            return np.roll(self.times, -index), np.roll(self.values, -index, axis=0)
+
+    def wait_for(self, timestamp, timeout=None):
+        """
+        Wait until the buffer holds a sample taken after a monotonic timestamp so it can be interpolated
+        :return: True if the sample is available
+        """
+        if timeout is None:
+            timeout = 10 * self.period
+        deadline = time.monotonic() + max(timestamp - time.monotonic(), 0) + timeout
+        while True:
+            with self.lock:
+                if self.count and self.times[(self.count - 1) % self.size] >= timestamp:
+                    return True
+            if time.monotonic() > deadline or not self.is_running():
+                return False
+            time.sleep(self.period / 4.)
+
+    def interpolate(self, timestamps):
+        """
+        Interpolate the channels at monotonic timestamps
+        :param timestamps:  monotonic timestamps (seconds)
+        :return: pandas DataFrame with a row per timestamp and the sampling error (seconds) of every timestamp, i.e.
+                 the distance to the nearest sample
+        """
+        timestamps = np.atleast_1d(np.asarray(timestamps, dtype=float))
+        times, values = self.snapshot()
+        if times.size == 0:
+            raise p1547Error('No sample in the ring buffer')
+        frame = pd.DataFrame({channel: np.interp(timestamps, times, values[:, i])
+                              for i, channel in enumerate(self.channels)})
+        nearest = np.clip(np.searchsorted(times, timestamps), 1, max(times.size - 1, 1))
+        error = np.minimum(np.abs(timestamps - times[nearest - 1]), np.abs(times[np.minimum(nearest, times.size - 1)]
+                                                                             - timestamps))
+        return frame, error
+
+
+"""
+This section is for the characteristic curves
+"""
+
+
+class Characteristic(object):
+    """
+    Characteristic of a function for one curve and power level. VV, VW and WV are piecewise-linear curves and FW is
+    the frequency droop with its deadband. evaluate() and bounds() accept a scalar or an array of X values.
+    """
+
+    def __init__(self, function, x, y, xp=None, fp=None, droop=None, scale=1.0, decimals=None, mra_x=0.0,
+                 mra_y=0.0):
+        """
+        :param function:    VV, VW, WV or FW
+        :param x:           X measurement type (V, P or F)
+        :param y:           Y measurement type (P or Q)
+        :param xp:          X points of a piecewise-linear curve
+        :param fp:          Y points of a piecewise-linear curve
+        :param droop:       dictionary with f_dob, f_dub, p_db, p_avl, f_kof (f_nom * kof), p_min and p_max for FW
+        :param scale:       multiplier applied to the Y values (power level)
+        :param decimals:    number of decimals of the Y values (None to disable the rounding)
+        :param mra_x:       X shift used for the min/max bounds (1.5 * MRA)
+        :param mra_y:       Y shift used for the min/max bounds (1.5 * MRA)
+        """
+        self.function = function
+        self.x = x
+        self.y = y
+        self.xp = None if xp is None else np.asarray(xp, dtype=float)
+        self.fp = None if fp is None else np.asarray(fp, dtype=float)
+        self.droop = droop
+        self.scale = scale
+        self.decimals = decimals
+        self.mra_x = mra_x
+        self.mra_y = mra_y
+
+    def evaluate_array(self, values):
+        values = np.asarray(values, dtype=float)
+        if self.droop is not None:
+            d = self.droop
+            p_above = np.maximum(d['p_db'] - ((values - d['f_dob']) / d['f_kof']) * d['p_db'], d['p_min'])
+            p_below = np.minimum(((d['f_dub'] - values) / d['f_kof']) * d['p_avl'] + d['p_db'], d['p_max'])
+            y = np.where(values > d['f_dob'], p_above, np.where(values < d['f_dub'], p_below, d['p_db']))
+        else:
+            y = np.interp(values, self.xp, self.fp)
+        y = y * self.scale
+        if self.decimals is not None:
+            y = np.round(y, self.decimals)
+        return y
+
+    def evaluate(self, values):
+        """
+        :param values:  X value(s)
+        :return: Y target(s), a float for a scalar X
+        """
+        y = self.evaluate_array(values)
+        return float(y) if y.ndim == 0 else y
+
+    def bounds(self, values):
+        """
+        Min/max Y bounds of measured X value(s): the characteristic is evaluated at X +/- 1.5 MRA(X) in a single call
+        and shifted by -/+ 1.5 MRA(Y)
+        :param values:  measured X value(s)
+        :return: target_min, target_max
+        """
+        values = np.asarray(values, dtype=float)
+        y = self.evaluate_array(np.stack([values + self.mra_x, values - self.mra_x]))
+        target_min = y[0] - self.mra_y
+        target_max = y[1] + self.mra_y
+        if target_min.ndim == 0:
+            return float(target_min), float(target_max)
+        return target_min, target_max
+
+
 class CriteriaValidation:
     def __init__(self, criteria_mode):
         self.criteria_mode = criteria_mode
+        self.step_plan = None
+
+    def set_step_plan(self, step_plan):
+        """
+        Use the targets compiled in a StepPlan instead of recalculating them at each step
+        :param step_plan:   StepPlan object (None to disable)
+        :return: nothing
+        """
+        self.step_plan = step_plan
+
+    def get_characteristic(self, function):
+        """
+        Get the characteristic of a function for the current curve and power level. It is built at the first call
+        after reset_curve(), reset_pwr() or reset_absorb().
+        :param function:    VV, VW, WV or FW
+        :return: Characteristic object
+        """
+        characteristic = self.characteristics.get(function)
+        if characteristic is None:
+            characteristic = self.build_characteristic(function)
+            self.characteristics[function] = characteristic
+        return characteristic
+
+    def build_characteristic(self, function):
+        if function == VV:
+            vv_pairs = self.get_params(function=VV, curve=self.curve)
+            return Characteristic(VV, x='V', y='Q',
+                                  xp=[vv_pairs['V1'], vv_pairs['V2'], vv_pairs['V3'], vv_pairs['V4']],
+                                  fp=[vv_pairs['Q1'], vv_pairs['Q2'], vv_pairs['Q3'], vv_pairs['Q4']],
+                                  scale=self.pwr, decimals=1, mra_x=self.MRA['V'] * 1.5, mra_y=self.MRA['Q'] * 1.5)
+
+        elif function == VW:
+            vw_pairs = self.get_params(function=VW, curve=self.curve)
+            self.ts.log_debug(f'vw_pairs={vw_pairs}')
+            return Characteristic(VW, x='V', y='P',
+                                  xp=[vw_pairs['V1'], vw_pairs['V2']],
+                                  fp=[vw_pairs['P1'], vw_pairs['P2']],
+                                  scale=self.pwr, decimals=1, mra_x=self.MRA['V'] * 1.5, mra_y=self.MRA['P'] * 1.5)
+
+        elif function == WV:
+            wv_pairs = self.get_params(function=WV, curve=self.curve)
+            return Characteristic(WV, x='P', y='Q',
+                                  xp=[wv_pairs['P1'], wv_pairs['P2'], wv_pairs['P3']],
+                                  fp=[wv_pairs['Q1'], wv_pairs['Q2'], wv_pairs['Q3']],
+                                  scale=self.pwr, mra_x=self.MRA['P'] * 1.5, mra_y=self.MRA['Q'] * 1.5)
+
+        elif function == FW:
+            fw_pairs = self.get_params(function=FW, curve=self.curve)
+            p_min = self.p_min
+            # The EUT is configured with P'min when it can absorb power
+            if self.absorb_power and fw_pairs.get('p_min_prime') is not None:
+                p_min = fw_pairs['p_min_prime']
+            droop = {
+                'f_dob': self.f_nom + fw_pairs['dbf'],
+                'f_dub': self.f_nom - fw_pairs['dbf'],
+                'p_db': self.p_rated * self.pwr,
+                'p_avl': self.p_rated * (1.0 - self.pwr),
+                'f_kof': self.f_nom * fw_pairs['kof'],
+                'p_min': p_min,
+                'p_max': self.p_rated
+            }
+            return Characteristic(FW, x='F', y='P', droop=droop, scale=self.pwr, decimals=2,
+                                  mra_x=self.MRA['F'] * 1.5, mra_y=self.MRA['P'] * 1.5)
+
+        raise p1547Error('No characteristic curve for %s' % function)
 
     def define_target(self, daq, step_dict=None, y_criterias_mod=None):
         """
@@ -662,6 +1270,11 @@ class CriteriaValidation:
         y = list(y_criteria.keys())
         # self.tr = tr
         self.ts.log_debug(f'daq={daq.sc}')
+        plan_index = None
+        if self.step_plan is not None:
+            plan_index = self.step_plan.get_index(self.filename, self.current_step_label)
+        # Target and bounds only depend on the step and the measurements of start() so they are the same at every Tr
+        y_targets = {}
         for tr_iter in range(self.n_tr + 1):
             self.ts.log_debug(f'tr_iter={tr_iter}')
             # store the daq.sc['Y_TARGET'], daq.sc['Y_TARGET_MIN'], and daq.sc['Y_TARGET_MAX'] in tr_value
@@ -681,9 +1294,16 @@ class CriteriaValidation:
                             # self.ts.log_debug(f'meas={meas_value} et step_dict={self.step_dict}')
                             self.ts.log_debug(f'function={y_criteria[meas_value]}')
 
-                            daq.sc['%s_TARGET' % meas_value] = self.update_target_value(function=y_criteria[meas_value])
-                            daq.sc['%s_TARGET_MIN' % meas_value], daq.sc['%s_TARGET_MAX' % meas_value] = \
-                                self.calculate_min_max_values(function=y_criteria[meas_value])
+                            if meas_value not in y_targets:
+                                if plan_index is not None and \
+                                        self.step_plan.get_function(plan_index, meas_value) == y_criteria[meas_value]:
+                                    target = self.step_plan.get_target(plan_index, meas_value)
+                                else:
+                                    target = self.update_target_value(function=y_criteria[meas_value])
+                                y_targets[meas_value] = (target, *self.calculate_min_max_values(
+                                    function=y_criteria[meas_value]))
+                            daq.sc['%s_TARGET' % meas_value], daq.sc['%s_TARGET_MIN' % meas_value], \
+                                daq.sc['%s_TARGET_MAX' % meas_value] = y_targets[meas_value]
 
                         else:
                             daq.sc['%s_TARGET' % meas_value] = self.update_target_value(value=step_value,
@@ -707,32 +1327,11 @@ class CriteriaValidation:
 
         step_dict = self.step_dict
 
-        if function == VV:
-            vv_pairs = self.get_params(function=VV, curve=self.curve)
-            x = [vv_pairs['V1'], vv_pairs['V2'],
-                 vv_pairs['V3'], vv_pairs['V4']]
-            y = [vv_pairs['Q1'], vv_pairs['Q2'],
-                 vv_pairs['Q3'], vv_pairs['Q4']]
-            if isinstance(step_dict, dict):
-                q_value = float(np.interp(step_dict['V'], x, y))
-            else:
-                q_value = float(np.interp(value, x, y))
-            q_value *= self.pwr
-            return round(q_value, 1)
-
-        if function == VW:
-            # self.ts.log_debug(f'VW target calculation')
-            vw_pairs = self.get_params(function=VW, curve=self.curve)
-            self.ts.log_debug(f'vw_pairs={vw_pairs}')
-            x = [vw_pairs['V1'], vw_pairs['V2']]
-            y = [vw_pairs['P1'], vw_pairs['P2']]
+        if function in [VV, VW, WV, FW]:
+            characteristic = self.get_characteristic(function)
             if isinstance(step_dict, dict):
-                p_value = float(np.interp(step_dict['V'], x, y))
-            else:
-                p_value = float(np.interp(value, x, y))
-            p_value *= self.pwr
-            self.ts.log_debug(f'p_value={p_value}')
-            return round(p_value, 1)
+                value = step_dict[characteristic.x]
+            return characteristic.evaluate(value)
 
         if function == CPF:
             # self.ts.log_debug(f'CPF target calculation')
@@ -744,58 +1343,28 @@ class CriteriaValidation:
             q_value = step_dict['Q']
             return round(q_value, 1)
 
-        if function == WV:
-            # self.ts.log_debug(f'WV target calculation')
-            x = [self.param[WV][self.curve]['P1'], self.param[WV][self.curve]['P2'], self.param[WV][self.curve]['P3']]
-            y = [self.param[WV][self.curve]['Q1'], self.param[WV][self.curve]['Q2'], self.param[WV][self.curve]['Q3']]
-            q_value = float(np.interp(step_dict['P'], x, y))
-            q_value *= self.pwr
-            self.ts.log_debug('Power value: %s --> q_target: %s' % (value, q_value))
-            return q_value
-
-        if function == FW:
-            # self.ts.log_debug(f'FW target calculation')
-            p_targ = None
-            fw_pairs = self.get_params(function=FW, curve=self.curve)
-            f_dob = self.f_nom + fw_pairs['dbf']
-            f_dub = self.f_nom - fw_pairs['dbf']
-            p_db = self.p_rated * self.pwr
-            p_avl = self.p_rated * (1.0 - self.pwr)
-            if isinstance(step_dict, dict):
-                value = step_dict['F']
-            self.ts.log_debug(f'value={value}')
-            if f_dub <= value <= f_dob:
-                p_targ = p_db
-            elif value > f_dob:
-                p_targ = p_db - ((value - f_dob) / (self.f_nom * self.param[FW][self.curve]['kof'])) * p_db
-                if p_targ < self.p_min:
-                    p_targ = self.p_min
-            elif value < f_dub:
-                p_targ = ((f_dub - value) / (self.f_nom * self.param[FW][self.curve]['kof'])) * p_avl + p_db
-                if p_targ > self.p_rated:
-                    p_targ = self.p_rated
-            p_targ *= self.pwr
-            return round(p_targ, 2)
-
         if function == LAP:
             self.ts.log_debug(f'LAP target calculation')
             p_targ = (step_dict['P'] * self.p_rated) + self.MRA['P']
             return p_targ
 
+    def get_step_x(self, x):
+        """
+        X value at which the bounds of a step are evaluated: the X commanded by the step when step_dict has it, else
+        the X measured by start(), which is the value before the step was applied
+        :param x:   X measurement type (V, F or P)
+        :return: X value
+        """
+        if isinstance(self.step_dict, dict) and self.step_dict.get(x) is not None:
+            return self.step_dict[x]
+        return self.get_measurement_total(type_meas=x, log=False)
+
     def calculate_min_max_values(self, function, meas_value=None):
 
         step_dict = self.step_dict
         if PRI == function:
-            v_meas = self.get_measurement_total(type_meas='V', log=False)
-            f_meas = self.get_measurement_total(type_meas='F', log=False)
-
-            target_min_vw = self.update_target_value(value=v_meas + self.MRA['V'] * 1.5, function=VW) - (
-                    self.MRA['P'] * 1.5)
-            target_max_vw = self.update_target_value(value=v_meas - self.MRA['V'] * 1.5, function=VW) + (
-                    self.MRA['P'] * 1.5)
-            target_min_fw = self.update_target_value(value=f_meas + self.MRA['F'] * 1.5, function=FW) - (
-                    self.MRA['P'] * 1.5)
-            target_max_fw = self.update_target_value(value=f_meas - self.MRA['F'] * 1.5, function=FW)
+            target_min_vw, target_max_vw = self.get_characteristic(VW).bounds(self.get_step_x('V'))
+            target_min_fw, target_max_fw = self.get_characteristic(FW).bounds(self.get_step_x('F'))
             if (target_max_vw - target_min_vw) > (target_max_fw - target_min_fw):
                 target_min = target_min_vw
                 target_max = target_max_vw
@@ -803,19 +1372,9 @@ class CriteriaValidation:
                 target_min = target_min_fw
                 target_max = target_max_fw
 
-        if function == VV:
-            v_meas = self.get_measurement_total(type_meas='V', log=False)
-            target_min = self.update_target_value(value=v_meas + self.MRA['V'] * 1.5, function=VV) - (
-                        self.MRA['Q'] * 1.5)
-            target_max = self.update_target_value(value=v_meas - self.MRA['V'] * 1.5, function=VV) + (
-                        self.MRA['Q'] * 1.5)
-
-        elif function == VW:
-            v_meas = self.get_measurement_total(type_meas='V', log=False)
-            target_min = self.update_target_value(value=v_meas + self.MRA['V'] * 1.5, function=VW) - (
-                        self.MRA['P'] * 1.5)
-            target_max = self.update_target_value(value=v_meas - self.MRA['V'] * 1.5, function=VW) + (
-                        self.MRA['P'] * 1.5)
+        if function in [VV, VW, WV, FW]:
+            characteristic = self.get_characteristic(function)
+            target_min, target_max = characteristic.bounds(self.get_step_x(characteristic.x))
 
         elif function == CPF:
             p_meas = self.get_measurement_total(type_meas='P', log=False)
@@ -830,21 +1389,6 @@ class CriteriaValidation:
             target_min = step_dict['Q'] - self.MRA['Q']
             target_max = step_dict['Q'] + self.MRA['Q']
 
-        elif function == WV:
-            p_meas = self.get_measurement_total(type_meas='P', log=False)
-            # q_meas = self.get_measurement_total(data=data, type_meas='Q', log=False)
-            step_min = {'P': p_meas + self.MRA['P'] * 1.5}
-            step_max = {'P': p_meas - self.MRA['P'] * 1.5}
-            target_min = self.update_target_value(step_dict=step_min, function=WV) - (self.MRA['Q'] * 1.5)
-            target_max = self.update_target_value(step_dict=step_max, function=WV) + (self.MRA['Q'] * 1.5)
-
-        elif function == FW:
-            f_meas = self.get_measurement_total(type_meas='F', log=False)
-            target_min = self.update_target_value(value=f_meas + self.MRA['F'] * 1.5, function=FW) - (
-                        self.MRA['P'] * 1.5)
-            target_max = self.update_target_value(value=f_meas - self.MRA['F'] * 1.5, function=FW) + (
-                        self.MRA['P'] * 1.5)
-
         elif function == LAP:
             target_min = self.update_target_value(function=LAP) - (self.MRA['P'] * 1.5)
             target_max = self.update_target_value(function=LAP) + (self.MRA['P'] * 1.5)
@@ -877,7 +1421,8 @@ class CriteriaValidation:
 
         time_const = tr / (-(math.log(0.1)))  # ~2.3 * time constants to reach the open loop response time in seconds
         number_of_taus = duration / time_const  # number of time constants into the response
-        resp_fraction = 1 - math.exp(-number_of_taus)  # fractional response after the duration, e.g. 90%
+        # np.exp so the same calculation can be applied to arrays of steps (see DatasetReplay)
+        resp_fraction = 1 - np.exp(-number_of_taus)  # fractional response after the duration, e.g. 90%
 
         # Y must be 90% * (Y_final - Y_initial) + Y_initial
         resp = (y_ss - y0) * resp_fraction + y0  # expand to y units
@@ -1110,6 +1655,388 @@ Section reserved for HIL model object
 """
 
 
+class MatlabVariableShadow(object):
+    """
+    Client-side copy of the MATLAB variables last sent to the HIL model.
+
+    Every round trip to RT-LAB is slow, so push() only sends the variables whose value differs from the copy, in a
+    single set_matlab_variables() call, and logs the bytes and the estimated time saved by the variables not sent.
+    The time saved is estimated with the mean time per variable of the pushes made so far.
+    """
+    def __init__(self, ts, hil):
+        self.ts = ts
+        self.hil = hil
+        self.values = {}
+        self.stats = collections.Counter()
+
+    @staticmethod
+    def get_size(name, value):
+        """
+        :return: size of the variable in bytes, the name and 8 bytes per double
+        """
+        try:
+            return len(name) + 8 * max(np.size(value), 1)
+        except TypeError:
+            return len(name) + len(str(value))
+
+    def is_current(self, name, value):
+        if name not in self.values:
+            return False
+        try:
+            return np.array_equal(self.values[name], np.asarray(value, dtype=float))
+        except (TypeError, ValueError):
+            return self.values[name] == value
+
+    def push(self, parameters):
+        """
+        :param parameters:  list of (name, value) as for hil.set_matlab_variables()
+        :return: list of the (name, value) sent
+        """
+        changed = [(name, value) for name, value in parameters if not self.is_current(name, value)]
+        skipped = [(name, value) for name, value in parameters if self.is_current(name, value)]
+        sent_bytes = sum(self.get_size(name, value) for name, value in changed)
+        skipped_bytes = sum(self.get_size(name, value) for name, value in skipped)
+
+        elapsed = 0.
+        if changed:
+            start = time.perf_counter()
+            self.hil.set_matlab_variables(changed)
+            elapsed = time.perf_counter() - start
+            for name, value in changed:
+                try:
+                    self.values[name] = np.array(value, dtype=float)
+                except (TypeError, ValueError):
+                    self.values[name] = value
+        self.stats['pushes'] += 1
+        self.stats['sent'] += len(changed)
+        self.stats['skipped'] += len(skipped)
+        self.stats['sent_bytes'] += sent_bytes
+        self.stats['skipped_bytes'] += skipped_bytes
+        self.stats['time'] += elapsed
+        saved = len(skipped) * self.stats['time'] / self.stats['sent'] if self.stats['sent'] else 0.
+
+        self.ts.log_debug('HIL variables: %d sent (%d bytes) in %0.1f ms, %d unchanged not sent '
+                          '(%d bytes, ~%0.1f ms saved)' % (len(changed), sent_bytes, elapsed * 1e3, len(skipped),
+                                                          skipped_bytes, saved * 1e3))
+        return changed
+
+    def reset(self):
+        """
+        Forget the values sent, e.g. after the model was compiled again, so the next push sends everything
+        """
+        self.values = {}
+
+    def get_stats(self):
+        return dict(self.stats)
+
+
+class ControlSignals(object):
+    """
+    Client-side copy of the control signal vector of the HIL model (e.g. the RT-LAB console control signals).
+
+    The vector is read from the model once and then kept here, so the scripts change the signals by index or by
+    name (see UI_CONTROL_SIGNALS) without reading the whole vector back first. push() writes only when a signal
+    differs from the last vector written: a single changed signal is written alone when the HIL driver provides
+    set_control_signal(index, value), else the whole vector is written with set_control_signals().
+    """
+    def __init__(self, ts, hil, names=None):
+        """
+        :param ts:      test script object
+        :param hil:     hil object with get_control_signals() and set_control_signals()
+        :param names:   dict of the names of the signals and their index in the vector
+        """
+        self.ts = ts
+        self.hil = hil
+        self.names = names or {}
+        self.values = None
+        self.written = None
+        self.stats = collections.Counter()
+
+    def get_index(self, key):
+        if isinstance(key, str):
+            try:
+                return self.names[key]
+            except KeyError:
+                raise p1547Error('Unknown control signal %s' % key)
+        return key
+
+    def read(self):
+        """
+        Read the vector from the model again, e.g. when it may have been changed outside of this object
+        """
+        self.values = list(self.hil.get_control_signals(details=False))
+        self.written = list(self.values)
+        self.stats['reads'] += 1
+        return self
+
+    def get_values(self):
+        if self.values is None:
+            self.read()
+        return self.values
+
+    def __getitem__(self, key):
+        return self.get_values()[self.get_index(key)]
+
+    def __setitem__(self, key, value):
+        self.get_values()[self.get_index(key)] = value
+
+    def __len__(self):
+        return len(self.get_values())
+
+    def __iter__(self):
+        return iter(self.get_values())
+
+    def __repr__(self):
+        return repr(self.get_values())
+
+    def push(self):
+        """
+        :return: indexes of the signals written
+        """
+        values = self.get_values()
+        changed = [i for i, (value, written) in enumerate(zip(values, self.written)) if value != written]
+        if not changed:
+            self.stats['skipped'] += 1
+            return changed
+        if len(changed) == 1 and hasattr(self.hil, 'set_control_signal'):
+            self.hil.set_control_signal(changed[0], values[changed[0]])
+        else:
+            self.hil.set_control_signals(values=list(values))
+        self.written = list(values)
+        self.stats['writes'] += 1
+        self.stats['changed'] += len(changed)
+        self.ts.log_debug('HIL control signals: %s written, %d writes and %d reads so far, %d unchanged not written'
+                          % (', '.join(self.get_name(i) for i in changed), self.stats['writes'],
+                             self.stats['reads'], self.stats['skipped']))
+        return changed
+
+    def get_name(self, index):
+        for name, i in self.names.items():
+            if i == index:
+                return name
+        return str(index)
+
+    def get_stats(self):
+        return dict(self.stats)
+
+
+def get_file_status(filename):
+    """
+    Size of a waveform file and whether it is completely written. A MATLAB v4 file (RT-LAB OpWriteFile) is complete
+    when its size matches the matrix dimensions of its header, a v5 file when its first data element is complete
+    and any other file (e.g. csv) when its header line is complete.
+    :param filename:    file name
+    :return: (size in bytes or None if the file does not exist, True if the file is complete)
+    """
+    try:
+        size = os.path.getsize(filename)
+        with open(filename, 'rb') as f:
+            header = f.read(256)
+    except OSError:
+        return None, False
+    if filename.lower().endswith('.mat'):
+        if header.startswith(b'MATLAB'):
+            if len(header) < 136:
+                return size, False
+            endian = '<' if header[126:128] == b'IM' else '>'
+            n_bytes = struct.unpack(endian + 'I', header[132:136])[0]
+            return size, size >= 136 + n_bytes
+        if len(header) < 20:
+            return size, False
+        for endian in ('<', '>'):
+            mopt, mrows, ncols, imagf, namlen = struct.unpack(endian + '5i', header[:20])
+            if 0 <= mopt < 5000 and mrows >= 0 and ncols >= 0 and namlen > 0:
+                precision = (mopt // 10) % 10
+                element_size = {0: 8, 1: 4, 2: 4, 3: 2, 4: 2, 5: 1}.get(precision, 8)
+                return size, size == 20 + namlen + mrows * ncols * element_size * (2 if imagf else 1)
+        return size, False
+    return size, b'\n' in header
+
+
+class SimulationWaiter(object):
+    """
+    Waits for the end of a HIL simulation and for the waveform file saved by the model.
+
+    The simulation time is polled with a back-off proportional to the remaining time (half of it, between min_poll
+    and max_poll), so the wait ends shortly after the stop time without polling the target every few ms at the
+    start of a long test. The waveform file is complete when its header is consistent with its size and the size
+    did not change for stable_polls polls. The file of the previous run stays on disk until the model writes the new
+    one, so mark_file() records it before the simulation is started and wait_file() only accepts a file written
+    after the mark. Both waits are reported in the log.
+    """
+    def __init__(self, ts, hil, min_poll=0.1, max_poll=5.0):
+        """
+        :param ts:          test script object, ts.sleep() is used to wait
+        :param hil:         hil object with get_time()
+        :param min_poll:    shortest time between two polls (s)
+        :param max_poll:    longest time between two polls (s)
+        """
+        self.ts = ts
+        self.hil = hil
+        self.min_poll = min_poll
+        self.max_poll = max_poll
+        self.clock = getattr(ts, 'clock', None) or SystemClock()
+        self.file_marks = {}
+
+    @staticmethod
+    def get_file_stat(filename):
+        """
+        :return: (modification time (ns), size in bytes) of the file, None if it does not exist
+        """
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def mark_file(self, filename):
+        """
+        Record the waveform file left by the previous run, call it before the simulation is started
+        :param filename:    waveform file written by the model, None does nothing
+        """
+        if filename:
+            self.file_marks[filename] = self.get_file_stat(filename)
+
+    def is_new_file(self, filename):
+        stat = self.get_file_stat(filename)
+        return stat is not None and stat != self.file_marks.get(filename)
+
+    def elapsed(self, start_ns):
+        return (self.clock.monotonic_ns() - start_ns) / 1e9
+
+    def wait_stop_time(self, stop_time, margin=0.1, stall_polls=3, callback=None):
+        """
+        :param stop_time:   simulation time to wait for (s)
+        :param margin:      the wait ends when the simulation time is within margin of stop_time (s)
+        :param stall_polls: the wait also ends when the simulation time did not change for this number of polls
+                            (the model stopped)
+        :param callback:    function called with the simulation time at each poll, it may return the simulation
+                            time of its next event so the poll is not later than it
+        :return: last simulation time
+        """
+        start = self.clock.monotonic_ns()
+        polls = 0
+        stalled = 0
+        sim_time = self.hil.get_time()
+        while stop_time - sim_time > margin:
+            next_event = callback(sim_time) if callback is not None else None
+            wait = min(max((stop_time - sim_time) / 2., self.min_poll), self.max_poll)
+            if next_event is not None and next_event > sim_time:
+                wait = min(wait, max(next_event - sim_time, self.min_poll))
+            self.ts.log_debug('Sim Time: %0.3f. Waiting another %0.3f sec, next poll in %0.3f sec.' %
+                              (sim_time, stop_time - sim_time, wait))
+            self.ts.sleep(wait)
+            polls += 1
+            last_time = sim_time
+            sim_time = self.hil.get_time()
+            stalled = stalled + 1 if sim_time == last_time else 0
+            if stalled >= stall_polls:
+                self.ts.log_warning('Simulation time stopped at %0.3f s before the stop time %0.3f s' %
+                                    (sim_time, stop_time))
+                break
+        if callback is not None:
+            callback(sim_time)
+        self.ts.log('Simulation reached %0.3f s (stop time %0.3f s) after %d polls in %0.1f s' %
+                    (sim_time, stop_time, polls, self.elapsed(start)))
+        return sim_time
+
+    def wait_file(self, filename, timeout=30., poll=0.2, stable_polls=3, fixed_wait=10.):
+        """
+        :param filename:        waveform file written by the model, None to wait fixed_wait instead
+        :param timeout:         longest wait for the file (s)
+        :param poll:            time between two checks of the file (s)
+        :param stable_polls:    number of checks with the same size for the file to be complete
+        :param fixed_wait:      wait when the file is not known (s)
+        :return: True if the file is complete and written after mark_file()
+        """
+        start = self.clock.monotonic_ns()
+        if not filename:
+            self.ts.log_warning('The waveform file is not known, waiting %0.1f seconds for the model to save the '
+                                'waveform data' % fixed_wait)
+            self.ts.sleep(fixed_wait)
+            return False
+        last_size = None
+        stable = 0
+        polls = 0
+        while self.elapsed(start) < timeout:
+            if self.is_new_file(filename):
+                size, complete = get_file_status(filename)
+            else:
+                # the file of the previous run is never complete
+                size, complete = None, False
+            stable = stable + 1 if size is not None and size == last_size else 0
+            last_size = size
+            if complete and stable >= stable_polls:
+                self.ts.log('Waveform file %s complete (%d bytes) after %0.1f s (%d polls)' %
+                            (filename, size, self.elapsed(start), polls))
+                return True
+            self.ts.sleep(poll)
+            polls += 1
+        self.ts.log_warning('Waveform file %s not complete after %0.1f s (size %s)' % (filename, timeout, last_size))
+        return False
+
+
+def get_waveform_file(daq, mat_file_name=None):
+    """
+    Waveform file saved by the model and read by daq.waveform_capture_dataset(): the MATLAB file in the waveform
+    directory of the Opal DAS driver.
+    :param daq:             das object
+    :param mat_file_name:   file name given to daq.waveform_config(), None for the one of the DAS
+    :return: file name, None when the DAS does not give its waveform directory
+    """
+    for source in (daq, getattr(daq, 'device', None)):
+        wfm_dir = getattr(source, 'wfm_dir', None)
+        name = mat_file_name or getattr(source, 'mat_file_name', None) or getattr(source, 'data_name', None)
+        if wfm_dir and name:
+            return os.path.join(wfm_dir, name)
+    return None
+
+
+matlab_shadow_cache = weakref.WeakKeyDictionary()
+
+
+def get_matlab_shadow(ts, hil):
+    """
+    Get the shadow of the MATLAB variables of a HIL object, shared by all the HilModel objects using it
+    :param ts:  test script object
+    :param hil: hil object
+    :return: MatlabVariableShadow object
+    """
+    try:
+        shadow = matlab_shadow_cache.get(hil)
+    except TypeError:
+        # HIL objects which cannot be weakly referenced are not shared
+        return MatlabVariableShadow(ts, hil)
+    if shadow is None:
+        shadow = MatlabVariableShadow(ts, hil)
+        matlab_shadow_cache[hil] = shadow
+    return shadow
+
+
+control_signals_cache = weakref.WeakKeyDictionary()
+
+
+def get_hil_control_signals(ts, hil, names=None):
+    """
+    Get the copy of the control signals of a HIL object, shared by all the functions of the script using it
+    :param ts:      test script object
+    :param hil:     hil object
+    :param names:   dict of the names of the signals and their index in the vector
+    :return: ControlSignals object
+    """
+    try:
+        control_signals = control_signals_cache.get(hil)
+    except TypeError:
+        # HIL objects which cannot be weakly referenced are not shared
+        return ControlSignals(ts, hil, names=names)
+    if control_signals is None:
+        control_signals = ControlSignals(ts, hil, names=names)
+        control_signals_cache[hil] = control_signals
+    elif names is not None:
+        control_signals.names = names
+    return control_signals
+
+
 class HilModel(object):
     def __init__(self, ts, support_interfaces):
         self.params = {}
@@ -1122,6 +2049,7 @@ class HilModel(object):
             self.hil = support_interfaces.get('hil')
         else:
             self.hil = None
+        self.matlab_variables = get_matlab_shadow(ts, self.hil)
         self.set_time_path()
         self.set_nominal_values()
         #self.set_input_scale_offset()
@@ -1134,7 +2062,22 @@ class HilModel(object):
         parameters = []
         parameters.append((f"VNOM", 1.0))
         parameters.append((f"FNOM", self.f_nom))
-        self.hil.set_matlab_variables(parameters)
+        self.set_matlab_variables(parameters)
+
+    def set_matlab_variables(self, parameters):
+        """
+        Send the MATLAB variables which changed since they were last sent to the HIL model
+        :param parameters:  list of (name, value)
+        """
+        self.matlab_variables.push(parameters)
+
+    def load_model_on_hil(self):
+        """
+        Load (and compile, depending on the HIL driver parameters) the model on the HIL. The loaded model may not
+        hold the variables sent before, so the shadow is reset and the next pushes send every variable.
+        """
+        self.hil.load_model_on_hil()
+        self.matlab_variables.reset()
 
     def set_time_path(self):
         """
@@ -1148,10 +2091,11 @@ class HilModel(object):
         """
         # .replace(" ", "") removes the space 
         # .split(",") split with the comma
-        scale_current = self.ts.param_value('eut.scale_current').replace(" ", "").split(",")
-        offset_current = self.ts.param_value('eut.offset_current').replace(" ", "").split(",")
-        scale_voltage = self.ts.param_value('eut.scale_voltage').replace(" ", "").split(",")
-        offset_voltage = self.ts.param_value('eut.offset_voltage').replace(" ", "").split(",")
+        eut_params = get_eut_params(self.ts)
+        scale_current = eut_params.scale_current.replace(" ", "").split(",")
+        offset_current = eut_params.offset_current.replace(" ", "").split(",")
+        scale_voltage = eut_params.scale_voltage.replace(" ", "").split(",")
+        offset_voltage = eut_params.offset_voltage.replace(" ", "").split(",")
 
         if self.phases == "Single Phase":
             phases = ["A"]
@@ -1169,7 +2113,7 @@ class HilModel(object):
             parameters.append((f"CURRENT_INPUT_OFFSET_PH{ph}", float(offset_current[i])))
             i = i + 1
 
-        self.hil.set_matlab_variables(parameters)
+        self.set_matlab_variables(parameters)
 
     """
     Getter functions
@@ -1463,6 +2407,8 @@ class FrequencyWatt(EutParameters, UtilParameters):
         p_small = self.ts.param_value('eut_fw.p_small')
         if p_small is None:
             p_small = 0.05
+        # P'min used as the minimum active power when the EUT absorbs power (see reset_absorb())
+        p_min_prime = self.ts.param_value('eut_fw.p_min_prime')
 
         self.param[FW] = {}
         if self.ts.param_value('fw.test_1_tr') is None:
@@ -1474,7 +2420,8 @@ class FrequencyWatt(EutParameters, UtilParameters):
             'dbf': 0.036,
             'kof': 0.05,
             'TR': tr_1,
-            'f_small': p_small * self.f_nom * 0.05
+            'f_small': p_small * self.f_nom * 0.05,
+            'p_min_prime': p_min_prime
         }
         if self.ts.param_value('fw.test_2_tr') is None:
             # Based on table 35 and category III
@@ -1485,7 +2432,8 @@ class FrequencyWatt(EutParameters, UtilParameters):
             'dbf': 0.017,
             'kof': 0.03,
             'TR': tr_2,
-            'f_small': p_small * self.f_nom * 0.02
+            'f_small': p_small * self.f_nom * 0.02,
+            'p_min_prime': p_min_prime
         }
 
     def create_fw_dict_steps(self, mode):
@@ -1839,9 +2787,876 @@ class ActiveFunction(DataLogging, CriteriaValidation, ImbalanceComponent, VoltWa
         ImbalanceComponent.__init__(self)
 
 
-class NormalOperation(HilModel, EutParameters, DataLogging):
-    def __init__(self, ts, support_interfaces):
-        EutParameters.__init__(self, ts)
+"""
+This section is for the compiled step plans
+"""
+
+
+class StepPlan(object):
+    """
+    Test campaign (curves x power levels x v_ref/modes) compiled before the run into arrays of step labels, stimulus
+    values, nominal targets and the function used for the min/max bounds of each step. During the run, the target
+    of a step is an array lookup by dataset filename and step label (see CriteriaValidation.set_step_plan()).
+
+    The dataset filenames are the ones of the compliance scripts, e.g. VV_1_PWR_100_vref_100.
+    """
+    key_columns = ['FILENAME', 'STEP', 'CURVE', 'PWR', 'VREF', 'MODE']
+
+    def __init__(self, function, columns):
+        self.function = function
+        self.columns = columns
+        self.index = {(filename, step): i for i, (filename, step) in
+                      enumerate(zip(self.columns['FILENAME'], self.columns['STEP']))}
+
+    def __len__(self):
+        return len(self.columns['STEP'])
+
+    @classmethod
+    def compile(cls, active_function, function, curves=(1,), pwrs=(1.0,), v_refs=(1.0,), modes=(None,),
+                absorb=(False,)):
+        """
+        Compile the steps of a test campaign
+        :param active_function: ActiveFunction object configured for the test script
+        :param function:        VV, VW, FW, WV or PRI
+        :param curves:          characteristic curves
+        :param pwrs:            power levels in p.u.
+        :param v_refs:          reference voltages in p.u. (VV)
+        :param modes:           'Above'/'Below' for FW, the reactive power functions for PRI
+        :param absorb:          absorb power settings (FW)
+        :return: StepPlan object
+        """
+        af = active_function
+        curve, pwr, absorb_state, step_dict = af.curve, af.pwr, af.absorb_power, getattr(af, 'step_dict', None)
+        rows = []
+        try:
+            for p_curve, p_pwr, v_ref, mode, absorb_power in \
+                    [(c, p, v, m, a) for a in absorb for c in curves for p in pwrs for v in v_refs for m in modes]:
+                af.reset_curve(p_curve)
+                af.reset_pwr(p_pwr)
+                af.reset_absorb(absorb_power)
+                filename = cls.get_filename(function, p_curve, p_pwr, v_ref, mode, absorb_power)
+                y_criteria = dict(af.y_criteria)
+                if function == PRI:
+                    y_criteria['Q'] = mode
+
+                for step, af.step_dict in cls.create_steps(af, function, v_ref, mode):
+                    row = {'FILENAME': filename, 'STEP': step, 'CURVE': p_curve, 'PWR': p_pwr,
+                           'VREF': v_ref if function == VV else np.nan, 'MODE': mode}
+                    for key, value in af.step_dict.items():
+                        row[key] = value
+                    for y, y_function in y_criteria.items():
+                        target = af.update_target_value(function=y_function)
+                        row['%s_FUNCTION' % y] = y_function
+                        row['%s_TARGET' % y] = np.nan if target is None else target
+                    rows.append(row)
+        finally:
+            af.reset_curve(curve)
+            af.reset_pwr(pwr)
+            af.reset_absorb(absorb_state)
+            af.step_dict = step_dict
+
+        names = list(cls.key_columns)
+        for row in rows:
+            names += [name for name in row if name not in names]
+        columns = OrderedDict()
+        for name in names:
+            values = [row.get(name, np.nan) for row in rows]
+            if name in ['FILENAME', 'STEP', 'MODE'] or name.endswith('_FUNCTION'):
+                columns[name] = np.array(values, dtype=object)
+            else:
+                columns[name] = np.array(values, dtype=float)
+        return cls(function, columns)
+
+    @staticmethod
+    def create_steps(af, function, v_ref=1.0, mode=None):
+        """
+        List the (step label, step_dict) of a test with the same steps and labels as the compliance scripts
+        """
+        if function == VV:
+            return [(step, {'V': v}) for step, v in af.create_vv_dict_steps(v_ref=v_ref).items()]
+        elif function == VW:
+            return [(step, {'V': v}) for step, v in af.create_vw_dict_steps().items()]
+        elif function == FW:
+            return [(step, {'F': f}) for step, f in af.create_fw_dict_steps(mode=mode).items()]
+        elif function == WV:
+            return [(step, {'V': af.v_nom, 'P': p}) for step, p in af.create_wv_dict_steps().items()]
+        elif function == PRI:
+            return [('Step_%i_%s' % (i + 1, mode), step_dict)
+                    for i, step_dict in enumerate(af.create_pri_dict_steps(function=mode))]
+        raise p1547Error('Step plan is not supported for %s' % function)
+
+    @staticmethod
+    def get_filename(function, curve, pwr, v_ref=1.0, mode=None, absorb=False):
+        if function == VV:
+            return 'VV_%s_PWR_%d_vref_%d' % (curve, pwr * 100, v_ref * 100)
+        elif function == VW:
+            return 'VW_{0}_PWR_{1}'.format(curve, pwr)
+        elif function == FW:
+            if absorb:
+                return 'FW_{0}_PWR_{1}_{2}_ABSORB'.format(curve, pwr, mode)
+            return 'FW_{0}_PWR_{1}_{2}'.format(curve, pwr, mode)
+        elif function == WV:
+            return 'WV_%s_PWR_%d' % (curve, pwr * 100)
+        elif function == PRI:
+            return 'PRI_{}'.format(mode)
+        raise p1547Error('Step plan is not supported for %s' % function)
+
+    """
+    Getter functions
+    """
+
+    def get_index(self, filename, step):
+        """
+        :return: position of the step in the plan or None if the step isn't part of the plan
+        """
+        return self.index.get((filename, step))
+
+    def get_target(self, index, y):
+        target = self.columns['%s_TARGET' % y][index]
+        return None if np.isnan(target) else float(target)
+
+    def get_function(self, index, y):
+        return self.columns['%s_FUNCTION' % y][index]
+
+    def get_steps(self, filename):
+        """
+        :return: OrderedDict {step label: step_dict} of a dataset
+        """
+        stimuli = [name for name in self.columns if name not in self.key_columns and
+                   not name.endswith(('_FUNCTION', '_TARGET'))]
+        steps = collections.OrderedDict()
+        for i in np.flatnonzero(self.columns['FILENAME'] == filename):
+            steps[self.columns['STEP'][i]] = {key: float(self.columns[key][i]) for key in stimuli
+                                              if not np.isnan(self.columns[key][i])}
+        return steps
+
+    """
+    Inspection
+    """
+
+    def to_dataframe(self):
+        return pd.DataFrame(self.columns)
+
+    def save(self, filename):
+        self.to_dataframe().to_csv(filename, index=False)
+
+    @classmethod
+    def load(cls, filename, function=None):
+        dataset = pd.read_csv(filename, keep_default_na=False, na_values=[''])
+        columns = OrderedDict()
+        for name in dataset.columns:
+            if name in ['FILENAME', 'STEP', 'MODE'] or name.endswith('_FUNCTION'):
+                columns[name] = dataset[name].astype(object).where(dataset[name].notna(), None).to_numpy()
+            else:
+                columns[name] = dataset[name].to_numpy(dtype=float)
+        return cls(function, columns)
+
+    def diff(self, other, decimals=3):
+        """
+        Compare two plans, e.g. before and after a change of the curve parameters
+        :param other:       StepPlan to compare with
+        :param decimals:    number of decimals used to compare the values
+        :return: pandas DataFrame with the steps that are added, removed or changed (columns suffixed by _SELF and
+                 _OTHER)
+        """
+        keys = ['FILENAME', 'STEP']
+        merged = self.to_dataframe().merge(other.to_dataframe(), on=keys, how='outer', suffixes=('_SELF', '_OTHER'),
+                                           indicator=True)
+        changed = merged['_merge'] != 'both'
+        for name in self.columns:
+            if name in keys or '%s_OTHER' % name not in merged.columns:
+                continue
+            a, b = merged['%s_SELF' % name], merged['%s_OTHER' % name]
+            if pd.api.types.is_numeric_dtype(a) and pd.api.types.is_numeric_dtype(b):
+                changed |= ~np.isclose(a.round(decimals), b.round(decimals), equal_nan=True)
+            else:
+                changed |= (a.astype(object).where(a.notna(), '').astype(str) !=
+                            b.astype(object).where(b.notna(), '').astype(str))
+        return merged[changed].drop(columns='_merge')
+
+
+"""
+This section is for the offline re-grading of recorded datasets
+"""
+
+# ActiveFunction configuration used by each compliance script. The pattern recovers the curve, power level and
+# options encoded in the dataset filename (e.g. VV_1_PWR_100_vref_100). Scripts without a pattern (CPF and CRP
+# use free-form names) accept every dataset of the test directory.
+REPLAY_SCRIPTS = {
+    VV: {'script_name': 'Volt-Var',
+         'functions': [VV],
+         'criteria_mode': [True, True, True],
+         'pattern': r'^VV_(?P<curve>\d+)_PWR_(?P<pwr_pct>\d+)_vref_(?P<vref_pct>\d+)$'},
+    VW: {'script_name': 'Volt-Watt',
+         'functions': [VW],
+         'criteria_mode': [True, True, True],
+         'pattern': r'^VW_(?P<curve>\d+)_PWR_(?P<pwr>[\d.]+)$'},
+    FW: {'script_name': 'Frequency-Watt',
+         'functions': [FW],
+         'criteria_mode': [True, True, True],
+         'pattern': r'^FW_(?P<curve>\d+)_PWR_(?P<pwr>[\d.]+)_(?P<mode>Above|Below)(?P<absorb>_ABSORB)?$'},
+    WV: {'script_name': 'Watt-Var',
+         'functions': [WV],
+         'criteria_mode': [True, True, True],
+         'pattern': r'^WV_(?P<curve>\d+)_PWR_(?P<pwr_pct>\d+)$'},
+    CPF: {'script_name': 'Constant Power Factor',
+          'functions': [CPF],
+          'criteria_mode': [True, True, True],
+          'pattern': None},
+    CRP: {'script_name': 'Constant Reactive Power',
+          'functions': [CRP],
+          'criteria_mode': [True, False, False],
+          'pattern': None},
+    LAP: {'script_name': 'Limit Active Power',
+          'functions': [LAP, FW, VW],
+          'criteria_mode': [True, True, True],
+          'pattern': r'^LAP_(?P<pwr>[\d.]+)_(?P<iter>\d+)$',
+          # Scripts/LAP.py changes the Y criteria at each step with y_criterias_mod
+          'step_criterias': {'Step C': {'P': LAP}, 'Step D': {'P': FW}, 'Step E': {'P': FW}, 'Step F': {'P': VW}},
+          # The stepped value is appended to the step label (e.g. Step D_59.0)
+          'step_stimuli': {'Step D': 'F', 'Step E': 'F', 'Step F': 'V'}},
+    PRI: {'script_name': 'Prioritization',
+          'functions': [PRI, VW, FW, VV, CPF, CRP, WV],
+          'criteria_mode': [False, False, True],
+          'pattern': r'^PRI_(?P<mode>[A-Z]+)$'},
+}
+
+REPLAY_EXCLUDED_SUFFIXES = ('_RMS.csv', '_WAV.csv', '_startwave.csv', '_endwave.csv')
+
+
+class OfflineScript(object):
+    """
+    Minimal stand-in for the SVP test script object (ts) so the library can be used outside of the SVP, e.g. to
+    re-grade recorded datasets. The parameters are read from a .tst test configuration file.
+    """
+
+    def __init__(self, params=None, name=None, script=None, verbose=False):
+        self.params = params if params is not None else {}
+        self.name = name
+        self.script = script
+        self.verbose = verbose
+
+    @classmethod
+    def from_config(cls, filename, verbose=False):
+        """
+        Create the offline script from a test configuration file (e.g. Tests/VV/VV_1.tst)
+        :param filename:    path of the .tst file
+        :param verbose:     pass the log messages to the logging module (errors are always passed)
+        :return: OfflineScript object
+        """
+        root = ET.parse(filename).getroot()
+        params = {}
+        for param in root.iter('param'):
+            params[param.get('name')] = cls.convert_param(param.get('type'), param.text)
+        return cls(params=params, name=root.get('name'), script=root.get('script'), verbose=verbose)
+
+    @staticmethod
+    def convert_param(param_type, value):
+        if value is None:
+            return None
+        if param_type == 'float':
+            return float(value)
+        elif param_type == 'int':
+            return int(value)
+        return value
+
+    def param_value(self, name):
+        return self.params.get(name)
+
+    def config_name(self):
+        return self.name
+
+    def log(self, msg):
+        if self.verbose:
+            logger.info(msg)
+
+    def log_debug(self, msg):
+        if self.verbose:
+            logger.debug(msg)
+
+    def log_warning(self, msg):
+        if self.verbose:
+            logger.warning(msg)
+
+    def log_error(self, msg):
+        logger.error(msg)
+
+    def sleep(self, seconds):
+        # Nothing to wait for when working on recorded data
+        pass
+
+
+class DatasetReplay(ActiveFunction):
+    """
+    Re-grade the datasets recorded by the compliance scripts without the test equipment.
+
+    Every step of a dataset is located with the EVENT soft channel: the initial sample is tagged with the step label
+    by start() and the Tr samples with '<step label>_TR_<n>' by record_timeresponse(). The targets, the min/max bounds
+    and the pass/fail verdicts of all the steps are then computed at once with numpy arrays. Unlike the live run, the
+    bounds and measured values are taken from the DAQ channels of each Tr sample.
+    """
+
+    def __init__(self, ts, script, mra=None):
+        if script not in REPLAY_SCRIPTS:
+            raise p1547Error('Replay is not supported for %s tests' % script)
+        self.script = script
+        self.replay_config = REPLAY_SCRIPTS[script]
+        ActiveFunction.__init__(self, ts=ts,
+                                script_name=self.replay_config['script_name'],
+                                functions=self.replay_config['functions'],
+                                criteria_mode=self.replay_config['criteria_mode'])
+        # MRA settings can be changed to re-grade with other accuracies
+        if mra is not None:
+            self.MRA.update(mra)
+        self.reference_criteria = dict(self.y_criteria)
+
+    @classmethod
+    def from_config(cls, config_file, mra=None, verbose=False):
+        """
+        Create the replay object from the test configuration file used for the run
+        :param config_file: path of the .tst file (e.g. Tests/VV/VV_1.tst)
+        :param mra:         dictionary to override the minimum required accuracies
+        :param verbose:     print the log messages
+        :return: DatasetReplay object
+        """
+        ts = OfflineScript.from_config(config_file, verbose=verbose)
+        return cls(ts=ts, script=ts.script, mra=mra)
+
+    """
+    Dataset loading
+    """
+
+    def get_dataset_context(self, name):
+        """
+        Recover the curve, power level and options from a dataset name
+        :param name: dataset filename without extension
+        :return: dictionary with the context or None if the name doesn't match this test
+        """
+        pattern = self.replay_config['pattern']
+        if pattern is None:
+            return {'curve': 1, 'pwr': 1.0}
+        match = re.match(pattern, name)
+        if match is None:
+            return None
+        groups = match.groupdict()
+        context = {'curve': int(groups.get('curve') or 1), 'pwr': 1.0}
+        if groups.get('pwr_pct') is not None:
+            context['pwr'] = int(groups['pwr_pct']) / 100.
+        elif groups.get('pwr') is not None:
+            context['pwr'] = float(groups['pwr'])
+        if groups.get('vref_pct') is not None:
+            context['vref'] = int(groups['vref_pct']) / 100.
+        if groups.get('mode') is not None:
+            context['mode'] = groups['mode']
+        context['absorb'] = groups.get('absorb') is not None
+        return context
+
+    def load_dataset(self, filename):
+        dataset = pd.read_csv(filename)
+        dataset.columns = [str(col).strip() for col in dataset.columns]
+        if 'EVENT' not in dataset.columns or 'TIME' not in dataset.columns:
+            raise p1547Error('Dataset %s has no EVENT or TIME column' % filename)
+        return dataset
+
+    def load_result_summary(self, filename):
+        """
+        Load a result_summary.csv file. The scripts append a header at each run, so repeated headers are removed.
+        :param filename: path of the result summary
+        :return: pandas DataFrame with string values
+        """
+        summary = pd.read_csv(filename, dtype=str, skipinitialspace=True, index_col=False)
+        summary.columns = [str(col).strip() for col in summary.columns]
+        if 'STEP' in summary.columns:
+            summary = summary[summary['STEP'] != 'STEP']
+        return summary
+
+    def get_step_segments(self, dataset):
+        """
+        Locate the initial and Tr samples of every step with the EVENT column.
+
+        The datasets recorded before the EVENT labels were set ahead of the samples have the bare step labels in the
+        lowercase 'event' column only, and each Tr label is written after its sample: the first row of
+        '<step label>_TR_<n>' is the sample following Tr n. The Tr positions of these datasets are moved one row back.
+        :param dataset: pandas DataFrame of the dataset
+        :return: step labels, initial row positions (n_steps) and Tr row positions (n_steps, n_iter) where missing
+                 samples are -1
+        """
+        events = dataset['EVENT'].astype(str).str.strip().reset_index(drop=True)
+        tr_events = events.str.extract(r'^(?P<step>.+)_TR_(?P<iter>\d+)$').dropna()
+        tr_events = tr_events[~tr_events.duplicated()]  # first row of each Tr
+        if tr_events.empty:
+            raise p1547Error('No time response sample found in dataset')
+
+        labels = list(pd.unique(tr_events['step']))
+        step_events = events
+        tr_rows = tr_events.index.to_numpy()
+        if not events.isin(labels).any():
+            if 'event' in dataset.columns:
+                step_events = dataset['event'].astype(str).str.strip().reset_index(drop=True)
+            if (tr_rows < 1).any():
+                raise p1547Error('Time response sample without a preceding row in a dataset of the former EVENT '
+                                 'layout')
+            self.ts.log_debug('Dataset of the former EVENT layout, the Tr samples are the rows before their labels')
+            tr_rows = tr_rows - 1
+
+        step_pos = {label: i for i, label in enumerate(labels)}
+        iters = tr_events['iter'].astype(int).to_numpy()
+        steps = tr_events['step'].map(step_pos).to_numpy()
+        tr_index = np.full((len(labels), iters.max()), -1, dtype=int)
+        tr_index[steps, iters - 1] = tr_rows
+
+        # The initial sample is the first row tagged with the bare step label, otherwise the row preceding Tr 1
+        first_rows = step_events.drop_duplicates()
+        first_rows = dict(zip(first_rows.to_numpy(), first_rows.index.to_numpy()))
+        first_tr = np.where(tr_index[:, 0] >= 0, tr_index[:, 0], tr_index.max(axis=1))
+        initial_index = np.array([first_rows.get(label, -1) for label in labels], dtype=int)
+        initial_index = np.where((initial_index >= 0) & (initial_index < first_tr), initial_index,
+                                 np.maximum(first_tr - 1, 0))
+        return labels, initial_index, tr_index
+
+    def get_step_stimuli(self, name, labels, context, summary=None, step_dicts=None):
+        """
+        Get the stimulus (step_dict values) applied at each step
+        :param name:        dataset name
+        :param labels:      step labels found in the dataset
+        :param context:     dataset context from get_dataset_context()
+        :param summary:     previous result summary DataFrame, X and Y targets are read from it
+        :param step_dicts:  dictionary {step label: step_dict} which has the priority over the other sources
+        :return: dictionary {key: numpy array (n_steps)} with nan when the value is unknown
+        """
+        stimuli = {}
+
+        def set_value(key, i, value):
+            if value is None:
+                return
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                return
+            if key not in stimuli:
+                stimuli[key] = np.full(len(labels), np.nan)
+            if np.isnan(stimuli[key][i]):
+                stimuli[key][i] = value
+
+        if step_dicts is not None:
+            for i, label in enumerate(labels):
+                for key, value in step_dicts.get(label, {}).items():
+                    set_value(key, i, value)
+
+        if summary is not None and 'FILENAME' in summary.columns:
+            rows = summary[summary['FILENAME'].str.strip() == name]
+            rows = dict(zip(rows['STEP'].str.strip(), rows.to_dict('records')))
+            for i, label in enumerate(labels):
+                row = rows.get(label)
+                if row is None:
+                    continue
+                for x in self.x_criteria:
+                    set_value(x, i, row.get('%s_TARGET' % x))
+                for y in self.y_criteria:
+                    set_value('%s_RECORDED' % y, i, row.get('%s_TARGET' % y))
+
+        generated = self.create_replay_dict_steps(context)
+        for i, label in enumerate(labels):
+            for key, value in generated.get(label, {}).items():
+                set_value(key, i, value)
+            # Active power limit of LAP is the power level of the dataset
+            if self.script == LAP:
+                step, _, step_value = label.partition('_')
+                stepped = self.replay_config['step_stimuli'].get(step)
+                if stepped is not None:
+                    set_value(stepped, i, step_value)
+                set_value('V', i, self.v_nom)
+                set_value('F', i, self.f_nom)
+                set_value('P', i, context['pwr'])
+
+        return stimuli
+
+    def create_replay_dict_steps(self, context):
+        """
+        Regenerate the steps of the tests for which they only depend on the curve parameters
+        :param context: dataset context from get_dataset_context()
+        :return: dictionary {step label: step_dict}
+        """
+        if self.script == VV:
+            v_steps_dict = self.create_vv_dict_steps(v_ref=context.get('vref', 1.0))
+            return {step: {'V': v_step} for step, v_step in v_steps_dict.items()}
+        elif self.script == VW:
+            v_steps_dict = self.create_vw_dict_steps()
+            return {step: {'V': v_step} for step, v_step in v_steps_dict.items()}
+        elif self.script == FW and 'mode' in context:
+            f_steps_dict = self.create_fw_dict_steps(mode=context['mode'])
+            return {step: {'F': f_step} for step, f_step in f_steps_dict.items()}
+        elif self.script == WV:
+            p_steps_dict = self.create_wv_dict_steps()
+            return {step: {'V': self.v_nom, 'P': p_step} for step, p_step in p_steps_dict.items()}
+        return {}
+
+    def get_step_criterias(self, labels, context):
+        """
+        Get the Y criteria function of each step
+        :return: dictionary {y: numpy array of function names (n_steps)}
+        """
+        criterias = {y: np.array([function] * len(labels), dtype=object)
+                     for y, function in self.reference_criteria.items()}
+        if self.script == PRI and 'mode' in context:
+            criterias['Q'][:] = context['mode']
+        step_criterias = self.replay_config.get('step_criterias', {})
+        for i, label in enumerate(labels):
+            for y, function in step_criterias.get(label.split('_')[0], {}).items():
+                criterias[y][i] = function
+        return criterias
+
+    """
+    Vectorized criteria
+    """
+
+    def calculate_target_array(self, function, stimuli, recorded=None):
+        """
+        Vectorized counterpart of update_target_value()
+        :param function:    function name (VV, VW, etc.)
+        :param stimuli:     dictionary of numpy arrays with the V, F, P, Q or PF values
+        :param recorded:    numpy array of the targets recorded during the live run
+        :return: numpy array of targets
+        """
+        if function in [VV, VW, WV, FW]:
+            characteristic = self.get_characteristic(function)
+            return characteristic.evaluate_array(stimuli[characteristic.x])
+
+        elif function == CPF and 'PF' in stimuli and 'P' in stimuli:
+            return np.sqrt(np.power(stimuli['P'], 2) * ((1 / np.power(stimuli['PF'], 2)) - 1))
+
+        elif function == CRP and 'Q' in stimuli:
+            return np.round(stimuli['Q'], 1)
+
+        elif function == LAP:
+            return (stimuli['P'] * self.p_rated) + self.MRA['P']
+
+        # Targets which can't be recalculated from the stimulus (e.g. PF of CPF tests) are taken from the live run
+        if recorded is None:
+            raise p1547Error('Target of %s can not be calculated without a recorded target' % function)
+        return recorded
+
+    @staticmethod
+    def get_step_x_array(x, meas, stimuli=None):
+        """
+        Vectorized counterpart of get_step_x(): the commanded X of the steps where the stimulus is known, else the
+        measured X
+        :return: array (n_steps, n_iter)
+        """
+        if stimuli is None or x not in stimuli:
+            return meas[x]
+        commanded = np.asarray(stimuli[x], dtype=float)[:, np.newaxis]
+        return np.where(np.isnan(commanded), meas[x], commanded)
+
+    def calculate_min_max_arrays(self, function, meas, target, stimuli=None):
+        """
+        Vectorized counterpart of calculate_min_max_values()
+        :param function:    function name (VV, VW, etc.)
+        :param meas:        dictionary of measured numpy arrays (n_steps, n_iter)
+        :param target:      numpy array of targets (n_steps)
+        :param stimuli:     dictionary of numpy arrays of the commanded V, F or P of the steps (n_steps)
+        :return: target_min and target_max arrays (n_steps, n_iter)
+        """
+        target = np.asarray(target, dtype=float)[:, np.newaxis]
+        if function in [VV, VW, WV, FW]:
+            characteristic = self.get_characteristic(function)
+            target_min, target_max = characteristic.bounds(self.get_step_x_array(characteristic.x, meas, stimuli))
+
+        elif function == PRI:
+            v_step = self.get_step_x_array('V', meas, stimuli)
+            f_step = self.get_step_x_array('F', meas, stimuli)
+            target_min_vw, target_max_vw = self.get_characteristic(VW).bounds(v_step)
+            target_min_fw, target_max_fw = self.get_characteristic(FW).bounds(f_step)
+            vw_wider = (target_max_vw - target_min_vw) > (target_max_fw - target_min_fw)
+            target_min = np.where(vw_wider, target_min_vw, target_min_fw)
+            target_max = np.where(vw_wider, target_max_vw, target_max_fw)
+
+        elif function == CPF:
+            target_min = np.broadcast_to(target - 1.5 * self.MRA['Q'], meas['V'].shape)
+            target_max = np.broadcast_to(target + 1.5 * self.MRA['Q'], meas['V'].shape)
+
+        elif function == CRP:
+            target_min = np.broadcast_to(target - self.MRA['Q'], meas['V'].shape)
+            target_max = np.broadcast_to(target + self.MRA['Q'], meas['V'].shape)
+
+        elif function == LAP:
+            target_min = np.broadcast_to(target - self.MRA['P'] * 1.5, meas['V'].shape)
+            target_max = np.broadcast_to(target + self.MRA['P'] * 1.5, meas['V'].shape)
+
+        else:
+            raise p1547Error('Min/max bounds of %s are not supported' % function)
+
+        return target_min, target_max
+
+    def open_loop_resp_arrays(self, y_start, y_ss, y_meas, duration, mra_y, tr=1):
+        """
+        Vectorized counterpart of open_loop_resp_criteria()
+        :return: numpy array of booleans (pass)
+        """
+        if self.script_name == CRP:  # for those tests with a flat 90% evaluation
+            y_start = np.zeros_like(y_ss)
+            mra_t = np.zeros_like(duration)
+        else:
+            mra_t = self.MRA['T'] * duration
+        y_target = self.calculate_open_loop_value(y0=y_start, y_ss=y_ss, duration=duration, tr=tr)
+        increasing = y_start <= y_target
+        y_low = self.calculate_open_loop_value(y0=y_start, y_ss=y_ss, duration=duration - 1.5 * mra_t, tr=tr)
+        y_high = self.calculate_open_loop_value(y0=y_start, y_ss=y_ss, duration=duration + 1.5 * mra_t, tr=tr)
+        y_min = np.where(increasing, y_low, y_high) - 1.5 * mra_y
+        y_max = np.where(increasing, y_high, y_low) + 1.5 * mra_y
+
+        if self.script_name == CRP:  # 1-sided analysis
+            return np.where(increasing, y_min <= y_meas, y_meas <= y_max)
+        return (y_min <= y_meas) & (y_meas <= y_max)
+
+    """
+    Re-grading
+    """
+
+    def replay_dataset(self, filename, summary=None, step_dicts=None):
+        """
+        Re-grade every step of a recorded dataset
+        :param filename:    path of the dataset (e.g. VV_1_PWR_100_vref_100.csv)
+        :param summary:     previous result summary DataFrame used to recover the stimulus of each step
+        :param step_dicts:  dictionary {step label: step_dict} to provide the stimulus of each step
+        :return: pandas DataFrame with the result_summary.csv columns
+        """
+        name = os.path.splitext(os.path.basename(filename))[0]
+        context = self.get_dataset_context(name)
+        if context is None:
+            raise p1547Error('%s is not a %s dataset' % (name, self.script))
+        self.reset_curve(context['curve'])
+        self.reset_pwr(context['pwr'])
+        self.reset_absorb(context.get('absorb', False))
+        self.reset_filename(name)
+
+        dataset = self.load_dataset(filename)
+        labels, initial_index, tr_index = self.get_step_segments(dataset)
+        stimuli = self.get_step_stimuli(name, labels, context, summary=summary, step_dicts=step_dicts)
+        criterias = self.get_step_criterias(labels, context)
+        valid = tr_index >= 0
+        rows = np.where(valid, tr_index, 0)
+        n_samples = valid.sum(axis=1)
+        # Same iteration convention as record_timeresponse(): first Tr is 1 and the last sample is not evaluated
+        last_col = np.maximum(n_samples - 1, 1) - 1
+        step_range = np.arange(len(labels))
+
+        measurements = {}
+        initial = {}
+        meas = {}
+        for meas_value in list(self.meas_values) + ['V', 'F', 'P']:
+            if meas_value in measurements:
+                continue
+            try:
+                measurements[meas_value] = self.get_measurement_array(dataset, meas_value)
+            except (p1547Error, KeyError, ValueError):
+                if meas_value in self.meas_values:
+                    raise
+                continue
+            initial[meas_value] = measurements[meas_value][initial_index]
+            meas[meas_value] = np.where(valid, measurements[meas_value][rows], np.nan)
+
+        time_values = dataset['TIME'].to_numpy(dtype=float)
+        duration = np.where(valid[:, 0], time_values[rows[:, 0]], np.nan) - time_values[initial_index]
+
+        targets = {}
+        bounds = {}
+        for y in self.y_criteria:
+            targets[y] = np.full(len(labels), np.nan)
+            bounds[y] = (np.full(valid.shape, np.nan), np.full(valid.shape, np.nan))
+            for function in pd.unique(criterias[y]):
+                mask = criterias[y] == function
+                step_meas = {key: value[mask] for key, value in meas.items()}
+                step_stimuli = {key: value[mask] for key, value in stimuli.items()}
+                recorded = stimuli.get('%s_RECORDED' % y)
+                targets[y][mask] = self.calculate_target_array(function, step_stimuli,
+                                                               recorded=None if recorded is None else recorded[mask])
+                target_min, target_max = self.calculate_min_max_arrays(function, step_meas, targets[y][mask],
+                                                                        stimuli=step_stimuli)
+                bounds[y][0][mask] = target_min
+                bounds[y][1][mask] = target_max
+
+        verdicts = {}
+        if self.criteria_mode[0]:
+            y = list(self.y_criteria.keys())[0]
+            verdicts['TR_90'] = self.open_loop_resp_arrays(y_start=initial[y], y_ss=targets[y], y_meas=meas[y][:, 0],
+                                                           duration=duration, mra_y=self.MRA[y])
+        for y in self.y_criteria:
+            within = (bounds[y][0] <= meas[y]) & (meas[y] <= bounds[y][1])
+            verdicts['%s_FIRST' % y] = within[:, 0]
+            verdicts['%s_LAST' % y] = within[step_range, last_col]
+
+        # Same columns as set_result_summary_name() and write_rslt_sum()
+        ys = list(self.y_criteria.keys())
+        columns = []
+        if self.criteria_mode[0]:
+            columns.append(self._format_verdicts(verdicts['TR_90']))
+        if self.criteria_mode[1]:
+            columns.append(self._format_verdicts(verdicts['%s_FIRST' % ys[-1]]))
+        if self.criteria_mode[2]:
+            columns.append(self._format_verdicts(verdicts['%s_LAST' % ys[-1]]))
+        for meas_value in self.meas_values:
+            columns.append(self._format_values(meas[meas_value][step_range, last_col]))
+            if meas_value in self.x_criteria:
+                columns.append(self._format_values(stimuli.get(meas_value, np.full(len(labels), np.nan))))
+            if meas_value in ys:
+                columns.append(self._format_values(targets[meas_value]))
+                columns.append(self._format_values(bounds[meas_value][0][step_range, last_col]))
+                columns.append(self._format_values(bounds[meas_value][1][step_range, last_col]))
+        columns.append(labels)
+        columns.append([str(self.filename)] * len(labels))
+
+        return pd.DataFrame(list(zip(*columns)), columns=self.get_rslt_sum_col_name().rstrip('\n').split(','))
+
+    def regrade_directory(self, path, output_dir=None):
+        """
+        Re-grade every dataset of a test result directory and write its result_summary.csv
+        :param path:        test result directory
+        :param output_dir:  directory where result_summary.csv is written. When None, the original summary is
+                            replaced and kept as result_summary.csv.bak
+        :return: pandas DataFrame with all the rows of the result summary
+        """
+        summary_filename = os.path.join(path, 'result_summary.csv')
+        summary = None
+        if os.path.isfile(summary_filename):
+            summary = self.load_result_summary(summary_filename)
+
+        frames = []
+        for filename in sorted(os.listdir(path)):
+            name, ext = os.path.splitext(filename)
+            if ext != '.csv' or name.startswith(('result_summary', 'step_plan')) or \
+                    filename.endswith(REPLAY_EXCLUDED_SUFFIXES):
+                continue
+            if self.get_dataset_context(name) is None:
+                continue
+            try:
+                frames.append(self.replay_dataset(os.path.join(path, filename), summary=summary))
+            except p1547Error as e:
+                self.ts.log_error('Dataset %s not re-graded: %s' % (filename, e))
+
+        if frames:
+            result = pd.concat(frames, ignore_index=True)
+        else:
+            result = pd.DataFrame(columns=self.get_rslt_sum_col_name().rstrip('\n').split(','))
+
+        if output_dir is None:
+            output_dir = path
+            if summary is not None and not os.path.isfile(summary_filename + '.bak'):
+                os.replace(summary_filename, summary_filename + '.bak')
+        self.write_result_summary(os.path.join(output_dir, 'result_summary.csv'), result)
+        return result
+
+    def write_result_summary(self, filename, result):
+        with open(filename, 'w') as result_summary:
+            result_summary.write(self.get_rslt_sum_col_name())
+            for row in result.itertuples(index=False):
+                result_summary.write(','.join(row) + '\n')
+
+    @staticmethod
+    def _format_values(values):
+        return ['None' if value is None or np.isnan(value) else str(round(float(value), 3)) for value in values]
+
+    @staticmethod
+    def _format_verdicts(verdicts):
+        return ['Pass' if verdict else 'Fail' for verdict in verdicts]
+
+
+def find_test_config(tests_dir, test_dir_name):
+    """
+    Find the test configuration of a result directory. The SVP names the result directories '<group>__<test>'
+    after the test path (e.g. VV__VV_1 for Tests/VV/VV_1.tst).
+    :param tests_dir:       Tests directory of the SVP project
+    :param test_dir_name:   name of the test result directory
+    :return: path of the .tst file or None
+    """
+    parts = test_dir_name.split('__')
+    config_file = os.path.join(tests_dir, *parts[:-1], parts[-1] + '.tst')
+    if os.path.isfile(config_file):
+        return config_file
+    for root, dirs, files in os.walk(tests_dir):
+        if parts[-1] + '.tst' in files:
+            return os.path.join(root, parts[-1] + '.tst')
+    return None
+
+
+def find_test_directories(results_dir, tests_dir):
+    """
+    Walk a Results tree and list the test result directories which can be re-graded
+    :param results_dir: Results directory (or a single run of it)
+    :param tests_dir:   Tests directory of the SVP project
+    :return: list of (test result directory, test configuration file) tuples
+    """
+    test_dirs = []
+    for root, dirs, files in os.walk(results_dir):
+        dirs.sort()
+        name = os.path.basename(root)
+        if '__' not in name or not any(f.endswith('.csv') and not f.startswith('result_summary') for f in files):
+            continue
+        config_file = find_test_config(tests_dir, name)
+        if config_file is None:
+            continue
+        script = ET.parse(config_file).getroot().get('script')
+        if script in REPLAY_SCRIPTS:
+            test_dirs.append((root, config_file))
+    return test_dirs
+
+
+def regrade_test_directory(test_dir, config_file, mra=None):
+    """
+    Re-grade one test result directory. This is the unit of work of regrade_results() so it only uses its arguments
+    and can run in a separate process.
+    :return: (test result directory, result DataFrame or None, error message or None)
+    """
+    try:
+        replay = DatasetReplay.from_config(config_file, mra=mra)
+        return test_dir, replay.regrade_directory(test_dir), None
+    except Exception as e:
+        return test_dir, None, '%s: %s' % (type(e).__name__, e)
+
+
+def regrade_results(results_dir, tests_dir, output_file=None, workers=None, mra=None):
+    """
+    Re-grade every supported test of a Results tree in parallel. Each test result directory gets its
+    result_summary.csv rewritten and all the rows are merged in one summary sorted by test and dataset.
+    :param results_dir: Results directory (or a single run of it)
+    :param tests_dir:   Tests directory of the SVP project
+    :param output_file: merged summary file, by default regrade_summary.csv in results_dir
+    :param workers:     number of processes, by default the number of cores
+    :param mra:         dictionary to override the minimum required accuracies
+    :return: merged pandas DataFrame and a dictionary {test result directory: error message}
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    test_dirs = find_test_directories(results_dir, tests_dir)
+    if output_file is None:
+        output_file = os.path.join(results_dir, 'regrade_summary.csv')
+
+    frames = []
+    errors = {}
+    if test_dirs:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(regrade_test_directory, test_dir, config_file, mra)
+                       for test_dir, config_file in test_dirs]
+            for future in futures:
+                test_dir, result, error = future.result()
+                if error is not None:
+                    errors[test_dir] = error
+                    continue
+                result.insert(0, 'TEST', os.path.relpath(test_dir, results_dir).replace(os.sep, '/'))
+                frames.append(result)
+
+    if frames:
+        # Steps keep their recorded order within a dataset (stable sort)
+        summary = pd.concat(frames, ignore_index=True).sort_values(['TEST', 'FILENAME'], kind='stable')
+    else:
+        summary = pd.DataFrame(columns=['TEST'])
+    summary.to_csv(output_file, index=False)
+    return summary, errors
+
+
+class NormalOperation(HilModel, EutParameters, DataLogging):
+    def __init__(self, ts, support_interfaces):
+        EutParameters.__init__(self, ts)
         HilModel.__init__(self, ts, support_interfaces)
         self._config()
 
@@ -1850,10 +3665,1211 @@ class NormalOperation(HilModel, EutParameters, DataLogging):
         self.set_vrt_modes()
 
 
+"""
+This section is for the waveform analysis
+"""
+
+
+class WaveformAnalyzer(object):
+    """
+    Streaming analysis of the instantaneous waveforms of a capture (e.g. the _WAV.csv files of the ride-through
+    tests, sampled at the Ts = 40 us step of the RT-Lab models).
+
+    The samples are grouped in cycles of the nominal frequency and only the sums of each cycle are kept (x^2, v*i
+    and the Fourier terms of the fundamental), so an arbitrarily long capture is processed chunk by chunk with the
+    memory of the longest window. At the end of every cycle the analyzer gives (Table 3 of IEEE Std 1547-2018):
+        - AC_VRMS_*, AC_IRMS_*: true RMS values over rms_cycles (10 cycles)
+        - AC_P_*: active power, mean of v * i over rms_cycles
+        - AC_Q_*: reactive power of the fundamental phasors over rms_cycles
+        - AC_FREQ_1: frequency from the phase drift of the positive sequence voltage over freq_cycles (60 cycles)
+        - AC_V_ANGLE_*, AC_I_ANGLE_*: angles of the fundamental phasors of the last cycle (deg)
+    The first windows use the cycles available. The columns are the ones of the RMS captures, so the results can be
+    given to RideThroughEvaluator(waveform=False).
+    """
+    def __init__(self, f_nom=60.0, rms_cycles=10, freq_cycles=60, v_points=None, i_points=None,
+                 time_point='TIME'):
+        """
+        :param f_nom:       nominal frequency, sets the length of the cycles (Hz)
+        :param rms_cycles:  number of cycles of the RMS, power and phasor windows
+        :param freq_cycles: number of cycles of the frequency window
+        :param v_points:    voltage channels, default AC_V_1, AC_V_2, AC_V_3
+        :param i_points:    current channels of the same phases, default AC_I_1, AC_I_2, AC_I_3
+        :param time_point:  name of the simulation time column
+        """
+        self.f_nom = float(f_nom)
+        self.rms_cycles = int(rms_cycles)
+        self.freq_cycles = int(freq_cycles)
+        self.v_points = v_points or ['AC_V_1', 'AC_V_2', 'AC_V_3']
+        self.i_points = i_points or ['AC_I_1', 'AC_I_2', 'AC_I_3']
+        if len(self.v_points) != len(self.i_points):
+            raise p1547Error('The voltage channels %s and current channels %s are not of the same phases'
+                             % (self.v_points, self.i_points))
+        self.time_point = time_point
+        self.reset()
+
+    def reset(self):
+        self.t0 = None
+        # sums of the cycle still open at the end of the last chunk: (cycle number, real sums, phasor sums)
+        self.partial = None
+        # number, real sums, phasor sums and unwrapped phase of the last completed cycles
+        self.history = None
+
+    def get_sums(self, time, v, i):
+        """
+        :param time:    sample times (s)
+        :param v:       voltage samples, one column per phase
+        :param i:       current samples, one column per phase
+        :return: (cycle numbers, real sums, phasor sums) of the cycles of the samples
+        """
+        cycle = np.floor((time - self.t0) * self.f_nom + 1e-9).astype(np.int64)
+        rotation = np.exp(-2j * np.pi * self.f_nom * (time - self.t0))[:, None]
+        real = np.column_stack([np.ones(time.size), v * v, i * i, v * i])
+        phasor = np.column_stack([v * rotation, i * rotation])
+        starts = np.flatnonzero(np.r_[True, cycle[1:] != cycle[:-1]])
+        return cycle[starts], np.add.reduceat(real, starts, axis=0), np.add.reduceat(phasor, starts, axis=0)
+
+    def update(self, time, v, i):
+        """
+        Add a chunk of samples. The last cycle of the chunk is kept open for the next one.
+        :param time:    sample times (s), increasing
+        :param v:       voltage samples, one column per phase
+        :param i:       current samples, one column per phase
+        :return: DataFrame with one row per cycle completed by the chunk
+        """
+        time = np.asarray(time, dtype=float)
+        valid = ~np.isnan(time)
+        time = time[valid]
+        v = np.nan_to_num(np.asarray(v, dtype=float).reshape(valid.size, -1)[valid])
+        i = np.nan_to_num(np.asarray(i, dtype=float).reshape(valid.size, -1)[valid])
+        if time.size == 0:
+            return self.get_results(*self.get_empty())
+        if self.t0 is None:
+            self.t0 = time[0]
+        numbers, real, phasor = self.get_sums(time, v, i)
+        if self.partial is not None:
+            number, partial_real, partial_phasor = self.partial
+            if numbers[0] == number:
+                real[0] += partial_real
+                phasor[0] += partial_phasor
+            else:
+                numbers = np.r_[number, numbers]
+                real = np.vstack([partial_real, real])
+                phasor = np.vstack([partial_phasor, phasor])
+        self.partial = (numbers[-1], real[-1], phasor[-1])
+        return self.get_results(numbers[:-1], real[:-1], phasor[:-1])
+
+    def finish(self):
+        """
+        :return: DataFrame with the row of the last open cycle
+        """
+        if self.partial is None:
+            return self.get_results(*self.get_empty())
+        number, real, phasor = self.partial
+        self.partial = None
+        return self.get_results(np.array([number]), real[None, :], phasor[None, :])
+
+    def get_empty(self):
+        phases = len(self.v_points)
+        return np.zeros(0, dtype=np.int64), np.zeros((0, 1 + 3 * phases)), np.zeros((0, 2 * phases), dtype=complex)
+
+    def get_reference(self, phasor):
+        # positive sequence of the voltage phasors, or the phasor of the first phase
+        if len(self.v_points) == 3:
+            a = np.exp(2j * np.pi / 3)
+            return (phasor[:, 0] + a * phasor[:, 1] + a * a * phasor[:, 2]) / 3.
+        return phasor[:, 0]
+
+    def get_results(self, numbers, real, phasor):
+        """
+        Window values at the end of the new completed cycles, using the cycles of the history.
+        """
+        phases = len(self.v_points)
+        reference = self.get_reference(phasor)
+        if self.history is None:
+            previous = reference[:1]
+            last_phase = 0.
+        else:
+            previous = self.history[4][-1:]
+            last_phase = self.history[3][-1]
+        step = np.angle(reference * np.conj(np.r_[previous, reference[:-1]][:reference.size]))
+        phase = last_phase + np.cumsum(step)
+
+        if self.history is not None:
+            numbers = np.r_[self.history[0], numbers]
+            real = np.vstack([self.history[1], real])
+            phasor = np.vstack([self.history[2], phasor])
+            phase = np.r_[self.history[3], phase]
+            reference = np.r_[self.history[4], reference]
+            new = np.arange(self.history[0].size, numbers.size)
+        else:
+            new = np.arange(numbers.size)
+        keep = max(self.rms_cycles, self.freq_cycles)
+        if numbers.size:
+            self.history = (numbers[-keep:], real[-keep:], phasor[-keep:], phase[-keep:], reference[-keep:])
+
+        # window sums with the cumulative sums of the cycles
+        start = np.maximum(new + 1 - self.rms_cycles, 0)
+        real_sum = np.cumsum(np.vstack([np.zeros((1, real.shape[1])), real]), axis=0)
+        real_sum = real_sum[new + 1] - real_sum[start]
+        phasor_sum = np.cumsum(np.vstack([np.zeros((1, phasor.shape[1]), dtype=complex), phasor]), axis=0)
+        phasor_sum = phasor_sum[new + 1] - phasor_sum[start]
+        count = real_sum[:, :1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            v_rms = np.sqrt(real_sum[:, 1:1 + phases] / count)
+            i_rms = np.sqrt(real_sum[:, 1 + phases:1 + 2 * phases] / count)
+            p = real_sum[:, 1 + 2 * phases:] / count
+            # RMS phasors of the fundamental
+            v_phasor = phasor_sum[:, :phases] * np.sqrt(2) / count
+            i_phasor = phasor_sum[:, phases:] * np.sqrt(2) / count
+            q = np.imag(v_phasor * np.conj(i_phasor))
+            first = np.maximum(new - self.freq_cycles, 0)
+            cycles = (numbers[new] - numbers[first]).astype(float)
+            freq = np.where(cycles > 0, self.f_nom + (phase[new] - phase[first]) * self.f_nom / (2 * np.pi * cycles),
+                            np.nan)
+
+        results = OrderedDict([(self.time_point, self.t0 + (numbers[new] + 1) / self.f_nom if numbers.size
+                                else np.zeros(0))])
+        for k in range(phases):
+            results['AC_VRMS_%d' % (k + 1)] = v_rms[:, k]
+        for k in range(phases):
+            results['AC_IRMS_%d' % (k + 1)] = i_rms[:, k]
+        for k in range(phases):
+            results['AC_P_%d' % (k + 1)] = p[:, k]
+        for k in range(phases):
+            results['AC_Q_%d' % (k + 1)] = q[:, k]
+        results['AC_FREQ_1'] = freq
+        for k in range(phases):
+            results['AC_V_ANGLE_%d' % (k + 1)] = np.degrees(np.angle(phasor[new, k]))
+        for k in range(phases):
+            results['AC_I_ANGLE_%d' % (k + 1)] = np.degrees(np.angle(phasor[new, phases + k]))
+        return pd.DataFrame(results)
+
+    def iter_chunks(self, source, chunk_size=2 ** 16):
+        """
+        :param source:      csv file name, pandas DataFrame, dict of columns or dataset with the 'points' names and
+                            the 'data' columns (e.g. the waveform dataset of the DAS)
+        :param chunk_size:  number of samples of each chunk
+        :return: generator of (time, v, i) chunks
+        """
+        points = [self.time_point] + list(self.v_points) + list(self.i_points)
+        phases = len(self.v_points)
+        if isinstance(source, str):
+            for chunk in pd.read_csv(source, usecols=points, chunksize=chunk_size):
+                chunk.columns = chunk.columns.str.strip()
+                yield (chunk[self.time_point].to_numpy(dtype=float), chunk[self.v_points].to_numpy(dtype=float),
+                       chunk[self.i_points].to_numpy(dtype=float))
+            return
+        columns = [RideThroughEvaluator.get_column(source, name) for name in points]
+        missing = [name for name, column in zip(points, columns) if column is None]
+        if missing:
+            raise p1547Error('Columns %s are missing from the waveforms' % missing)
+        data = np.column_stack(columns)
+        for start in range(0, data.shape[0], chunk_size):
+            chunk = data[start:start + chunk_size]
+            yield chunk[:, 0], chunk[:, 1:1 + phases], chunk[:, 1 + phases:]
+
+    def analyze(self, source, chunk_size=2 ** 16):
+        """
+        :param source:      waveforms, see iter_chunks()
+        :param chunk_size:  number of samples of each chunk
+        :return: DataFrame with one row per cycle
+        """
+        self.reset()
+        results = [self.update(*chunk) for chunk in self.iter_chunks(source, chunk_size)]
+        results.append(self.finish())
+        return pd.concat(results, ignore_index=True)
+
+
 """
 This section is for Ride-Through test
 """
 
+# Test conditions applied in each ride-through test, as blocks of (condition labels, number of repetitions).
+# The consecutive tests repeat the ride-through conditions before the full sequence (see set_test_conditions).
+VRT_SEQUENCES = {
+    (LV, CAT_2): {False: [(['A', 'B', 'C', 'D', 'E', 'F'], 1)],
+                  True: [(['A', 'B', 'C', 'D', 'E'], 1),
+                         (['A', 'B', 'C', 'D', 'E', 'F'], 1),
+                         (['A', 'B', 'C', "D'", 'F'], 1)]},
+    (LV, CAT_3): {False: [(['A', 'B', 'C', 'D', 'E'], 1)],
+                  True: [(['A', 'B', 'C', 'D'], 2),
+                         (['A', 'B', 'C', 'D', 'E'], 1),
+                         (['A', 'B', "C'", 'D', 'E'], 1)]},
+    (HV, CAT_2): {False: [(['A', 'B', 'C', 'D', 'E'], 1)],
+                  True: [(['A', 'B', 'C', 'D'], 1),
+                         (['A', 'B', 'C', 'D', 'E'], 1)]},
+    (HV, CAT_3): {False: [(['A', 'B', 'C'], 1)],
+                  True: [(['A', 'B'], 2),
+                         (['A', 'B', 'C'], 1),
+                         (['A', "B'", 'C'], 1)]},
+}
+FRT_SEQUENCE = [(['Step E', 'Step G', 'Step H'], 1)]
+
+# Test conditions of the VRT tests (Tables 4, 5, 7 and 8) as label: (test condition, minimum duration (s),
+# residual voltage of the figure, lowest and highest residual voltage of the random profiles). The residual voltages
+# (p.u.) are (value, k) for value + k * MRA(V) / Vnom. Primed conditions are numbered with 10 + the condition.
+VRT_CONDITIONS = {
+    # TABLE 4 - CATEGORY II LVRT TEST CONDITION
+    (LV, CAT_2): OrderedDict([
+        ('A', (1, 10, (0.94, 0), (0.88, 2), (1.0, 0))),
+        ('B', (2, 0.160, (0.3, -2), (0.0, 0), (0.3, -2))),
+        ('C', (3, 0.160, (0.45, -2), (0.0, 0), (0.45, -2))),
+        ('D', (4, 2.68, (0.65, 0), (0.45, 2), (0.65, -2))),
+        ("D'", (4 + 10, 7.68, (0.67, 2), (0.67, 0), (0.88, -2))),
+        ('E', (5, 2.0, (0.88, 0), (0.65, 2), (0.88, -2))),
+        ('F', (6, 120.0, (0.94, 0), (0.88, 2), (1.0, 0)))]),
+    # TABLE 5 - CATEGORY III LVRT TEST CONDITION
+    (LV, CAT_3): OrderedDict([
+        ('A', (1, 5, (0.94, 0), (0.88, 2), (1.0, 0))),
+        ('B', (2, 1, (0.05, -2), (0.0, 0), (0.05, -2))),
+        ('C', (3, 9, (0.5, -2), (0.0, 0), (0.5, -2))),
+        ("C'", (3 + 10, 9, (0.52, 2), (0.52, 0), (0.7, -2))),
+        ('D', (4, 10.0, (0.7, 0), (0.5, 2), (0.7, -2))),
+        ('E', (5, 120.0, (0.94, 0), (0.88, 2), (1.0, 0)))]),
+    # TABLE 7 - CATEGORY II HVRT TEST CONDITION
+    (HV, CAT_2): OrderedDict([
+        ('A', (1, 10, (1.0, 0), (1.0, 0), (1.1, -2))),
+        ('B', (2, 0.2, (1.2, -2), (1.18, 0), (1.2, 0))),
+        ('C', (3, 0.3, (1.175, 0), (1.155, 0), (1.175, 0))),
+        ('D', (4, 0.5, (1.15, 0), (1.13, 0), (1.15, 0))),
+        ('E', (5, 120.0, (1.0, 0), (1.0, 0), (1.1, -2)))]),
+    # TABLE 8 - CATEGORY III HVRT TEST CONDITION
+    (HV, CAT_3): OrderedDict([
+        ('A', (1, 5, (1.05, 0), (1.0, 0), (1.1, -2))),
+        ('B', (2, 12, (1.2, -2), (1.18, 0), (1.2, 0))),
+        ("B'", (2 + 10, 12, (1.12, 0), (1.12, 0), (1.2, 0))),
+        ('C', (3, 120, (1.05, 0), (1.0, 0), (1.1, -2)))]),
+}
+
+# Residual voltages (p.u.) between which the EUT shall not cease to energize, by category: the permissive operation
+# regions of Category II (below 0.45 p.u. and above 1.1 p.u.) and the momentary cessation regions of Category III
+# (below 0.5 p.u. and above 1.1 p.u.) of IEEE 1547-2018 Tables 14 and 15 allow it.
+VRT_CESSATION_BANDS = {
+    CAT_2: (0.45, 1.1),
+    CAT_3: (0.5, 1.1),
+}
+
+
+def get_vrt_key(current_mode):
+    """
+    :param current_mode:    VRT mode, e.g. 'LV_CAT_2'
+    :return: (LV or HV, CAT_2 or CAT_3) key of VRT_CONDITIONS and VRT_SEQUENCES
+    """
+    for level, category in VRT_CONDITIONS:
+        if level in current_mode and category in current_mode:
+            return level, category
+    raise p1547Error('No VRT test conditions for mode %s' % current_mode)
+
+
+def get_vrt_conditions(current_mode, mra_v_pu):
+    """
+    Test conditions of the figures of the standard
+    :param current_mode:    VRT mode, e.g. 'LV_CAT_2'
+    :param mra_v_pu:        MRA of the voltage (p.u.)
+    :return: OrderedDict of label -> (test condition, minimum duration (s), residual voltage (p.u.))
+    """
+    conditions = OrderedDict()
+    for label, (condition, duration, figure, low, high) in VRT_CONDITIONS[get_vrt_key(current_mode)].items():
+        conditions[label] = (condition, duration, figure[0] + figure[1] * mra_v_pu)
+    return conditions
+
+
+class VrtSequencePool(object):
+    """
+    Pool of randomized residual voltages of the VRT test conditions.
+
+    All the profiles of a mode are drawn at once from a numpy Generator seeded with a recorded seed, so the pool can
+    be generated again to audit what was run, and are checked against the MRA-shifted bands of VRT_CONDITIONS
+    before any of them is used. Profile i of the pool is used for the i-th random test of the mode.
+    """
+    def __init__(self, current_mode, mra_v_pu, size=1000, seed=None):
+        """
+        :param current_mode:    VRT mode, e.g. 'LV_CAT_2'
+        :param mra_v_pu:        MRA of the voltage (p.u.)
+        :param size:            number of profiles
+        :param seed:            seed of the generator (None or 0 draws a new one, see self.seed)
+        """
+        self.key = get_vrt_key(current_mode)
+        self.conditions = VRT_CONDITIONS[self.key]
+        self.labels = list(self.conditions)
+        table = list(self.conditions.values())
+        self.low = np.array([low[0] + low[1] * mra_v_pu for _, _, _, low, _ in table])
+        self.high = np.array([high[0] + high[1] * mra_v_pu for _, _, _, _, high in table])
+        if np.any(self.low > self.high):
+            empty = [label for label, low, high in zip(self.labels, self.low, self.high) if low > high]
+            raise p1547Error('The MRA of %0.4f p.u. leaves no residual voltage for conditions %s of %s' %
+                             (mra_v_pu, empty, current_mode))
+
+        if not seed:
+            seed = int(np.random.SeedSequence().generate_state(1)[0])
+        self.seed = int(seed)
+        # the mode is part of the seed so each mode gets its own profiles from the same recorded seed
+        rng = np.random.default_rng([self.seed, list(VRT_CONDITIONS).index(self.key)])
+        self.values = rng.uniform(self.low, self.high, size=(int(size), len(self.labels)))
+        invalid = np.flatnonzero(~self.validate(self.values))
+        if invalid.size:
+            raise p1547Error('Random VRT profiles %s are out of the MRA-shifted bands' % invalid.tolist())
+
+    def validate(self, values):
+        """
+        :param values:  residual voltages (p.u.), array of shape (..., number of conditions)
+        :return: boolean array, True for the profiles within the bands of all conditions
+        """
+        values = np.asarray(values, dtype=float)
+        return np.all((values >= self.low) & (values <= self.high), axis=-1)
+
+    def get_conditions(self, index):
+        """
+        :param index:   profile number
+        :return: OrderedDict of label -> (test condition, minimum duration (s), residual voltage (p.u.))
+        """
+        conditions = OrderedDict()
+        for label, value in zip(self.labels, self.values[index % len(self.values)]):
+            condition, duration = self.conditions[label][:2]
+            conditions[label] = (condition, duration, float(value))
+        return conditions
+
+    def to_dataframe(self):
+        return pd.DataFrame(self.values, columns=self.labels)
+
+    def __len__(self):
+        return len(self.values)
+
+
+class TestSequence(object):
+    """
+    Sequence of test conditions of a ride-through test compiled into arrays.
+
+    The condition table maps each label to (test condition number, minimum duration (s), value) and the blocks give
+    the order in which the conditions are applied. The start and end timing of every condition are the cumulative
+    sums of the durations. The columns are read with sequence['VRT_END_TIMING'] etc. and the DataFrame view is only
+    built when the sequence is logged.
+
+    Several sequences can be joined in one timeline to run several tests in a single load of the model (see join()).
+    self.test gives the test of each condition and the captures of the session are split back into one dataset per
+    test with split_dataset().
+    """
+    def __init__(self, prefix, conditions, blocks, start_time=0.0):
+        """
+        :param prefix:      prefix of the column names, 'VRT' or 'FRT'
+        :param conditions:  dict of label -> (test condition number, minimum duration (s), value)
+        :param blocks:      list of (list of labels, number of repetitions)
+        :param start_time:  start time of the first condition (s)
+        """
+        self.prefix = prefix
+        labels = [label for block, repetitions in blocks for _ in range(repetitions) for label in block]
+        try:
+            table = np.array([conditions[label] for label in labels], dtype=float).reshape(-1, 3)
+        except KeyError as e:
+            raise p1547Error('Test condition %s is not defined' % e)
+        self.set_table(labels, table, start_time)
+
+    def set_table(self, labels, table, start_time, test=None):
+        """
+        :param labels:      labels of the conditions
+        :param table:       array of (test condition number, minimum duration (s), value) rows
+        :param start_time:  start time of the first condition (s)
+        :param test:        test number of each condition (default all 0)
+        """
+        self.labels = list(labels)
+        self.condition = table[:, 0]
+        self.min_duration = table[:, 1]
+        self.values = table[:, 2]
+        self.test = np.zeros(len(self.labels), dtype=int) if test is None else np.asarray(test, dtype=int)
+        timing = np.cumsum(np.concatenate(([float(start_time)], self.min_duration)))
+        self.start_timing = timing[:-1]
+        self.end_timing = timing[1:]
+
+    @classmethod
+    def join(cls, sequences, gap=0.0):
+        """
+        Timeline of sequences applied one after the other. Each sequence after the first one starts with its first
+        condition held for the settling gap, e.g. while the power level of the next test is set.
+        :param sequences:   list of TestSequence, the start time of the timeline is the one of the first sequence
+        :param gap:         settling time added before each sequence after the first one (s)
+        :return: TestSequence with self.test the index of the sequence of each condition
+        """
+        timeline = cls.__new__(cls)
+        timeline.prefix = sequences[0].prefix
+        labels, tables, test = [], [], []
+        for k, sequence in enumerate(sequences):
+            table = np.column_stack([sequence.condition, sequence.min_duration, sequence.values])
+            if k > 0 and gap > 0:
+                labels.append(sequence.labels[0])
+                tables.append([[sequence.condition[0], gap, sequence.values[0]]])
+                test.append(k)
+            labels.extend(sequence.labels)
+            tables.append(table)
+            test.extend([k] * len(sequence))
+        timeline.set_table(labels, np.vstack(tables), sequences[0].start_timing[0], test)
+        return timeline
+
+    def get_test_count(self):
+        return int(self.test.max()) + 1 if len(self) else 0
+
+    def get_test_range(self, k):
+        """
+        :param k:   test number
+        :return: (start time, end time) of the test in the timeline (s)
+        """
+        rows = np.flatnonzero(self.test == k)
+        return float(self.start_timing[rows[0]]), float(self.end_timing[rows[-1]])
+
+    def get_test_at(self, times):
+        """
+        :param times:   simulation times (s)
+        :return: (test number, test condition number) at each time. The times before the timeline belong to the
+                 first test and the times after it to the last one, with the condition 0. Missing times are -1.
+        """
+        times = np.asarray(times, dtype=float)
+        rows = np.searchsorted(self.start_timing, times, side='right') - 1
+        inside = (rows >= 0) & (times < self.end_timing[-1])
+        rows = np.clip(rows, 0, len(self) - 1)
+        return np.where(np.isnan(times), -1, self.test[rows]), np.where(inside, self.condition[rows], 0.)
+
+    def split_dataset(self, ds, time_point='TIME'):
+        """
+        Split the dataset captured during a timeline into one dataset per test, using the test condition of each
+        sample. A column <prefix>_CONDITION with the test condition number is added.
+        :param ds:          dataset with the 'points' names and the 'data' columns (e.g. svpelab Dataset)
+        :param time_point:  name of the simulation time column
+        :return: list of the datasets of the tests
+        """
+        times = np.array([np.nan if t is None else t for t in ds.data[ds.points.index(time_point)]], dtype=float)
+        test, condition = self.get_test_at(times)
+        datasets = []
+        for k in range(self.get_test_count()):
+            rows = np.flatnonzero(test == k)
+            split = copy.copy(ds)
+            split.points = list(ds.points) + ['%s_CONDITION' % self.prefix]
+            split.data = [[column[i] for i in rows] for column in ds.data] + [condition[rows].tolist()]
+            datasets.append(split)
+        return datasets
+
+    def get_columns(self):
+        return OrderedDict([('%s_CONDITION' % self.prefix, self.condition),
+                            ('MIN_DURATION', self.min_duration),
+                            ('%s_VALUES' % self.prefix, self.values),
+                            ('%s_START_TIMING' % self.prefix, self.start_timing),
+                            ('%s_END_TIMING' % self.prefix, self.end_timing)])
+
+    def get_stop_time(self):
+        return float(self.end_timing[-1]) if len(self) else None
+
+    def get_padded(self, column, size):
+        """
+        Column padded with zeros to the fixed size of the vectors of the RT-Lab model
+        :param column:  column name, e.g. 'VRT_CONDITION'
+        :param size:    size of the model vector
+        :return: numpy array
+        """
+        values = self[column]
+        if values.size > size:
+            raise p1547Error('%d test conditions do not fit in the %d values of %s' % (values.size, size, column))
+        padded = np.zeros(size)
+        padded[:values.size] = values
+        return padded
+
+    def to_dataframe(self):
+        return pd.DataFrame(self.get_columns())
+
+    def __getitem__(self, column):
+        return self.get_columns()[column]
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __str__(self):
+        return self.to_dataframe().to_string()
+
+
+class RideThroughEvaluator(object):
+    """
+    Pass/fail evaluation of a ride-through test from the captured waveforms (or RMS data).
+
+    The captured samples are mapped on the conditions of the compiled test sequence (VRT_START_TIMING, ...) and
+    every statistic is computed for all the conditions at once with cumulative sums and masks, so a waveform file
+    of several million samples is evaluated in about a second. The RMS values of the waveforms are computed on a
+    sliding window of one cycle.
+
+    The current is expressed in p.u. of the current of the first condition of each test (pre-disturbance). The EUT
+    ceased to energize when the current of all phases is below cessation_level and it is restored when it is back
+    above restore_level. For each condition:
+        - CESSATION_TIME: time the EUT ceased to energize during the condition (s)
+        - CONTINUOUS: the current was never lost during the condition
+        - RESTORATION_TIME: time to restore the current after the end of the condition, when it was lost (s)
+        - TRIP: the current was lost and never restored until the end of the test
+    The verdict is Fail when the EUT tripped, when the EUT ceased to energize during a condition that requires
+    continuous operation (all FRT conditions, VRT conditions inside the cessation band) or when the current took
+    more than max_restoration to come back.
+    """
+    def __init__(self, v_nom, f_nom=60.0, waveform=True, cessation_level=0.1, restore_level=0.8,
+                 max_restoration=0.4, cessation_band=None, time_point='TIME'):
+        """
+        :param v_nom:           nominal RMS voltage of the AC_V_* channels (V)
+        :param f_nom:           nominal frequency, sets the RMS window of the waveforms (Hz)
+        :param waveform:        the channels are instantaneous values (True) or already RMS/averaged (False)
+        :param cessation_level: current below which the EUT ceased to energize (p.u. of pre-disturbance)
+        :param restore_level:   current above which the output is restored (p.u. of pre-disturbance)
+        :param max_restoration: maximum time to restore the current after a condition (s)
+        :param cessation_band:  (low, high) VRT voltages (p.u.) outside of which the EUT may cease to energize,
+                                None for the band of the category of the mode (see VRT_CESSATION_BANDS)
+        :param time_point:      name of the simulation time column
+        """
+        self.v_nom = float(v_nom)
+        self.f_nom = float(f_nom)
+        self.waveform = waveform
+        self.cessation_level = cessation_level
+        self.restore_level = restore_level
+        self.max_restoration = max_restoration
+        self.cessation_band = cessation_band
+        self.time_point = time_point
+        if waveform:
+            self.points = {'V': ['AC_V_1', 'AC_V_2', 'AC_V_3'], 'I': ['AC_I_1', 'AC_I_2', 'AC_I_3']}
+        else:
+            self.points = {'V': ['AC_VRMS_1', 'AC_VRMS_2', 'AC_VRMS_3'],
+                           'I': ['AC_IRMS_1', 'AC_IRMS_2', 'AC_IRMS_3']}
+        self.points['P'] = ['AC_P_1', 'AC_P_2', 'AC_P_3']
+        self.points['Q'] = ['AC_Q_1', 'AC_Q_2', 'AC_Q_3']
+
+    @staticmethod
+    def get_column(ds, name):
+        """
+        :param ds:      pandas DataFrame, dict of columns or dataset with the 'points' names and the 'data' columns
+        :param name:    column name
+        :return: float numpy array, None if the column is missing
+        """
+        if hasattr(ds, 'points') and hasattr(ds, 'data'):
+            if name not in ds.points:
+                return None
+            column = ds.data[ds.points.index(name)]
+        elif name in ds:
+            column = ds[name]
+        else:
+            return None
+        try:
+            return np.asarray(column, dtype=float)
+        except (TypeError, ValueError):
+            return np.array([np.nan if x is None else x for x in column], dtype=float)
+
+    def get_rms(self, time, values):
+        """
+        RMS value of instantaneous values on a sliding window of one nominal cycle. The first cycle is averaged on
+        the available samples.
+        :param time:    sample times (s)
+        :param values:  samples, one row per channel
+        :return: numpy array of the RMS values
+        """
+        n = values.shape[-1]
+        step = (time[-1] - time[0]) / (n - 1) if n > 1 else 0.
+        window = min(max(int(round(1. / (self.f_nom * step))), 1) if step > 0 else 1, max(n, 1))
+        squares = np.cumsum(values * values, axis=-1)
+        squares[..., window:] -= squares[..., :-window].copy()
+        count = np.minimum(np.arange(1, n + 1), window)
+        return np.sqrt(np.maximum(squares, 0.) / count)
+
+    def get_channels(self, ds, kind, time, valid):
+        columns = [self.get_column(ds, name) for name in self.points[kind]]
+        columns = [column[valid] for column in columns if column is not None]
+        if not columns:
+            return None
+        values = np.nan_to_num(np.vstack(columns))
+        if self.waveform and kind in ('V', 'I'):
+            values = self.get_rms(time, values)
+        return values
+
+    def get_cessation_band(self, current_mode=None):
+        """
+        :param current_mode:    VRT mode, e.g. 'LV_CAT_2'
+        :return: (low, high) VRT voltages (p.u.) outside of which the EUT may cease to energize
+        """
+        if self.cessation_band is not None:
+            return self.cessation_band
+        if current_mode is None:
+            raise p1547Error('The VRT mode is needed to know where the EUT may cease to energize')
+        return VRT_CESSATION_BANDS[get_vrt_key(current_mode)[1]]
+
+    def evaluate(self, sequence, ds, names=None, current_mode=None):
+        """
+        :param sequence:        TestSequence (or timeline of several tests) applied during the capture
+        :param ds:              captured data with the time, AC_V_*, AC_I_* and optionally AC_P_*, AC_Q_* channels
+        :param names:           names of the tests, default the test numbers
+        :param current_mode:    VRT mode, e.g. 'LV_CAT_2', it gives the cessation band of the VRT conditions
+        :return: pandas DataFrame with one row per test condition
+        """
+        time = self.get_column(ds, self.time_point)
+        if time is None:
+            raise p1547Error('Column %s is missing from the dataset' % self.time_point)
+        valid = ~np.isnan(time)
+        time = time[valid]
+        current = self.get_channels(ds, 'I', time, valid)
+        if current is None:
+            raise p1547Error('Current channels %s are missing from the dataset' % self.points['I'])
+        voltage = self.get_channels(ds, 'V', time, valid)
+        power = self.get_channels(ds, 'P', time, valid)
+        reactive = self.get_channels(ds, 'Q', time, valid)
+        n = time.size
+
+        # sample range [start, end) of each condition and of each test
+        start = np.searchsorted(time, sequence.start_timing, side='left')
+        end = np.searchsorted(time, sequence.end_timing, side='left')
+        count = end - start
+        test = sequence.test
+        last = np.flatnonzero(np.r_[test[1:] != test[:-1], True])
+        first = np.r_[0, last[:-1] + 1]
+        test_end = end[last][test]
+        # the samples after the timeline (normal shutdown) belong to the last test
+        test_end[test == test[-1]] = n
+
+        def segment(values, reduce=None):
+            # sum (or min/max) of each condition, NaN for the conditions without samples
+            out = np.full(len(sequence), np.nan)
+            rows = np.flatnonzero(count > 0)
+            if rows.size == 0:
+                return out
+            if reduce is None:
+                cumulative = np.concatenate(([0.], np.cumsum(values)))
+                out[rows] = cumulative[end[rows]] - cumulative[start[rows]]
+            else:
+                out[rows] = reduce.reduceat(values[start[rows[0]]:end[rows[-1]]], start[rows] - start[rows[0]])
+            return out
+
+        magnitude = current.max(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            reference = (segment(magnitude) / count)[first][test]
+        sample_row = np.clip(np.searchsorted(sequence.start_timing, time, side='right') - 1, 0, len(sequence) - 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            current_pu = magnitude / np.where(reference > 0, reference, np.nan)[sample_row]
+        lost = current_pu < self.cessation_level
+        restored = current_pu >= self.restore_level
+
+        # time of each sample and index of the next sample where the current is restored
+        dt = np.diff(np.append(time, time[-1])) if n else time
+        next_restored = np.minimum.accumulate(np.where(restored, np.arange(n), n)[::-1])[::-1]
+        next_restored = np.append(next_restored, n)
+
+        cessation_time = segment(lost * dt)
+        continuous = np.where(count > 0, cessation_time == 0, False)
+        was_lost = cessation_time > 0
+        after = next_restored[np.maximum(end - 1, 0)]
+        trip = was_lost & (after >= test_end)
+        restoration = np.full(len(sequence), np.nan)
+        rows = np.flatnonzero(was_lost & ~trip)
+        end_time = np.where(end < n, time[np.minimum(end, n - 1)], sequence.end_timing)
+        restoration[rows] = np.maximum(time[after[rows]] - end_time[rows], 0.)
+
+        if sequence.prefix == 'VRT':
+            low, high = self.get_cessation_band(current_mode)
+            mandatory = (sequence.values >= low) & (sequence.values <= high)
+        else:
+            mandatory = np.ones(len(sequence), dtype=bool)
+        # a cessation continued from the previous condition is judged by the restoration time of that condition
+        onset = segment(lost & ~np.r_[False, lost[:-1]]) > 0
+        fail = trip | (mandatory & onset) | (restoration > self.max_restoration)
+        result = np.where(count == 0, 'No Data', np.where(fail, 'Fail', 'Pass'))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            results = OrderedDict()
+            results['TEST'] = [test_k if names is None else names[test_k] for test_k in test]
+            results['LABEL'] = sequence.labels
+            results['%s_CONDITION' % sequence.prefix] = sequence.condition
+            results['%s_VALUES' % sequence.prefix] = sequence.values
+            results['START'] = sequence.start_timing
+            results['END'] = sequence.end_timing
+            results['SAMPLES'] = count
+            if voltage is not None:
+                results['V_MIN_PU'] = segment(voltage.min(axis=0), np.minimum) / self.v_nom
+                results['V_MAX_PU'] = segment(voltage.max(axis=0), np.maximum) / self.v_nom
+            results['I_MIN_PU'] = segment(np.nan_to_num(current_pu), np.minimum)
+            results['I_MEAN_PU'] = segment(np.nan_to_num(current_pu)) / count
+            if power is not None:
+                results['P_MEAN'] = segment(power.sum(axis=0)) / count
+            if reactive is not None:
+                results['Q_MEAN'] = segment(reactive.sum(axis=0)) / count
+            results['CESSATION_TIME'] = cessation_time
+            results['CONTINUOUS'] = continuous
+            results['RESTORATION_TIME'] = restoration
+            results['TRIP'] = trip
+            results['MANDATORY'] = mandatory
+            results['RESULT'] = result
+        return pd.DataFrame(results)
+
+    def write_results(self, ts, results, filename='ride_through_results.csv'):
+        """
+        Append the verdicts of the conditions to the results file of the test and log the failed conditions.
+        :param ts:          test script
+        :param results:     DataFrame returned by evaluate()
+        :param filename:    name of the results file
+        """
+        path = ts.result_file_path(filename)
+        new = not os.path.exists(path)
+        results.to_csv(path, mode='a', header=new, index=False)
+        if new:
+            ts.result_file(filename)
+        for row in results[results['RESULT'] != 'Pass'].itertuples(index=False):
+            ts.log_warning('%s condition %s: %s (cessation %.3f s, restoration %.3f s, trip %s)'
+                           % (row.TEST, row.LABEL, row.RESULT, row.CESSATION_TIME, row.RESTORATION_TIME, row.TRIP))
+        ts.log('Ride-through evaluation: %d/%d conditions passed'
+               % ((results['RESULT'] == 'Pass').sum(), len(results)))
+
+
+class FrequencyTracker(object):
+    """
+    Frequency and ROCOF of a FRT capture from the zero crossings of the voltage waveforms.
+
+    The rising zero crossings of each phase are found with a hysteresis band, to reject the noise around zero, and
+    interpolated between the samples, so every phase gives one period per cycle. The periods of the phases are merged
+    and averaged over average_cycles cycles and the ROCOF is the slope of the frequency over rocof_window. The whole
+    capture is processed with masks and cumulative sums, without a loop over the samples.
+
+    evaluate() adds to the verdicts of RideThroughEvaluator, for each condition of the FRT sequence, the measured
+    frequency, the ROCOF of the ramp to the condition value, the time the frequency was held within MRA(F) of the
+    condition value and whether the EUT stayed connected.
+    """
+    def __init__(self, v_nom, f_nom=60.0, mra_f=0.01, hysteresis=0.1, average_cycles=10, rocof_window=0.1,
+                 v_points=None, time_point='TIME'):
+        """
+        :param v_nom:           nominal RMS voltage of the voltage channels (V)
+        :param f_nom:           nominal frequency (Hz)
+        :param mra_f:           tolerance of the frequency held at the condition value (Hz)
+        :param hysteresis:      half width of the band around zero of the crossings (p.u. of the nominal peak)
+        :param average_cycles:  number of cycles of the frequency average
+        :param rocof_window:    length of the ROCOF window (s)
+        :param v_points:        voltage channels, default AC_V_1, AC_V_2, AC_V_3
+        :param time_point:      name of the simulation time column
+        """
+        self.v_nom = float(v_nom)
+        self.f_nom = float(f_nom)
+        self.mra_f = mra_f
+        self.hysteresis = hysteresis
+        self.average_cycles = average_cycles
+        self.rocof_window = rocof_window
+        self.v_points = v_points or ['AC_V_1', 'AC_V_2', 'AC_V_3']
+        self.time_point = time_point
+        self.evaluator = RideThroughEvaluator(v_nom, f_nom=f_nom, time_point=time_point)
+
+    def get_crossings(self, time, v):
+        """
+        :param time:    sample times (s)
+        :param v:       samples of one phase
+        :return: times of the rising zero crossings (s)
+        """
+        band = self.hysteresis * self.v_nom * np.sqrt(2)
+        state = np.where(v > band, 1, np.where(v < -band, -1, 0))
+        marked = np.flatnonzero(state)
+        if marked.size < 2:
+            return np.zeros(0)
+        # first sample above the band after a sample below it
+        rise = marked[1:][(state[marked[1:]] == 1) & (state[marked[:-1]] == -1)]
+        # the crossing is at the last change of sign before the rise
+        sign = np.flatnonzero((v[:-1] < 0) & (v[1:] >= 0))
+        j = sign[np.searchsorted(sign, rise, side='left') - 1]
+        return time[j] - v[j] * (time[j + 1] - time[j]) / (v[j + 1] - v[j])
+
+    def get_frequency(self, time, v):
+        """
+        :param time:    sample times (s)
+        :param v:       voltage samples, one column per phase
+        :return: (times, frequencies) of the averaged periods
+        """
+        times, periods = [], []
+        for k in range(v.shape[1]):
+            crossings = self.get_crossings(time, v[:, k])
+            times.append(0.5 * (crossings[1:] + crossings[:-1]))
+            periods.append(np.diff(crossings))
+        times, periods = np.concatenate(times), np.concatenate(periods)
+        order = np.argsort(times, kind='stable')
+        times, periods = times[order], periods[order]
+        # periods across a gap or a loss of voltage
+        valid = (periods > 0.5 / self.f_nom) & (periods < 2. / self.f_nom)
+        times, periods = times[valid], periods[valid]
+        window = max(int(self.average_cycles * v.shape[1]), 1)
+        if times.size < window:
+            return np.zeros(0), np.zeros(0)
+        period_sum = np.cumsum(np.r_[0., periods])
+        time_sum = np.cumsum(np.r_[0., times])
+        return (time_sum[window:] - time_sum[:-window]) / window, window / (period_sum[window:] - period_sum[:-window])
+
+    def get_rocof(self, times, freq):
+        """
+        :param times:   times of the frequencies (s)
+        :param freq:    frequencies (Hz)
+        :return: ROCOF at each time, slope over the centered window (Hz/s)
+        """
+        low = np.searchsorted(times, times - self.rocof_window / 2., side='left')
+        high = np.searchsorted(times, times + self.rocof_window / 2., side='right') - 1
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(high > low, (freq[high] - freq[low]) / (times[high] - times[low]), np.nan)
+
+    def evaluate(self, sequence, ds, names=None):
+        """
+        :param sequence:    FRT TestSequence applied during the capture
+        :param ds:          captured waveforms with the time, AC_V_* and AC_I_* channels
+        :param names:       names of the tests, default the test numbers
+        :return: pandas DataFrame with one row per test condition
+        """
+        results = self.evaluator.evaluate(sequence, ds, names)
+        time = self.evaluator.get_column(ds, self.time_point)
+        columns = [self.evaluator.get_column(ds, name) for name in self.v_points]
+        columns = [column for column in columns if column is not None]
+        if not columns:
+            raise p1547Error('Voltage channels %s are missing from the dataset' % self.v_points)
+        valid = ~np.isnan(time)
+        times, freq = self.get_frequency(time[valid], np.nan_to_num(np.column_stack(columns)[valid]))
+        rocof = self.get_rocof(times, freq)
+
+        start = np.searchsorted(times, sequence.start_timing, side='left')
+        end = np.searchsorted(times, sequence.end_timing, side='left')
+        count = end - start
+        dt = np.diff(np.r_[times, times[-1:]])
+        held = np.abs(freq - sequence.values[np.clip(np.searchsorted(sequence.start_timing, times, side='right') - 1,
+                                                             0, len(sequence) - 1)]) <= self.mra_f
+        held_time = np.cumsum(np.r_[0., held * dt])
+        f_min, f_max, f_mean, ramp_rocof = (np.full(len(sequence), np.nan) for _ in range(4))
+        for row in np.flatnonzero(count > 0):
+            window = slice(start[row], end[row])
+            f_min[row], f_max[row], f_mean[row] = freq[window].min(), freq[window].max(), freq[window].mean()
+            # ROCOF between 10 % and 90 % of the step from the previous condition
+            if row > 0 and sequence.values[row] != sequence.values[row - 1]:
+                step = sequence.values[row] - sequence.values[row - 1]
+                progress = (freq[window] - sequence.values[row - 1]) / step
+                ramp = (progress >= 0.1) & (progress <= 0.9)
+                if ramp.any():
+                    ramp_rocof[row] = np.nanmean(rocof[window][ramp])
+
+        position = list(results.columns).index('CESSATION_TIME')
+        for name, values in [('F_MIN', f_min), ('F_MAX', f_max), ('F_MEAN', f_mean), ('ROCOF', ramp_rocof),
+                             ('TIME_AT_VALUE', np.where(count > 0, held_time[end] - held_time[start], np.nan))]:
+            results.insert(position, name, values)
+            position += 1
+        results.insert(list(results.columns).index('TRIP') + 1, 'CONNECTED', ~results['TRIP'].to_numpy())
+        return results
+
+    def write_results(self, ts, results, filename='ride_through_results.csv'):
+        self.evaluator.write_results(ts, results, filename)
+        for row in results.itertuples(index=False):
+            ts.log('%s condition %s: %.3f Hz (ROCOF %.2f Hz/s), %.1f s within MRA, connected %s'
+                   % (row.TEST, row.LABEL, row.F_MEAN, row.ROCOF, row.TIME_AT_VALUE, row.CONNECTED))
+
+
+# Phase-angle change ride-through tests (Table 9, variation 1) as test number: (conditions, phase angles of condition
+# A, phase angles of the jump condition (deg, relative to the initial phase A angle), duration of the jump (s), the
+# jump may be leading or lagging (NOTE 2 of Table 9))
+PCRT_CONDITIONS = OrderedDict([
+    (1, ('A-B-A', (0., 120., -120.), (60., 120., -120.), 0.5, True)),
+    (2, ('A-C-A', (0., 120., -120.), (0., 180., -120.), 0.5, True)),
+    (3, ('A-D-A', (0., 120., -120.), (0., 120., -60.), 0.5, True)),
+    (4, ('A-E-A', (0., 120., -120.), (20., 140., -100.), 60., False)),
+    (5, ('A-F-A', (0., 120., -120.), (-20., 100., -140.), 60., False))])
+
+
+def wrap_angle(angle):
+    """
+    :param angle:   angles (deg)
+    :return: angles wrapped to [-180, 180) (deg)
+    """
+    return (np.asarray(angle) + 180.) % 360. - 180.
+
+
+class PhaseJumpAnalyzer(object):
+    """
+    Grading of the phase-angle change ride-through (PCRT) captures.
+
+    The voltage and current phasors of every cycle are computed with WaveformAnalyzer. A phase jump shows as a change
+    of the voltage angle of a phase from one cycle to the next, so the jumps are the groups of consecutive cycles
+    where an angle changes by more than jump_threshold. For each jump:
+        - JUMP_TIME: first sample where the voltage leaves the sinusoid of the cycle before the jump (s)
+        - ANGLE_STEP_*: angle step of each phase, from the cycle before to the cycle after the jump (deg)
+        - DISTURBANCE: largest deviation of the phase currents after the jump (p.u. of the pre-jump current)
+        - RECOVERY_TIME: time from the jump to the end of the last cycle with a deviation above
+          disturbance_tolerance, before the next jump (s)
+    The angles are positive leading. The first jump and the return jump of each test give one row. The test is
+    Invalid when the measured angle steps are not the ones of PCRT_CONDITIONS, and it fails when the EUT tripped (the current was lost and not
+    restored at the end of the capture) or when the current took more than max_recovery to recover.
+    """
+    def __init__(self, f_nom=60.0, jump_threshold=5.0, angle_tolerance=5.0, disturbance_tolerance=0.1,
+                 cessation_level=0.1, restore_level=0.8, max_recovery=1.0, time_point='TIME'):
+        """
+        :param f_nom:                   nominal frequency (Hz)
+        :param jump_threshold:          change of angle between two cycles detected as a jump (deg)
+        :param angle_tolerance:         tolerance of the measured angle steps (deg)
+        :param disturbance_tolerance:   deviation of the current considered as recovered (p.u.)
+        :param cessation_level:         current below which the EUT ceased to energize (p.u.)
+        :param restore_level:           current above which the output is restored (p.u.)
+        :param max_recovery:            maximum recovery time of the current (s)
+        :param time_point:              name of the simulation time column
+        """
+        self.f_nom = float(f_nom)
+        self.jump_threshold = jump_threshold
+        self.angle_tolerance = angle_tolerance
+        self.disturbance_tolerance = disturbance_tolerance
+        self.cessation_level = cessation_level
+        self.restore_level = restore_level
+        self.max_recovery = max_recovery
+        self.time_point = time_point
+        self.waveforms = WaveformAnalyzer(f_nom, rms_cycles=1, freq_cycles=1, time_point=time_point)
+
+    def get_jumps(self, ds):
+        """
+        :param ds:  waveforms with the time, AC_V_* and AC_I_* channels
+        :return: (per-cycle DataFrame, list of (jump time, angle steps, index of the cycles before and after the jump))
+        """
+        cycles = self.waveforms.analyze(ds)
+        t0 = self.waveforms.t0
+        phases = len(self.waveforms.v_points)
+        angle = cycles[['AC_V_ANGLE_%d' % (k + 1) for k in range(phases)]].to_numpy()
+        rms = cycles[['AC_VRMS_%d' % (k + 1) for k in range(phases)]].to_numpy()
+        change = np.abs(wrap_angle(np.diff(angle, axis=0))) > self.jump_threshold
+        flagged = np.flatnonzero(change.any(axis=1))
+        if flagged.size == 0:
+            return cycles, []
+        # groups of consecutive flagged changes. The cycles next to a group may hold a small part of the jump, so
+        # the angles are taken one cycle further on each side.
+        breaks = np.flatnonzero(np.diff(flagged) > 1)
+        firsts = np.maximum(flagged[np.r_[0, breaks + 1]] - 1, 0)
+        lasts = np.minimum(flagged[np.r_[breaks, flagged.size - 1]] + 2, len(cycles) - 1)
+
+        time = RideThroughEvaluator.get_column(ds, self.time_point)
+        v = np.vstack([RideThroughEvaluator.get_column(ds, name) for name in self.waveforms.v_points])
+        omega = 2 * np.pi * self.f_nom
+        period = 1. / self.f_nom
+        jumps = []
+        for first, last in zip(firsts, lasts):
+            # first sample that leaves the sinusoid of the cycle before the jump by 10 % of its peak
+            start = np.searchsorted(time, cycles[self.time_point].iat[first] - period, side='left')
+            end = np.searchsorted(time, cycles[self.time_point].iat[last], side='right')
+            window = time[start:end]
+            peak = np.sqrt(2) * rms[first][:, None]
+            fit = peak * np.cos(omega * (window - t0)[None, :] + np.radians(angle[first])[:, None])
+            leave = np.flatnonzero((np.abs(v[:, start:end] - fit) > 0.1 * peak).any(axis=0))
+            jump_time = window[leave[0]] if leave.size else cycles[self.time_point].iat[first]
+            jumps.append((jump_time, wrap_angle(angle[last] - angle[first]), first, last))
+        return cycles, jumps
+
+    def analyze(self, datasets, test_num, name=None):
+        """
+        :param datasets:    waveforms of the test, e.g. the start and end captures of the tests 4 and 5
+        :param test_num:    PCRT test number (1-5)
+        :param name:        name of the test
+        :return: OrderedDict of the results of the test
+        """
+        try:
+            label, initial, jump, duration, either = PCRT_CONDITIONS[int(test_num)]
+        except (KeyError, ValueError):
+            raise p1547Error('PCRT test %s is not defined' % test_num)
+        expected = wrap_angle(np.array(jump) - np.array(initial))
+        phases = len(self.waveforms.i_points)
+        events, reference, current = [], None, None
+        for ds in datasets:
+            cycles, jumps = self.get_jumps(ds)
+            times = cycles[self.time_point].to_numpy()
+            current = cycles[['AC_IRMS_%d' % (k + 1) for k in range(phases)]].to_numpy()
+            if reference is None:
+                # pre-disturbance current, the cycles before the first jump except the first one
+                before = slice(1, jumps[0][2]) if jumps else slice(1, None)
+                reference = np.mean(current[before], axis=0) if current[before].size else current.mean(axis=0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                deviation = np.nan_to_num(np.abs(current / reference - 1.)).max(axis=1)
+            limits = [j[0] for j in jumps[1:]] + [np.inf]
+            for (jump_time, steps, _, _), limit in zip(jumps, limits):
+                inside = (times > jump_time) & (times <= limit)
+                disturbed = np.flatnonzero(inside & (deviation > self.disturbance_tolerance))
+                events.append((jump_time, steps, deviation[inside].max() if inside.any() else np.nan,
+                               times[disturbed[-1]] - jump_time if disturbed.size else 0.))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            final = np.nan_to_num(current[-1] / reference).max() if current is not None and current.size else 0.
+            lost = np.nan_to_num(current / reference).max(axis=1) < self.cessation_level if current is not None \
+                else np.zeros(0, dtype=bool)
+        trip = bool(final < self.restore_level and lost.any())
+
+        row = OrderedDict([('TEST', name), ('TEST_NUM', int(test_num)), ('CONDITION', label),
+                           ('JUMPS', len(events))])
+        for prefix, k in [('JUMP', 0), ('RETURN', 1)]:
+            event = events[k] if len(events) > k else (np.nan, np.full(phases, np.nan), np.nan, np.nan)
+            row['%s_TIME' % prefix] = event[0]
+            for p in range(phases):
+                row['%s_STEP_%d' % (prefix, p + 1)] = event[1][p]
+        for p in range(phases):
+            row['EXPECTED_STEP_%d' % (p + 1)] = expected[p]
+        # the return jump is the opposite of the first one
+        errors = [max([np.abs(wrap_angle(events[k][1] - sign * direction * expected)).max()
+                       for k, sign in [(0, 1.), (1, -1.)] if len(events) > k])
+                  for direction in ([1., -1.] if either else [1.])] if events else []
+        row['ANGLE_ERROR'] = min(errors) if errors else np.nan
+        row['DISTURBANCE'] = np.nanmax([e[2] for e in events]) if events else np.nan
+        row['RECOVERY_TIME'] = max([e[3] for e in events]) if events else np.nan
+        row['TRIP'] = trip
+        if not events or row['ANGLE_ERROR'] > self.angle_tolerance:
+            row['RESULT'] = 'Invalid'
+        elif trip or row['RECOVERY_TIME'] > self.max_recovery:
+            row['RESULT'] = 'Fail'
+        else:
+            row['RESULT'] = 'Pass'
+        return row
+
+    def evaluate(self, captures):
+        """
+        :param captures:    list of (test name, test number, list of waveform datasets)
+        :return: pandas DataFrame with one row per test
+        """
+        return pd.DataFrame([self.analyze(datasets, test_num, name) for name, test_num, datasets in captures])
+
+    def write_results(self, ts, results, filename='pcrt_results.csv'):
+        """
+        Append the results to the results file of the test and log them.
+        :param ts:          test script
+        :param results:     DataFrame returned by evaluate()
+        :param filename:    name of the results file
+        """
+        path = ts.result_file_path(filename)
+        new = not os.path.exists(path)
+        results.to_csv(path, mode='a', header=new, index=False)
+        if new:
+            ts.result_file(filename)
+        for row in results.itertuples(index=False):
+            ts.log('%s (%s): %d jump(s), angle error %.2f deg, disturbance %.2f p.u., recovery %.3f s, trip %s: %s'
+                   % (row.TEST, row.CONDITION, row.JUMPS, row.ANGLE_ERROR, row.DISTURBANCE, row.RECOVERY_TIME,
+                      row.TRIP, row.RESULT))
+
+
+# Blocks of the SM_Source subsystem of the phase jump model for each phase: (switch to the jump angle, switch back to
+# the initial angle, initial angle, jump angle)
+PCRT_MODEL_BLOCKS = OrderedDict([
+    ('A', ('Switch1', 'Switch2', 'Phase Angle Phase A0', 'Phase Angle Phase A1')),
+    ('B', ('Switch3', 'Switch4', 'Phase Angle Phase B0', 'Phase Angle Phase B1')),
+    ('C', ('Switch7', 'Switch8', 'Phase Angle Phase C0', 'Phase Angle Phase C1'))])
+
+
+class PhaseJumpTest(object):
+    """
+    Parameters of the phase jump model for one PCRT test, derived from PCRT_CONDITIONS.
+
+    The phases whose angle changes switch to the jump angle at the jump time and back after the duration of the
+    condition, the other ones only switch after the end of the simulation. The trigger signal is high during the jump.
+    The waveforms are captured by OpWriteFile from pre_capture before the jump to post_capture after it, and a second
+    capture is made around the return jump when it is outside of the first one (tests 4 and 5).
+
+    OpWriteFile saves the signals in buffers of buffer_samples samples of Ts * decimation, so a capture is a whole
+    number of frames of buffer_samples * Ts * decimation seconds (0.2 s with Ts = 40 us, decimation 5 and 1000
+    samples per buffer).
+    """
+    def __init__(self, model_name, test_num, phase_jump_time, reverse=False, pre_capture=0.5, post_capture=1.5,
+                 step=40e-6, decimation=5, buffer_samples=1000):
+        """
+        :param model_name:      name of the RT-LAB model
+        :param test_num:        PCRT test number (1-5)
+        :param phase_jump_time: simulation time of the jump (s)
+        :param reverse:         lagging jump instead of leading, for the tests which allow both (NOTE 2 of Table 9)
+        :param pre_capture:     waveform capture before a jump (s)
+        :param post_capture:    waveform capture after a jump (s)
+        :param step:            model time step Ts (s)
+        :param decimation:      decimation of the OpWriteFile block
+        :param buffer_samples:  number of samples of each OpWriteFile buffer
+        """
+        try:
+            self.label, initial, jump, self.duration, either = PCRT_CONDITIONS[int(test_num)]
+        except (KeyError, ValueError):
+            raise p1547Error('PCRT test %s is not defined' % test_num)
+        if reverse and not either:
+            raise p1547Error('PCRT test %s (%s) has no reverse phase jump' % (test_num, self.label))
+        self.test_num = int(test_num)
+        self.model_name = model_name
+        self.reverse = reverse
+        self.jump_time = float(phase_jump_time)
+        self.frame = buffer_samples * step * decimation
+        direction = -1. if reverse else 1.
+        # model angles in (-180, 180], e.g. 180 and not -180 for the phase B of the test 2
+        self.initial = np.array(initial)
+        self.jump = 180. - (180. - self.initial - direction * wrap_angle(np.array(jump) - self.initial)) % 360.
+        return_time = self.jump_time + self.duration
+
+        self.captures = [(self.jump_time - pre_capture, self.jump_time + post_capture)]
+        if return_time + 1. <= self.captures[0][1]:
+            self.stop_time = self.captures[0][1] + 0.5
+        else:
+            self.stop_time = return_time + 1.
+            self.captures.append((return_time - 1., self.stop_time))
+
+        self.parameters = OrderedDict()
+        for k, (phase, (switch_on, switch_off, angle_0, angle_1)) in enumerate(PCRT_MODEL_BLOCKS.items()):
+            changed = self.jump[k] != self.initial[k]
+            self.set_param(switch_on + '/Threshold', self.jump_time if changed else self.stop_time)
+            self.set_param(switch_off + '/Threshold', return_time if changed else self.stop_time)
+            self.set_param(angle_0 + '/Value', self.initial[k])
+            self.set_param(angle_1 + '/Value', self.jump[k])
+        self.set_param('Switch5/Threshold', self.jump_time)
+        self.set_param('Switch6/Threshold', return_time)
+        self.set_param('Trigger Low/Value', 0)
+        self.set_param('Trigger High/Value', 5)
+        # a capture after the end of the simulation is never made
+        end_capture = self.captures[1] if len(self.captures) > 1 else (self.stop_time + 1, self.stop_time + 1)
+        self.set_param('Start Capture Pulse Start/Threshold', self.captures[0][0])
+        self.set_param('Start Capture Pulse End/Threshold', self.captures[0][1])
+        self.set_param('End Capture Pulse Start/Threshold', end_capture[0])
+        self.set_param('End Capture Pulse End/Threshold', end_capture[1])
+        self.validate()
+
+    def set_param(self, block, value):
+        self.parameters['%s/SM_Source/%s' % (self.model_name, block)] = float(value)
+
+    def validate(self):
+        """
+        Check the waveform captures: whole number of OpWriteFile frames, inside the simulation, in order and around
+        the jumps
+        """
+        jumps = [self.jump_time, self.jump_time + self.duration]
+        last_end = 0.
+        for start, end in self.captures:
+            frames = (end - start) / self.frame
+            if start < last_end or end > self.stop_time or end <= start:
+                raise p1547Error('PCRT test %d: capture %0.3f-%0.3f s is outside of the simulation (0-%0.3f s) or '
+                                 'overlaps the previous one' % (self.test_num, start, end, self.stop_time))
+            if abs(frames - round(frames)) > 1e-6:
+                raise p1547Error('PCRT test %d: capture of %0.3f s is not a whole number of %0.3f s OpWriteFile '
+                                 'frames' % (self.test_num, end - start, self.frame))
+            last_end = end
+        for jump in jumps:
+            if not any(start < jump < end for start, end in self.captures):
+                raise p1547Error('PCRT test %d: the jump at %0.3f s is not captured' % (self.test_num, jump))
+
+    def push(self, ts, hil):
+        """
+        Send all the parameters of the test in one set_params() call of the HIL
+        :param ts:  test script
+        :param hil: hil object
+        """
+        names, values = tuple(self.parameters.keys()), tuple(self.parameters.values())
+        start = time.perf_counter()
+        try:
+            hil.set_params(names, values)
+        except Exception as e:
+            # drivers without the batched call
+            ts.log_debug('Batched set_params failed (%s), setting the parameters one by one' % e)
+            for name, value in self.parameters.items():
+                hil.set_params(name, value)
+        ts.log_debug('PCRT test %d: %d parameters set in %0.1f ms'
+                     % (self.test_num, len(names), (time.perf_counter() - start) * 1e3))
+
+    def __str__(self):
+        return '\n'.join('%s = %s' % (name, value) for name, value in self.parameters.items())
+
+
+def get_pcrt_tests(model_name, phase_jump_time, tests=None, reverse=False, **kwargs):
+    """
+    Parameters of the PCRT tests, built and validated before the first test is run
+    :param model_name:      name of the RT-LAB model
+    :param phase_jump_time: simulation time of the jumps (s)
+    :param tests:           test numbers, default all the tests of PCRT_CONDITIONS
+    :param reverse:         lagging jumps for the tests which allow both directions
+    :param kwargs:          capture settings of PhaseJumpTest
+    :return: OrderedDict of test number -> PhaseJumpTest
+    """
+    tests = PCRT_CONDITIONS.keys() if tests is None else tests
+    return OrderedDict((int(k), PhaseJumpTest(model_name, k, phase_jump_time,
+                                              reverse=reverse and PCRT_CONDITIONS.get(int(k), (False,) * 5)[4],
+                                              **kwargs))
+                       for k in tests)
+
 
 class VoltageRideThrough(HilModel, EutParameters, DataLogging):
     def __init__(self, ts, support_interfaces):
@@ -1862,6 +4878,8 @@ class VoltageRideThrough(HilModel, EutParameters, DataLogging):
         self.wfm_header = None
         self._config()
         self.phase_combination = None
+        self.sequence_pools = {}
+        self.sequence_count = collections.Counter()
 
     def _config(self):
         self.set_vrt_params()
@@ -1879,22 +4897,22 @@ class VoltageRideThrough(HilModel, EutParameters, DataLogging):
             self.params["hv_mode"] = self.ts.param_value('vrt.hv_ena')
             self.params["categories"] = self.ts.param_value('vrt.cat')
             self.params["range_steps"] = self.ts.param_value('vrt.range_steps')
-            self.params["eut_startup_time"] = self.ts.param_value('eut.startup_time')
+            self.params["eut_startup_time"] = get_eut_params(self.ts).startup_time
             self.params["model_name"] = self.hil.rt_lab_model
             self.params["range_steps"] = self.ts.param_value('vrt.range_steps')
             self.params["phase_comb"] = self.ts.param_value('vrt.phase_comb')
             self.params["dataset"] = self.ts.param_value('vrt.dataset_type')
             self.params["consecutive_ena"] = self.ts.param_value('vrt.consecutive_ena')
+            self.params["random_seed"] = self.ts.param_value('vrt.random_seed')
+            self.params["random_pool"] = self.ts.param_value('vrt.random_pool') or 1000
+            self.params["single_session"] = self.ts.param_value('vrt.single_session') == 'Enabled'
+            self.params["session_gap"] = float(self.ts.param_value('vrt.session_gap') or 10.0)
+            self.params["vector_size"] = int(self.ts.param_value('vrt.vector_size') or 20)
 
         except Exception as e:
             self.ts.log_error('Incorrect Parameter value : %s' % e)
             raise
 
-    def extend_list_end(self, _list, extend_value, final_length):
-        list_length = len(_list)
-        _list.extend([float(extend_value)] * (final_length - list_length))
-        return _list
-
     def set_vrt_model_parameters(self, test_sequence):
         parameters = []
 
@@ -1914,26 +4932,20 @@ class VoltageRideThrough(HilModel, EutParameters, DataLogging):
 
         # We need to do some padding because of RT-compilation allow a fixe size.
         # In our case, with pad with 0 a vector size of 20. This will tell the state machine the final value.
+        # The HIL drivers send lists of floats, not numpy arrays.
 
-        vrt_condition_list = self.extend_list_end(test_sequence["VRT_CONDITION"].to_list(), 0.0, 20)
-        parameters.append(("VRT_CONDITION", vrt_condition_list))
-
-        vrt_start_timing_list = self.extend_list_end(test_sequence["VRT_START_TIMING"].to_list(), 0.0, 20)
-        parameters.append(("VRT_START_TIMING", vrt_start_timing_list))
-
-        vrt_end_timing_list = self.extend_list_end(test_sequence["VRT_END_TIMING"].to_list(), 0.0, 20)
-        parameters.append(("VRT_END_TIMING", vrt_end_timing_list))
-
-        vrt_values_list = self.extend_list_end(test_sequence["VRT_VALUES"].to_list(), 0.0, 20)
-        parameters.append(("VRT_VALUES", vrt_values_list))
-        self.hil.set_matlab_variables(parameters)
+        for column in ["VRT_CONDITION", "VRT_START_TIMING", "VRT_END_TIMING", "VRT_VALUES"]:
+            parameters.append((column, test_sequence.get_padded(column, self.params["vector_size"]).tolist()))
+        self.set_matlab_variables(parameters)
 
     def set_phase_combination(self, phase):
         parameters = []
 
-        for ph in phase:
-            parameters.append((f"VRT_PH{ph}_ENABLE", 1.0))
-        self.hil.set_matlab_variables(parameters)
+        # the phases out of the combination are disabled explicitly since the previous combination may have enabled
+        # them (only the changed ones are sent)
+        for ph in ["A", "B", "C"]:
+            parameters.append((f"VRT_PH{ph}_ENABLE", 1.0 if ph in phase else 0.0))
+        self.set_matlab_variables(parameters)
 
     def set_wfm_file_header(self):
         self.wfm_header = ['TIME',
@@ -1948,82 +4960,18 @@ class VoltageRideThrough(HilModel, EutParameters, DataLogging):
         # Set useful variables
         mra_v_pu = self.MRA["V"] / self.v_nom
         RANGE_STEPS = self.params["range_steps"]
-        index = ['VRT_CONDITION', 'MIN_DURATION', 'VRT_VALUES']
-        TEST_CONDITION = {}
-        # each condition are set with a pandas series as follow:
-        # pd.Series([test condition, minimum duration(s), Residual Voltage (p.u.)], index=index)
-
-        # TABLE 4 - CATEGORY II LVRT TEST CONDITION
-        if CAT_2 in current_mode and LV in current_mode:
-            # The possible test conditions are ABCDD'EF
-            if RANGE_STEPS == "Figure":
-                # Using value of Figure 2 - CATEGORY II LVRT test signal
-                TEST_CONDITION["A"] = pd.Series([1, 10, 0.94], index=index)
-                TEST_CONDITION["B"] = pd.Series([2, 0.160, 0.3 - 2 * mra_v_pu], index=index)
-                TEST_CONDITION["C"] = pd.Series([3, 0.160, 0.45 - 2 * mra_v_pu], index=index)
-                TEST_CONDITION["D"] = pd.Series([4, 2.68, 0.65], index=index)
-                TEST_CONDITION["D'"] = pd.Series([4 + 10, 7.68, 0.67 + 2 * mra_v_pu], index=index)
-                TEST_CONDITION["E"] = pd.Series([5, 2.0, 0.88], index=index)
-                TEST_CONDITION["F"] = pd.Series([6, 120.0, 0.94], index=index)
-            elif RANGE_STEPS == "Random":
-                TEST_CONDITION["A"] = pd.Series([1, 10, random.uniform(0.88 + 2 * mra_v_pu, 1.0)], index=index)
-                TEST_CONDITION["B"] = pd.Series([2, 0.160, random.uniform(0.0, 0.3 - 2 * mra_v_pu)], index=index)
-                TEST_CONDITION["C"] = pd.Series([3, 0.160, random.uniform(0.0, 0.45 - 2 * mra_v_pu)], index=index)
-                TEST_CONDITION["D"] = pd.Series([4, 2.68, random.uniform(0.45 + 2 * mra_v_pu, 0.65 - 2 * mra_v_pu)],
-                                                index=index)
-                TEST_CONDITION["D'"] = pd.Series([4 + 10, 7.68, random.uniform(0.67, 0.88 - 2 * mra_v_pu)], index=index)
-                TEST_CONDITION["E"] = pd.Series([5, 2.0, random.uniform(0.65 + 2 * mra_v_pu, 0.88 - 2 * mra_v_pu)],
-                                                index=index)
-                TEST_CONDITION["F"] = pd.Series([6, 120.0, random.uniform(0.88 + 2 * mra_v_pu, 1.0)], index=index)
-
-        # TABLE 5 - CATEGORY III LVRT TEST CONDITION
-        elif CAT_3 in current_mode and LV in current_mode:
-            # The possible test conditions are ABCC'DE
-            if RANGE_STEPS == "Figure":
-                TEST_CONDITION["A"] = pd.Series([1, 5, 0.94], index=index)
-                TEST_CONDITION["B"] = pd.Series([2, 1, 0.05 - 2 * mra_v_pu], index=index)
-                TEST_CONDITION["C"] = pd.Series([3, 9, 0.5 - 2 * mra_v_pu], index=index)
-                TEST_CONDITION["C'"] = pd.Series([3 + 10, 9, 0.52 + 2 * mra_v_pu], index=index)
-                TEST_CONDITION["D"] = pd.Series([4, 10.0, 0.7], index=index)
-                TEST_CONDITION["E"] = pd.Series([5, 120.0, 0.94], index=index)
-            elif RANGE_STEPS == "Random":
-                TEST_CONDITION["A"] = pd.Series([1, 5, random.uniform(0.88 + 2 * mra_v_pu, 1.0)], index=index)
-                TEST_CONDITION["B"] = pd.Series([2, 1, random.uniform(0.0, 0.05 - 2 * mra_v_pu)], index=index)
-                TEST_CONDITION["C"] = pd.Series([3, 9, random.uniform(0.0, 0.5 - 2 * mra_v_pu)], index=index)
-                TEST_CONDITION["C'"] = pd.Series([3 + 10, 9, random.uniform(0.52, 0.7 - 2 * mra_v_pu)], index=index)
-                TEST_CONDITION["D"] = pd.Series([4, 10.0, random.uniform(0.5 + 2 * mra_v_pu, 0.7 - 2 * mra_v_pu)],
-                                                index=index)
-                TEST_CONDITION["E"] = pd.Series([5, 120.0, random.uniform(0.88 + 2 * mra_v_pu, 1.0)], index=index)
-
-        # TABLE 7 - CATEGORY II HVRT TEST CONDITION
-        elif CAT_2 in current_mode and HV in current_mode:
-            # ABCDE
-            if RANGE_STEPS == "Figure":
-                TEST_CONDITION["A"] = pd.Series([1, 10, 1.0], index=index)
-                TEST_CONDITION["B"] = pd.Series([2, 0.2, 1.2 - 2 * mra_v_pu], index=index)
-                TEST_CONDITION["C"] = pd.Series([3, 0.3, 1.175], index=index)
-                TEST_CONDITION["D"] = pd.Series([4, 0.5, 1.15], index=index)
-                TEST_CONDITION["E"] = pd.Series([5, 120.0, 1.0], index=index)
-            elif RANGE_STEPS == "Random":
-                TEST_CONDITION["A"] = pd.Series([1, 10, random.uniform(1.0, 1.1 - 2 * mra_v_pu)], index=index)
-                TEST_CONDITION["B"] = pd.Series([2, 0.2, random.uniform(1.18, 1.2)], index=index)
-                TEST_CONDITION["C"] = pd.Series([3, 0.3, random.uniform(1.155, 1.175)], index=index)
-                TEST_CONDITION["D"] = pd.Series([4, 0.5, random.uniform(1.13, 1.15)], index=index)
-                TEST_CONDITION["E"] = pd.Series([5, 120.0, random.uniform(1.0, 1.1 - 2 * mra_v_pu)], index=index)
-
-        # TABLE 8 - CATEGORY III HVRT TEST CONDITION
-        elif CAT_3 in current_mode and HV in current_mode:
-            # ABB'C
-            if RANGE_STEPS == "Figure":
-                TEST_CONDITION["A"] = pd.Series([1, 5, 1.05], index=index)
-                TEST_CONDITION["B"] = pd.Series([2, 12, 1.2 - 2 * mra_v_pu], index=index)
-                TEST_CONDITION["B'"] = pd.Series([2 + 10, 12, 1.12], index=index)
-                TEST_CONDITION["C"] = pd.Series([3, 120, 1.05], index=index)
-            elif RANGE_STEPS == "Random":
-                TEST_CONDITION["A"] = pd.Series([1, 5, random.uniform(1.0, 1.1 - 2 * mra_v_pu)], index=index)
-                TEST_CONDITION["B"] = pd.Series([2, 12, random.uniform(1.18, 1.2)], index=index)
-                TEST_CONDITION["B'"] = pd.Series([2 + 10, 12, random.uniform(1.12, 1.2)], index=index)
-                TEST_CONDITION["C"] = pd.Series([3, 120, random.uniform(1.0, 1.1 - 2 * mra_v_pu)], index=index)
+        # each condition is set as follow:
+        # (test condition, minimum duration(s), Residual Voltage (p.u.))
+        if RANGE_STEPS == "Figure":
+            TEST_CONDITION = get_vrt_conditions(current_mode, mra_v_pu)
+        elif RANGE_STEPS == "Random":
+            pool = self.get_sequence_pool(current_mode)
+            index = self.sequence_count[current_mode]
+            self.sequence_count[current_mode] += 1
+            self.ts.log(f'{current_mode} random profile {index} of {len(pool)} (seed {pool.seed})')
+            TEST_CONDITION = pool.get_conditions(index)
+        else:
+            raise p1547Error('Unknown ride-through profile %s' % RANGE_STEPS)
         '''
         Get the full test sequence :
         Example for CAT_2 + LV + Not Consecutive
@@ -2055,136 +5003,47 @@ class VoltageRideThrough(HilModel, EutParameters, DataLogging):
         just add the value 10.0. The value 12.0 is for B', 13 is for C' and so on.
         The idea is just to show this on the data.
         '''
-        test_sequences_df = self.get_test_sequence(current_mode, TEST_CONDITION)
+        return self.get_test_sequence(current_mode, TEST_CONDITION)
 
-        return test_sequences_df
+    def get_vrt_stop_time(self, test_sequence):
+        return test_sequence.get_stop_time()
 
-    def get_vrt_stop_time(self, test_sequences_df):
-        return test_sequences_df["VRT_END_TIMING"].iloc[-1]
+    def get_sessions(self, test_sequences, gap=10.0, size=20):
+        """
+        Group consecutive tests in timelines which fit in the vectors of the model, so each group is run in a single
+        load of the model
+        :param test_sequences:  list of the TestSequence of the tests
+        :param gap:             settling time between two tests (s)
+        :param size:            size of the VRT vectors of the model
+        :return: list of (list of the test numbers, TestSequence timeline)
+        """
+        sessions = []
+        tests = []
+        for k, sequence in enumerate(test_sequences):
+            if tests and len(TestSequence.join([test_sequences[i] for i in tests + [k]], gap)) > size:
+                sessions.append(tests)
+                tests = []
+            tests.append(k)
+        if tests:
+            sessions.append(tests)
+        return [(tests, TestSequence.join([test_sequences[i] for i in tests], gap)) for tests in sessions]
+
+    def get_sequence_pool(self, current_mode):
+        """
+        Random profiles of the mode, generated and validated the first time they are needed
+        """
+        if current_mode not in self.sequence_pools:
+            pool = VrtSequencePool(current_mode, self.MRA["V"] / self.v_nom, size=self.params["random_pool"],
+                                   seed=self.params["random_seed"])
+            self.ts.log(f'{len(pool)} random {current_mode} profiles generated with seed {pool.seed}')
+            self.sequence_pools[current_mode] = pool
+        return self.sequence_pools[current_mode]
 
     def get_test_sequence(self, current_mode, test_condition):
-        index = ['VRT_CONDITION', 'MIN_DURATION', 'VRT_VALUES']
         T0 = self.params["eut_startup_time"]
-        if self.params["consecutive_ena"] == "Enabled":
-            CONSECUTIVE = True
-        else:
-            CONSECUTIVE = False
-        test_sequences_df = pd.DataFrame(columns=index)
-        if CAT_2 in current_mode and LV in current_mode:
-            if CONSECUTIVE:
-                # ABCDE
-                test_sequences_df = test_sequences_df.append(test_condition["A"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["B"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["C"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["D"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["E"], ignore_index=True)
-                # ABCDEF
-                test_sequences_df = test_sequences_df.append(test_condition["A"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["B"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["C"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["D"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["E"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["F"], ignore_index=True)
-                # ABCD'F
-                test_sequences_df = test_sequences_df.append(test_condition["A"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["B"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["C"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["D'"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["F"], ignore_index=True)
-
-            else:
-                # ABCDEF 
-                test_sequences_df = test_sequences_df.append(test_condition["A"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["B"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["C"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["D"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["E"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["F"], ignore_index=True)
-        elif CAT_3 in current_mode and LV in current_mode:
-            if CONSECUTIVE:
-                # ABCD
-                test_sequences_df = test_sequences_df.append(test_condition["A"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["B"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["C"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["D"], ignore_index=True)
-                # ABCD
-                test_sequences_df = test_sequences_df.append(test_condition["A"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["B"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["C"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["D"], ignore_index=True)
-                # ABCDE
-                test_sequences_df = test_sequences_df.append(test_condition["A"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["B"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["C"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["D"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["E"], ignore_index=True)
-                # ABC'DE
-                test_sequences_df = test_sequences_df.append(test_condition["A"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["B"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["C'"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["D"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["E"], ignore_index=True)
-            else:
-                # ABCDE
-                test_sequences_df = test_sequences_df.append(test_condition["A"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["B"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["C"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["D"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["E"], ignore_index=True)
-        elif CAT_2 in current_mode and HV in current_mode:
-            if CONSECUTIVE:
-                # ABCD
-                test_sequences_df = test_sequences_df.append(test_condition["A"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["B"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["C"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["D"], ignore_index=True)
-
-                # ABCDE
-                test_sequences_df = test_sequences_df.append(test_condition["A"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["B"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["C"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["D"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["E"], ignore_index=True)
-            else:
-                test_sequences_df = test_sequences_df.append(test_condition["A"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["B"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["C"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["D"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["E"], ignore_index=True)
-                pass
-        elif CAT_3 in current_mode and HV in current_mode:
-            if CONSECUTIVE:
-                # AB
-                test_sequences_df = test_sequences_df.append(test_condition["A"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["B"], ignore_index=True)
-
-                # AB
-                test_sequences_df = test_sequences_df.append(test_condition["A"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["B"], ignore_index=True)
-
-                # ABC
-                test_sequences_df = test_sequences_df.append(test_condition["A"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["B"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["C"], ignore_index=True)
-
-                # AB'C
-                test_sequences_df = test_sequences_df.append(test_condition["A"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["B'"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["C"], ignore_index=True)
-            else:
-                test_sequences_df = test_sequences_df.append(test_condition["A"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["B"], ignore_index=True)
-                test_sequences_df = test_sequences_df.append(test_condition["C"], ignore_index=True)
-                pass
-
-        test_sequences_df.loc[0, 'VRT_START_TIMING'] = T0
-        # Calculate the timing sequences
-        test_sequences_df.loc[0, 'VRT_END_TIMING'] = T0 + test_sequences_df.loc[0, 'MIN_DURATION']
-        for i in range(1, len(test_sequences_df)):
-            test_sequences_df.loc[i, 'VRT_START_TIMING'] = test_sequences_df.loc[i - 1, 'VRT_END_TIMING']
-            test_sequences_df.loc[i, 'VRT_END_TIMING'] = test_sequences_df.loc[i, 'VRT_START_TIMING'] + \
-                                                         test_sequences_df.loc[i, 'MIN_DURATION']
-        return test_sequences_df
+        consecutive = self.params["consecutive_ena"] == "Enabled"
+        sequence = VRT_SEQUENCES[get_vrt_key(current_mode)][consecutive]
+        return TestSequence('VRT', test_condition, sequence, start_time=T0)
 
     def set_vrt_modes(self):
         modes = []
@@ -2240,7 +5099,8 @@ class FrequencyRideThrough(HilModel, EutParameters, DataLogging):
             self.params["lf_period"] = self.ts.param_value('frt.lf_period')
             self.params["hf_parameter"] = self.ts.param_value('frt.hf_parameter')
             self.params["hf_period"] = self.ts.param_value('frt.hf_period')
-            self.params["eut_startup_time"] = self.ts.param_value('eut.startup_time')
+            self.params["rocof"] = float(self.ts.param_value('frt.rocof') or 3.0)
+            self.params["eut_startup_time"] = get_eut_params(self.ts).startup_time
             # self.params["model_name"] = self.hil.rt_lab_model
 
         except Exception as e:
@@ -2265,24 +5125,19 @@ class FrequencyRideThrough(HilModel, EutParameters, DataLogging):
     def set_test_conditions(self, current_mode):
         # Set useful variables
         mra_f = self.MRA["F"]
-        index = ['FRT_CONDITION', 'MIN_DURATION', 'FRT_VALUES']
         TEST_CONDITION = {}
         # Test Procedure 5.5.3.4
         if LFRT in current_mode:
-            TEST_CONDITION["Step E"] = pd.Series([1, 1, self.f_nom], index=index)
-            TEST_CONDITION["Step G"] = pd.Series([2, self.params["lf_period"], self.params["lf_parameter"]],
-                                                 index=index)
-            TEST_CONDITION["Step H"] = pd.Series([1, 1, self.f_nom], index=index)
+            TEST_CONDITION["Step E"] = (1, 1, self.f_nom)
+            TEST_CONDITION["Step G"] = (2, self.params["lf_period"], self.params["lf_parameter"])
+            TEST_CONDITION["Step H"] = (1, 1, self.f_nom)
 
         # TABLE 5 - CATEGORY III LVRT TEST CONDITION
         elif HFRT in current_mode:
-            TEST_CONDITION["Step E"] = pd.Series([1, 1, self.f_nom], index=index)
-            TEST_CONDITION["Step G"] = pd.Series([2, self.params["hf_period"], self.params["hf_parameter"]],
-                                                 index=index)
-            TEST_CONDITION["Step H"] = pd.Series([1, 1, self.f_nom], index=index)
-        test_sequences_df = self.get_test_sequence(current_mode, TEST_CONDITION)
-
-        return test_sequences_df
+            TEST_CONDITION["Step E"] = (1, 1, self.f_nom)
+            TEST_CONDITION["Step G"] = (2, self.params["hf_period"], self.params["hf_parameter"])
+            TEST_CONDITION["Step H"] = (1, 1, self.f_nom)
+        return self.get_test_sequence(current_mode, TEST_CONDITION)
 
     def set_frt_model_parameters(self, test_sequence):
 
@@ -2290,18 +5145,9 @@ class FrequencyRideThrough(HilModel, EutParameters, DataLogging):
         # Enable FRT mode in the IEEE1547_fast_functions model
         parameters.append(("MODE", 4.0))
 
-        condition_list = self.extend_list_end(test_sequence["FRT_CONDITION"].to_list(), 0.0, 4)
-        parameters.append(("FRT_CONDITION", condition_list))
-
-        start_timing_list = self.extend_list_end(test_sequence["FRT_START_TIMING"].to_list(), 0.0, 4)
-        parameters.append(("FRT_START_TIMING", start_timing_list))
-
-        end_timing_list = self.extend_list_end(test_sequence["FRT_END_TIMING"].to_list(), 0.0, 4)
-        parameters.append(("FRT_END_TIMING", end_timing_list))
-
-        values_list = self.extend_list_end(test_sequence["FRT_VALUES"].to_list(), 0.0, 4)
-        parameters.append(("FRT_VALUES", values_list))
-        self.hil.set_matlab_variables(parameters)
+        for column in ["FRT_CONDITION", "FRT_START_TIMING", "FRT_END_TIMING", "FRT_VALUES"]:
+            parameters.append((column, test_sequence.get_padded(column, 4).tolist()))
+        self.set_matlab_variables(parameters)
 
     """
     Getter functions
@@ -2309,29 +5155,16 @@ class FrequencyRideThrough(HilModel, EutParameters, DataLogging):
 
     def get_rocof_dic(self, ):
         params = {"ROCOF_ENABLE": 1.0,
-                  "ROCOF_VALUE": 3.0,
-                  "ROCOF_INIT": 60.0}
+                  "ROCOF_VALUE": self.params["rocof"],
+                  "ROCOF_INIT": self.f_nom}
         return params
 
     def get_test_sequence(self, current_mode, test_condition):
-        index = ['FRT_CONDITION', 'MIN_DURATION', 'FRT_VALUES']
         T0 = self.params["eut_startup_time"]
-        test_sequences_df = pd.DataFrame(columns=index)
-        test_sequences_df = test_sequences_df.append(test_condition["Step E"], ignore_index=True)
-        test_sequences_df = test_sequences_df.append(test_condition["Step G"], ignore_index=True)
-        test_sequences_df = test_sequences_df.append(test_condition["Step H"], ignore_index=True)
-
-        test_sequences_df.loc[0, 'FRT_START_TIMING'] = T0
-        # Calculate the timing sequences
-        test_sequences_df.loc[0, 'FRT_END_TIMING'] = T0 + test_sequences_df.loc[0, 'MIN_DURATION']
-        for i in range(1, len(test_sequences_df)):
-            test_sequences_df.loc[i, 'FRT_START_TIMING'] = test_sequences_df.loc[i - 1, 'FRT_END_TIMING']
-            test_sequences_df.loc[i, 'FRT_END_TIMING'] = test_sequences_df.loc[i, 'FRT_START_TIMING'] + \
-                                                         test_sequences_df.loc[i, 'MIN_DURATION']
-        return test_sequences_df
-
-    def get_frt_stop_time(self, test_sequences_df):
-        return test_sequences_df["FRT_END_TIMING"].iloc[-1]
+        return TestSequence('FRT', test_condition, FRT_SEQUENCE, start_time=T0)
+
+    def get_frt_stop_time(self, test_sequence):
+        return test_sequence.get_stop_time()
 
     def get_modes(self):
         return self.params["modes"]
@@ -2339,10 +5172,629 @@ class FrequencyRideThrough(HilModel, EutParameters, DataLogging):
     def get_wfm_file_header(self):
         return self.wfm_header
 
-    def extend_list_end(self, _list, extend_value, final_length):
-        list_length = len(_list)
-        _list.extend([float(extend_value)] * (final_length - list_length))
-        return _list
+
+"""
+This section is for the Unintentional islanding test
+"""
+
+# file names of the waveforms saved by UI.py, UI_Test_<test number>_Q<reactive power increment>.csv
+UI_WAVEFORM_FILE = re.compile(r'UI_Test_(\d+)_Q(-?[\d.]+?)\.csv$')
+
+# control signals of the unintentional islanding model (index in the vector of the console)
+UI_CONTROL_SIGNALS = OrderedDict([
+    ('TEST_NUM', 0),
+    ('SUBTEST_NUM', 1),
+    ('ISLANDING_TEST', 2),  # S3 open
+    ('AMETEK_OUTPUT', 3),  # amplifier energized
+    ('INV_VLL', 4),
+    ('INV_VAMAX', 5),
+    ('V_TRANS_GAIN', 6),
+    ('PHASE_COMP', 7),
+    ('RES_POT', 8),
+    ('RES_MAN_TEST', 9),
+    ('PR_CUSTOM_TEST', 10),
+    ('RINT_POT', 11),
+    ('RINT_MAN_TEST', 12),
+    ('PL_CUSTOM_TEST', 13),
+    ('IND_POT', 14),
+    ('IND_MAN_TEST', 15),
+    ('QL_CUSTOM_TEST', 16),
+    ('CAP_POT', 17),
+    ('CAP_MAN_TEST', 18),
+    ('QC_CUSTOM_TEST', 19),
+])
+
+
+class IslandingClearingTime(object):
+    """
+    Clearing time of the unintentional islanding test (5.10.2 e) 3)) from the captured waveforms: the time from the
+    opening of S3 to when the instantaneous voltages and EUT currents of the island drop and remain below level
+    (0.05 p.u.). It is the time after the last sample above the level, found with one mask over the capture, so the
+    result does not depend on the trip time measured by the model and can be derived again offline.
+
+    The opening of S3 is the first change of the s3_point channel. Without it, the capture is the one of the
+    OpWriteFile trigger and S3 opens pre_trigger seconds after its start. The p.u. base of the voltage and current is
+    their RMS value over the cycles before the opening, unless v_nom and i_nom are given. The island frequency is
+    measured between the opening and the clearing with FrequencyTracker.
+    """
+    def __init__(self, v_nom=None, i_nom=None, f_nom=60.0, level=0.05, max_clearing=2.0, pre_trigger=2.5,
+                 v_points=None, i_points=None, s3_point='TRIGGER', time_point='TIME'):
+        """
+        :param v_nom:           nominal RMS voltage (V), default the voltage before the opening of S3
+        :param i_nom:           rated RMS current of the EUT (A), default the current before the opening of S3
+        :param f_nom:           nominal frequency (Hz)
+        :param level:           level of the voltage and current after the clearing (p.u.)
+        :param max_clearing:    maximum clearing time (s)
+        :param pre_trigger:     capture before the opening of S3 when there is no s3_point channel (s)
+        :param v_points:        voltage channels of the island, default AC_V_1, AC_V_2, AC_V_3
+        :param i_points:        current channels of the EUT, default AC_I_1, AC_I_2, AC_I_3
+        :param s3_point:        channel of the state of S3 or of the trigger of the capture
+        :param time_point:      name of the simulation time column
+        """
+        self.v_nom = v_nom
+        self.i_nom = i_nom
+        self.f_nom = float(f_nom)
+        self.level = level
+        self.max_clearing = max_clearing
+        self.pre_trigger = pre_trigger
+        self.v_points = v_points or ['AC_V_1', 'AC_V_2', 'AC_V_3']
+        self.i_points = i_points or ['AC_I_1', 'AC_I_2', 'AC_I_3']
+        self.s3_point = s3_point
+        self.time_point = time_point
+
+    def get_channels(self, ds, points, valid):
+        columns = [RideThroughEvaluator.get_column(ds, name) for name in points]
+        columns = [column[valid] for column in columns if column is not None]
+        if not columns:
+            raise p1547Error('Channels %s are missing from the waveforms' % points)
+        return np.nan_to_num(np.vstack(columns))
+
+    def get_open_index(self, ds, time, valid):
+        """
+        :return: index of the first sample after the opening of S3
+        """
+        s3 = RideThroughEvaluator.get_column(ds, self.s3_point)
+        if s3 is None:
+            return int(np.searchsorted(time, time[0] + self.pre_trigger))
+        s3 = np.nan_to_num(s3[valid])
+        changed = np.flatnonzero(np.abs(s3 - s3[0]) > 0.5 * np.ptp(s3)) if np.ptp(s3) > 0 else []
+        if len(changed) == 0:
+            raise p1547Error('S3 does not open during the capture (%s does not change)' % self.s3_point)
+        return int(changed[0])
+
+    def get_peak(self, values, nominal, time, open_index):
+        # peak of the nominal RMS value, or of the RMS value of the (up to 10) cycles before the opening
+        if nominal:
+            return float(nominal) * np.sqrt(2)
+        start = np.searchsorted(time, time[open_index] - 10. / self.f_nom) if open_index else 0
+        before = values[:, start:open_index]
+        if before.size == 0:
+            raise p1547Error('No samples before the opening of S3 to set the p.u. base')
+        return np.sqrt(np.mean(before * before, axis=1)).max() * np.sqrt(2)
+
+    def evaluate(self, ds, name=None):
+        """
+        :param ds:      waveforms, pandas DataFrame, dict of columns or dataset with the 'points' names and the 'data'
+                        columns
+        :param name:    name of the test
+        :return: OrderedDict with the opening of S3, the clearing time, the island frequency and the verdict
+        """
+        time = RideThroughEvaluator.get_column(ds, self.time_point)
+        if time is None:
+            raise p1547Error('Column %s is missing from the waveforms' % self.time_point)
+        valid = ~np.isnan(time)
+        time = time[valid]
+        v = self.get_channels(ds, self.v_points, valid)
+        i = self.get_channels(ds, self.i_points, valid)
+        open_index = self.get_open_index(ds, time, valid)
+        v_peak = self.get_peak(v, self.v_nom, time, open_index)
+        i_peak = self.get_peak(i, self.i_nom, time, open_index)
+
+        energized = ((np.abs(v[:, open_index:]) > self.level * v_peak).any(axis=0) |
+                     (np.abs(i[:, open_index:]) > self.level * i_peak).any(axis=0))
+        last = np.flatnonzero(energized)
+        open_time = time[open_index] if open_index < time.size else np.nan
+        cleared = last.size == 0 or open_index + last[-1] + 1 < time.size
+        clear_index = open_index + (last[-1] + 1 if last.size else 0)
+        clearing = time[clear_index] - open_time if cleared else np.nan
+
+        tracker = FrequencyTracker(v_peak / np.sqrt(2), self.f_nom)
+        _, freq = tracker.get_frequency(time[open_index:clear_index], v[:, open_index:clear_index].T)
+
+        row = OrderedDict([('TEST', name),
+                           ('S3_OPEN_TIME', open_time),
+                           ('CLEARING_TIME', clearing),
+                           ('ISLAND_FREQ', freq.mean() if freq.size else np.nan),
+                           ('V_BASE', v_peak / np.sqrt(2)),
+                           ('I_BASE', i_peak / np.sqrt(2)),
+                           ('CLEARED', bool(cleared)),
+                           ('RESULT', 'Pass' if cleared and clearing <= self.max_clearing else 'Fail')])
+        return row
+
+    def evaluate_files(self, filenames):
+        """
+        :param filenames:   csv files of the waveforms, e.g. the UI_Test_*_Q*.csv files of the UI tests
+        :return: pandas DataFrame with one row per file, with the test number and reactive power increment taken
+                 from the UI file names
+        """
+        rows = []
+        for filename in sorted(filenames):
+            ds = pd.read_csv(filename)
+            ds.columns = ds.columns.str.strip()
+            row = OrderedDict([('FILE', filename)])
+            match = UI_WAVEFORM_FILE.search(os.path.basename(filename))
+            row['TEST_NUM'] = int(match.group(1)) if match else None
+            row['Q_INC'] = float(match.group(2)) if match else None
+            row.update(self.evaluate(ds, name=os.path.splitext(os.path.basename(filename))[0]))
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+
+class RlcBalancer(object):
+    """
+    Secant (Broyden) solver of the RLC load tuning of the unintentional islanding test: it finds the resistor and
+    capacitor pots that bring the active and reactive power through S3 (AC_P_S3_PU, AC_Q_S3_PU) within tolerance.
+
+    The inverse of the sensitivity of the S3 powers to the pots starts from the proportional gains of the load bank
+    (pot % per p.u. of S3 power), scaled by damping, and is corrected with a rank-1 update from every new pair of pot
+    settings and measured powers. It also learns the coupling of the pots (the resistors change Q through the
+    voltage, the capacitors change P), so the tuning usually converges in a few steps instead of the slow geometric
+    approach of fixed gains. The number of iterations and the time to balance are logged when done.
+    """
+    def __init__(self, ts, gains, damping=0.5, tolerance=0.02, max_step=None, lower=None, upper=None):
+        """
+        :param ts:          test script object, ts.log() is used for the metrics
+        :param gains:       change of the resistor and capacitor pots (%) per p.u. of S3 active and reactive power
+        :param damping:     fraction of the gains used for the first step
+        :param tolerance:   balance tolerance of the S3 active and reactive powers (p.u.)
+        :param max_step:    largest change of a pot in one step (%), the step is scaled down to it
+        :param lower:       lowest resistor and capacitor pot settings (%)
+        :param upper:       highest resistor and capacitor pot settings (%)
+        """
+        self.ts = ts
+        self.gains = np.asarray(gains, dtype=float)
+        self.damping = damping
+        self.tolerance = tolerance
+        self.max_step = max_step
+        self.lower = lower
+        self.upper = upper
+        self.clock = getattr(ts, 'clock', None) or SystemClock()
+        self.reset()
+
+    def reset(self):
+        # inverse sensitivity: pot change (%) = -h . S3 power (p.u.)
+        self.h = -self.damping * np.diag(self.gains)
+        self.x = None
+        self.y = None
+        self.iterations = 0
+        self.start_ns = self.clock.monotonic_ns()
+        self.balance_time = None
+
+    def is_balanced(self, ps3_pu, qs3_pu):
+        return abs(ps3_pu) < self.tolerance and abs(qs3_pu) < self.tolerance
+
+    def update(self, x, y):
+        """
+        Good Broyden update of the inverse sensitivity with the change from the previous pair, skipped when the step
+        or the change of the powers is too small to carry information.
+        """
+        if self.x is None:
+            return
+        dx = x - self.x
+        dy = y - self.y
+        if np.abs(dx).max() < 1e-9:
+            return
+        h_dy = self.h.dot(dy)
+        denominator = dx.dot(h_dy)
+        if abs(denominator) < 1e-12 * max(dx.dot(dx), 1e-12):
+            return
+        self.h += np.outer(dx - h_dy, dx.dot(self.h)) / denominator
+
+    def step(self, r_set, c_set, ps3_pu, qs3_pu):
+        """
+        :param r_set:       resistor pot setting (%) of the measurement
+        :param c_set:       capacitor pot setting (%) of the measurement
+        :param ps3_pu:      active power through S3 (p.u.)
+        :param qs3_pu:      reactive power through S3 (p.u.)
+        :return: next resistor and capacitor pot settings (%)
+        """
+        x = np.array([r_set, c_set], dtype=float)
+        y = np.array([ps3_pu, qs3_pu], dtype=float)
+        self.update(x, y)
+        self.x = x
+        self.y = y
+        dx = -self.h.dot(y)
+        if self.max_step is not None and np.abs(dx).max() > self.max_step:
+            dx *= self.max_step / np.abs(dx).max()
+        x_next = x + dx
+        if self.lower is not None or self.upper is not None:
+            x_next = np.clip(x_next, self.lower, self.upper)
+        self.iterations += 1
+        self.ts.log_debug('RLC balance step %d: S3 P = %0.4f pu, Q = %0.4f pu, R pot %0.3f%% -> %0.3f%%, '
+                          'C pot %0.3f%% -> %0.3f%%' % (self.iterations, ps3_pu, qs3_pu, r_set, x_next[0],
+                                                        c_set, x_next[1]))
+        return x_next[0], x_next[1]
+
+    def done(self):
+        """
+        Log the metrics of the tuning when the load is balanced.
+
+        :return: time to balance (s)
+        """
+        self.balance_time = (self.clock.monotonic_ns() - self.start_ns) / 1e9
+        self.ts.log('RLC load balanced in %d iterations, time to balance = %0.1f s' %
+                    (self.iterations, self.balance_time))
+        return self.balance_time
+
+
+class ClearingTimeSearch(object):
+    """
+    Search of the longest clearing time of the unintentional islanding test over the 1% reactive load settings
+    (5.10.2 e) 4)), used in place of the full sweep from 95% to 105%.
+
+    The clearing time is taken as unimodal in the reactive load setting. The search starts at 100% and keeps the
+    bracket of the settings between the longest clearing time found so far and its nearest shorter ones. The next
+    setting is the vertex of the parabola through the longest clearing time and its two neighbors when it falls in
+    the bracket, else the golden-section point of the wider side of the bracket. The bracket is extended beyond 95%
+    or 105% in 1% steps while the clearing time is still increasing at the limit, as required by the standard, and
+    the search ends when the settings on both sides of the longest clearing time were run.
+
+    Use next() to get the setting to run and tell() to give its clearing time, until next() returns None.
+    """
+    golden = (3. - 5. ** 0.5) / 2.
+
+    def __init__(self, ts, q_min=0.95, q_max=1.05, q_start=1.0, max_extension=10):
+        """
+        :param ts:              test script object, ts.log() is used for the summary
+        :param q_min:           lowest reactive load setting of the standard sweep (p.u.)
+        :param q_max:           highest reactive load setting of the standard sweep (p.u.)
+        :param q_start:         first reactive load setting (p.u.)
+        :param max_extension:   largest number of 1% steps run beyond q_min or q_max
+        """
+        self.ts = ts
+        self.k_min = int(round(q_min * 100))
+        self.k_max = int(round(q_max * 100))
+        self.k_start = int(round(q_start * 100))
+        self.k_lower = self.k_min - max_extension
+        self.k_upper = self.k_max + max_extension
+        self.lo = self.k_min
+        self.hi = self.k_max
+        self.t_trips = OrderedDict()
+
+    @staticmethod
+    def to_q(k):
+        return round(k / 100., 2)
+
+    def tell(self, q_inc, t_trip):
+        """
+        :param q_inc:   reactive load setting that was run (p.u.)
+        :param t_trip:  its clearing time (s)
+        """
+        self.t_trips[int(round(q_inc * 100))] = float(t_trip)
+
+    def get_peak(self):
+        """
+        :return: setting of the longest clearing time and the nearest settings run on each side (None if none)
+        """
+        k_peak = max(self.t_trips, key=lambda k: (self.t_trips[k], -abs(k - self.k_start)))
+        left = [k for k in self.t_trips if k < k_peak]
+        right = [k for k in self.t_trips if k > k_peak]
+        return k_peak, (max(left) if left else None), (min(right) if right else None)
+
+    def get_bracket(self, k_peak, left, right):
+        """
+        :return: settings between which the longest clearing time is, as a range of 1% steps
+        """
+        # still increasing at a limit of the sweep, take one more 1% step
+        if k_peak == self.lo and left is None:
+            self.lo = max(self.lo - 1, self.k_lower)
+        if k_peak == self.hi and right is None:
+            self.hi = min(self.hi + 1, self.k_upper)
+        t_peak = self.t_trips[k_peak]
+        if left is None:
+            a = self.lo
+        else:
+            a = left + 1 if self.t_trips[left] < t_peak else left
+        if right is None:
+            b = self.hi
+        else:
+            b = right - 1 if self.t_trips[right] < t_peak else right
+        return a, b
+
+    def get_vertex(self, k_peak, left, right):
+        """
+        :return: setting of the vertex of the parabola through the peak and its neighbors, None if it is not a maximum
+        """
+        if left is None or right is None:
+            return None
+        t_left, t_peak, t_right = self.t_trips[left], self.t_trips[k_peak], self.t_trips[right]
+        d_left = (k_peak - left) * (t_peak - t_right)
+        d_right = (k_peak - right) * (t_peak - t_left)
+        denominator = d_left - d_right
+        if denominator <= 0:
+            return None
+        return int(round(k_peak - 0.5 * ((k_peak - left) * d_left - (k_peak - right) * d_right) / denominator))
+
+    def next(self):
+        """
+        :return: next reactive load setting to run (p.u.), None when the longest clearing time is found
+        """
+        if not self.t_trips:
+            return self.to_q(self.k_start)
+        k_peak, left, right = self.get_peak()
+        a, b = self.get_bracket(k_peak, left, right)
+        candidates = [k for k in range(a, b + 1) if k not in self.t_trips]
+        if not candidates:
+            return None
+        k = self.get_vertex(k_peak, left, right)
+        if k not in candidates:
+            # golden-section point of the wider side of the bracket
+            if k_peak - a >= b - k_peak:
+                k = k_peak - max(int(round(self.golden * (k_peak - a + 1))), 1)
+            else:
+                k = k_peak + max(int(round(self.golden * (b - k_peak + 1))), 1)
+            if k not in candidates:
+                k = min(candidates, key=lambda c: abs(c - k_peak))
+        return self.to_q(k)
+
+    def get_longest(self, n=3):
+        """
+        :param n:   number of clearing times
+        :return: reactive load settings from the lowest to the highest of the n longest clearing times, including
+                 the settings in between when they are not consecutive (5.10.2 e) 5))
+        """
+        longest = sorted(self.t_trips, key=lambda k: self.t_trips[k], reverse=True)[:n]
+        return [self.to_q(k) for k in range(min(longest), max(longest) + 1)] if longest else []
+
+    def get_avoided(self):
+        """
+        :return: number of islanding events of the full 1% sweep over the same settings that were not run
+        """
+        return (max(self.hi, self.k_max) - min(self.lo, self.k_min) + 1) - len(self.t_trips)
+
+    def log_summary(self):
+        k_peak = self.get_peak()[0] if self.t_trips else None
+        self.ts.log('Reactive load search: %d islanding events run, %d avoided compared with the 1%% sweep from '
+                    '%0.2f to %0.2f, longest clearing time %s s at %s' %
+                    (len(self.t_trips), self.get_avoided(), self.to_q(min(self.lo, self.k_min)),
+                     self.to_q(max(self.hi, self.k_max)),
+                     None if k_peak is None else '%0.4f' % self.t_trips[k_peak],
+                     None if k_peak is None else '%0.2f' % self.to_q(k_peak)))
+
+
+# default trip settings of the EUT for the island simulation (IEEE 1547-2018 Category II): quantity, '>' or '<',
+# limit (p.u. of the nominal voltage or frequency) and clearing time (s)
+UI_TRIP_SETTINGS = OrderedDict([
+    ('OV2', ('V', '>', 1.20, 0.16)),
+    ('OV1', ('V', '>', 1.10, 2.0)),
+    ('UV1', ('V', '<', 0.70, 10.0)),
+    ('UV2', ('V', '<', 0.45, 0.16)),
+    ('OF2', ('F', '>', 62.0 / 60., 0.16)),
+    ('OF1', ('F', '>', 61.2 / 60., 300.0)),
+    ('UF1', ('F', '<', 58.5 / 60., 300.0)),
+    ('UF2', ('F', '<', 56.5 / 60., 0.16)),
+])
+
+
+def expm(a, terms=12):
+    """
+    Matrix exponential of a stack of matrices (scaling and squaring of the Taylor series)
+    :param a:       array of shape (..., n, n)
+    :param terms:   number of terms of the Taylor series
+    :return: array of shape (..., n, n)
+    """
+    a = np.asarray(a)
+    norm = np.abs(a).sum(axis=-1).max() if a.size else 0.
+    squarings = max(int(np.ceil(np.log2(norm))) + 1, 0) if norm > 0 else 0
+    a = a / 2. ** squarings
+    term = np.broadcast_to(np.eye(a.shape[-1], dtype=a.dtype), a.shape).copy()
+    result = term.copy()
+    for k in range(1, terms + 1):
+        term = np.matmul(term, a) / k
+        result += term
+    for _ in range(squarings):
+        result = np.matmul(result, result)
+    return result
+
+
+class IslandSimulator(object):
+    """
+    Offline simulation of the island of the unintentional islanding test, to find before the PHIL runs which
+    reactive load settings (q_inc) sustain the island and for how long.
+
+    The island is the parallel RLC load of a test case of Table 13 or Table 14 (test_params of UI.py) fed by the EUT
+    as a current source synchronized to the island voltage by a PLL, in per unit of the EUT rating on a frame
+    rotating at the nominal frequency. The load is balanced as in step c): R absorbs p_eut, L absorbs ql and C is
+    set so QS3 = 0, then scaled by q_inc. The circuit of every q_inc, and of every PS3/QS3 mismatch allowed by the
+    balance tolerance, is integrated at once: the linear RLC part with its exact discretization (one matrix
+    exponential per variant) and the PLL with forward Euler steps.
+
+    The EUT trips when a limit of trip_settings is exceeded for its clearing time, after S3 opens at t = 0. The
+    optional Sandia frequency shift (sfs_gain) shifts the current angle with the frequency error as an active
+    anti-islanding method; without it only the passive protection is simulated, so a balanced island usually lasts
+    the whole duration. The clearing time of a sustained island is inf.
+    """
+    def __init__(self, f_nom=60.0, duration=3.0, step=1e-4, pll_bandwidth=10.0, sfs_gain=0., tolerance=0.02,
+                 trip_settings=None):
+        """
+        :param f_nom:           nominal frequency (Hz)
+        :param duration:        simulated time after the opening of S3 (s)
+        :param step:            integration step (s)
+        :param pll_bandwidth:   natural frequency of the PLL of the EUT (Hz)
+        :param sfs_gain:        angle of the EUT current per p.u. of frequency error (rad), 0 for no active method
+        :param tolerance:       PS3 and QS3 balance tolerance of step c) (p.u.), the mismatches simulated for the
+                                clearing time envelope
+        :param trip_settings:   trip settings as UI_TRIP_SETTINGS, default UI_TRIP_SETTINGS
+        """
+        self.f_nom = float(f_nom)
+        self.duration = duration
+        self.step = step
+        self.pll_bandwidth = pll_bandwidth
+        self.sfs_gain = sfs_gain
+        self.tolerance = tolerance
+        self.trip_settings = trip_settings or UI_TRIP_SETTINGS
+
+    def get_circuit(self, test_params, q_incs, p_mismatch=0., q_mismatch=0.):
+        """
+        :param test_params:     test case of Table 13 or Table 14 with p_eut, q_eut and ql (p.u.)
+        :param q_incs:          reactive load settings (p.u. of the balanced capacitive load)
+        :param p_mismatch:      PS3 before the opening of S3 (p.u.), scalar or array
+        :param q_mismatch:      QS3 before the opening of S3 (p.u.), scalar or array
+        :return: conductance, capacitor and inductor susceptances at f_nom and EUT current of the variants (p.u.)
+        """
+        q_incs, p_mismatch, q_mismatch = np.broadcast_arrays(np.asarray(q_incs, dtype=float),
+                                                             np.asarray(p_mismatch, dtype=float),
+                                                             np.asarray(q_mismatch, dtype=float))
+        p_eut = float(test_params['p_eut'])
+        q_eut = float(test_params['q_eut'])
+        b_l = abs(float(test_params['ql']))
+        b_c = b_l - q_eut
+        if p_eut <= 0 or b_c <= 0:
+            raise p1547Error('No balanced RLC load for p_eut = %s, q_eut = %s and ql = %s' %
+                             (p_eut, q_eut, test_params['ql']))
+        g = p_eut - p_mismatch
+        b_c = b_c * q_incs - q_mismatch
+        if (g <= 0).any() or (b_c <= 0).any():
+            raise p1547Error('The reactive load settings or mismatches leave no resistive or capacitive load')
+        current = np.full(q_incs.shape, p_eut - 1j * q_eut)
+        return g, b_c, np.full(q_incs.shape, b_l), current
+
+    def get_transition(self, g, b_c, b_l):
+        """
+        :return: transition matrices of the island state (v, i_l) and of the EUT current over one step
+        """
+        w0 = 2 * np.pi * self.f_nom
+        n = len(g)
+        m = np.zeros((n, 3, 3), dtype=complex)
+        m[:, 0, 0] = -w0 * g / b_c - 1j * w0
+        m[:, 0, 1] = -w0 / b_c
+        m[:, 0, 2] = w0 / b_c
+        m[:, 1, 0] = w0 * b_l
+        m[:, 1, 1] = -1j * w0
+        e = expm(m * self.step)
+        return e[:, :2, :2], e[:, :2, 2]
+
+    def simulate(self, test_params, q_incs, p_mismatch=0., q_mismatch=0.):
+        """
+        :param test_params:     test case of Table 13 or Table 14 (p_eut, q_eut, ql)
+        :param q_incs:          reactive load settings (p.u.), one variant each
+        :param p_mismatch:      PS3 of the variants before the opening of S3 (p.u.)
+        :param q_mismatch:      QS3 of the variants before the opening of S3 (p.u.)
+        :return: DataFrame with one row per variant: Q_INC, PS3, QS3, CLEARING_TIME (inf when the island lasted
+                 the duration), TRIP (trip setting), F_ISLAND (Hz) and V_ISLAND (p.u.) at the trip or at the end
+        """
+        g, b_c, b_l, current = self.get_circuit(test_params, q_incs, p_mismatch, q_mismatch)
+        q_incs, p_mismatch, q_mismatch = np.broadcast_arrays(np.asarray(q_incs, dtype=float),
+                                                             np.asarray(p_mismatch, dtype=float),
+                                                             np.asarray(q_mismatch, dtype=float))
+        g, b_c, b_l, current = [x.ravel() for x in (g, b_c, b_l, current)]
+        n = len(g)
+        phi, gamma = self.get_transition(g, b_c, b_l)
+
+        # grid connected steady state before the opening of S3
+        v = np.ones(n, dtype=complex)
+        i_l = -1j * b_l
+        delta = np.zeros(n)
+        w_int = np.zeros(n)
+        dw = np.zeros(n)
+        w_n = 2 * np.pi * self.pll_bandwidth
+        kp = 2 * 0.707 * w_n
+        ki = w_n ** 2
+        w0 = 2 * np.pi * self.f_nom
+
+        names = list(self.trip_settings)
+        settings = [self.trip_settings[name] for name in names]
+        timers = np.zeros((len(settings), n))
+        clearing_time = np.full(n, np.inf)
+        trip = np.full(n, '', dtype=object)
+        f_island = np.full(n, np.nan)
+        v_island = np.full(n, np.nan)
+        running = np.ones(n, dtype=bool)
+
+        steps = int(round(self.duration / self.step))
+        for k in range(1, steps + 1):
+            i_eut = current * np.exp(1j * (delta + self.sfs_gain * dw / w0))
+            v, i_l = (phi[:, 0, 0] * v + phi[:, 0, 1] * i_l + gamma[:, 0] * i_eut,
+                      phi[:, 1, 0] * v + phi[:, 1, 1] * i_l + gamma[:, 1] * i_eut)
+            v_mag = np.abs(v)
+            error = (v * np.exp(-1j * delta)).imag / np.maximum(v_mag, 0.05)
+            w_int += ki * error * self.step
+            dw = kp * error + w_int
+            delta += dw * self.step
+            f_pu = 1. + dw / w0
+            for s, (quantity, comparison, limit, t_clear) in enumerate(settings):
+                value = v_mag if quantity == 'V' else f_pu
+                exceeded = value > limit if comparison == '>' else value < limit
+                timers[s] = np.where(exceeded, timers[s] + self.step, 0.)
+                tripped = running & (timers[s] >= t_clear - 1e-9)
+                if tripped.any():
+                    clearing_time[tripped] = k * self.step
+                    trip[tripped] = names[s]
+                    f_island[tripped] = f_pu[tripped] * self.f_nom
+                    v_island[tripped] = v_mag[tripped]
+                    running &= ~tripped
+            if not running.any():
+                break
+        f_island[running] = f_pu[running] * self.f_nom
+        v_island[running] = v_mag[running]
+
+        return pd.DataFrame(OrderedDict([
+            ('Q_INC', q_incs.ravel()),
+            ('PS3', p_mismatch.ravel()),
+            ('QS3', q_mismatch.ravel()),
+            ('CLEARING_TIME', clearing_time),
+            ('TRIP', trip),
+            ('F_ISLAND', f_island),
+            ('V_ISLAND', v_island),
+        ]))
+
+    def prescreen(self, test_params, q_incs=None):
+        """
+        Simulate every reactive load setting with the PS3 and QS3 mismatches -tolerance, 0 and +tolerance.
+
+        :param test_params:     test case of Table 13 or Table 14 (p_eut, q_eut, ql, qf)
+        :param q_incs:          reactive load settings (p.u.), default 0.95 to 1.05 in 1% steps
+        :return: DataFrame with one row per setting: Q_INC, F_ISLAND and V_ISLAND of the balanced island, TRIP of
+                 the balanced island, T_MIN and T_MAX (clearing time envelope, s), SUSTAINED (fraction of the
+                 variants which lasted the duration), QF (quality factor of the load) and PRIORITY (1 = longest
+                 expected clearing time, the settings to run first)
+        """
+        if q_incs is None:
+            q_incs = np.round(np.arange(0.95, 1.055, 0.01), 2)
+        q_incs = np.asarray(q_incs, dtype=float)
+        mismatches = np.array([-self.tolerance, 0., self.tolerance])
+        q, p_mis, q_mis = np.meshgrid(q_incs, mismatches, mismatches, indexing='ij')
+        results = self.simulate(test_params, q.ravel(), p_mis.ravel(), q_mis.ravel())
+        results['VARIANT'] = np.repeat(np.arange(len(q_incs)), len(mismatches) ** 2)
+        by_variant = results.groupby('VARIANT', sort=True)
+        balanced = results[(results['PS3'] == 0.) & (results['QS3'] == 0.)].set_index('VARIANT').sort_index()
+
+        b_l = abs(float(test_params['ql']))
+        b_c = (b_l - float(test_params['q_eut'])) * q_incs
+        prescreen = pd.DataFrame(OrderedDict([
+            ('Q_INC', q_incs),
+            ('F_ISLAND', balanced['F_ISLAND'].to_numpy()),
+            ('V_ISLAND', balanced['V_ISLAND'].to_numpy()),
+            ('TRIP', balanced['TRIP'].to_numpy()),
+            ('T_MIN', by_variant['CLEARING_TIME'].min().to_numpy()),
+            ('T_MAX', by_variant['CLEARING_TIME'].max().to_numpy()),
+            ('SUSTAINED', by_variant['CLEARING_TIME'].apply(lambda t: np.isinf(t).mean()).to_numpy()),
+            ('QF', np.sqrt(b_c * b_l) / float(test_params['p_eut'])),
+        ]))
+        # longest clearing times first, then the islands closest to the nominal frequency
+        order = np.lexsort((np.abs(prescreen['F_ISLAND'] - self.f_nom), -prescreen['T_MIN'], -prescreen['SUSTAINED'],
+                            -prescreen['T_MAX']))
+        prescreen['PRIORITY'] = np.argsort(order) + 1
+        return prescreen
+
+
+def find_ui_waveform_files(results_dir):
+    """
+    :param results_dir: results directory
+    :return: the UI_Test_*_Q*.csv files of the directory and its sub-directories
+    """
+    return [os.path.join(root, f) for root, _, files in os.walk(results_dir) for f in files
+            if UI_WAVEFORM_FILE.search(f)]
 
 
 if __name__ == "__main__":
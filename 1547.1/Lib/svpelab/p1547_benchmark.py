@@ -0,0 +1,413 @@
+"""
+Copyright (c) 2018, Sandia National Labs, SunSpec Alliance and CanmetENERGY(Natural Resources Canada)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice, this
+list of conditions and the following disclaimer in the documentation and/or
+other materials provided with the distribution.
+
+Neither the names of the Sandia National Labs, SunSpec Alliance and CanmetENERGY(Natural Resources Canada)
+nor the names of its contributors may be used to endorse or promote products derived from
+this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Questions can be directed to support@sunspec.org
+"""
+
+"""
+Benchmark of the time spent in the P1547 library at each test step.
+
+The library is driven with deterministic stand-ins for the test script (ts) and the data acquisition system (daq)
+through thousands of steps of every function. The Tr waits of record_timeresponse() run on a VirtualClock so only
+the library calls are measured. For each call (start, get_measurement_total, define_target, evaluate_criterias,
+write_rslt_sum, etc.) the latency and the memory allocated are reported.
+
+    python p1547_benchmark.py --steps 2000 --output benchmark.csv
+    python p1547_benchmark.py --baseline benchmark.csv
+
+The time taken to import p1547 in a new interpreter (what every script pays at start) is measured with:
+
+    python p1547_benchmark.py --imports 10
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+import collections
+import numpy as np
+import pandas as pd
+
+try:
+    from svpelab import p1547
+    from svpelab import p1547_sim
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from svpelab import p1547
+    from svpelab import p1547_sim
+
+# EUT parameters of the benchmark (same as Tests/VV/VV_1.tst with a three phase EUT)
+BENCHMARK_PARAMS = {
+    'eut.phases': 'Three phase',
+    'eut.v_nom': 120.0,
+    'eut.v_low': 105.6,
+    'eut.v_high': 132.0,
+    'eut.s_rated': 10000.0,
+    'eut.p_rated': 8000.0,
+    'eut.p_min': 1000.0,
+    'eut.var_rated': 2000.0,
+    'eut.f_nom': 60.0,
+    'eut.f_min': 56.0,
+    'eut.f_max': 66.0,
+    'eut.v_in_nom': 400,
+    'eut.imbalance_resp': 'EUT response to the average of the three-phase effective (RMS)',
+    'eut_fw.p_small': 0.05,
+    'p1547.sampler_period': 0.0,
+}
+
+# Library calls measured at each step. The calls made from other measured calls are included in their time.
+BENCHMARK_CALLS = ['start', 'get_measurement_total', 'record_timeresponse', 'evaluate_criterias', 'define_target',
+                   'update_target_value', 'calculate_min_max_values', 'open_loop_resp_criteria',
+                   'result_accuracy_criteria', 'write_rslt_sum']
+
+BENCHMARK_SCRIPTS = [p1547.VV, p1547.VW, p1547.FW, p1547.CPF, p1547.CRP, p1547.WV, p1547.LAP, p1547.PRI]
+
+
+class BenchmarkScript(p1547.OfflineScript):
+    """
+    Test script stand-in counting the log calls. The sleeps advance a VirtualClock.
+    """
+
+    def __init__(self, params=None):
+        p1547.OfflineScript.__init__(self, params=params, name='benchmark')
+        self.clock = p1547_sim.VirtualClock()
+        self.log_calls = collections.Counter()
+
+    def log(self, msg):
+        self.log_calls['ts.log'] += 1
+
+    def log_debug(self, msg):
+        self.log_calls['ts.log_debug'] += 1
+
+    def log_warning(self, msg):
+        self.log_calls['ts.log_warning'] += 1
+
+    def log_error(self, msg):
+        self.log_calls['ts.log_error'] += 1
+
+    def sleep(self, seconds):
+        self.clock.sleep(seconds)
+
+
+class BenchmarkDaq(object):
+    """
+    Data acquisition stand-in returning deterministic measurements: the stimulus of the step with a seeded noise
+    """
+
+    def __init__(self, phases, v_nom, f_nom, p_rated, seed=0):
+        self.sc = {}
+        self.n_phases = {'Single phase': 1, 'Split phase': 2, 'Three phase': 3}[phases]
+        self.v_nom = v_nom
+        self.f_nom = f_nom
+        self.p_rated = p_rated
+        self.random = np.random.RandomState(seed)
+        self.data = None
+        self.set_step({})
+
+    def set_step(self, step_dict):
+        v = step_dict.get('V', self.v_nom)
+        f = step_dict.get('F', self.f_nom)
+        p = self.p_rated / self.n_phases
+        noise = self.random.normal(scale=0.001, size=3)
+        self.data = {}
+        for i in range(1, self.n_phases + 1):
+            self.data['AC_VRMS_%d' % i] = v * (1. + noise[0])
+            self.data['AC_P_%d' % i] = p * (1. + noise[1])
+            self.data['AC_Q_%d' % i] = p * noise[2]
+            self.data['AC_FREQ_%d' % i] = f
+            self.data['AC_PF_%d' % i] = 1.
+
+    def data_sample(self):
+        pass
+
+    def data_capture_read(self):
+        return self.data
+
+
+def create_benchmark_steps(active_function, script):
+    """
+    Create the steps of one test of a script
+    :param active_function: ActiveFunction object of the script
+    :param script:          VV, VW, FW, CPF, CRP, WV, LAP or PRI
+    :return: list of (step label, step_dict, y_criterias_mod)
+    """
+    af = active_function
+    a_v = af.MRA['V'] * 1.5
+    if script == p1547.VV:
+        steps = [(label, {'V': v}, None) for label, v in af.create_vv_dict_steps(v_ref=1.0).items()]
+    elif script == p1547.VW:
+        steps = [(label, {'V': v}, None) for label, v in af.create_vw_dict_steps().items()]
+    elif script == p1547.FW:
+        steps = [(label, {'F': f}, None) for label, f in af.create_fw_dict_steps(mode='Above').items()]
+    elif script == p1547.WV:
+        steps = [(label, {'V': af.v_nom, 'P': p}, None) for label, p in af.create_wv_dict_steps().items()]
+    elif script == p1547.CPF:
+        steps = [('Step %s' % chr(ord('G') + i), {'V': v, 'P': af.p_rated, 'PF': 0.9}, None)
+                 for i, v in enumerate([af.v_nom, af.v_low + a_v, af.v_high - a_v, af.v_nom])]
+    elif script == p1547.CRP:
+        steps = [('Step %s' % chr(ord('G') + i), {'V': v, 'P': af.p_rated, 'Q': af.var_rated}, None)
+                 for i, v in enumerate([af.v_nom, af.v_low + a_v, af.v_high - a_v, af.v_nom])]
+    elif script == p1547.LAP:
+        steps = [('Step C', {'V': af.v_nom, 'F': af.f_nom, 'P': 0.66}, {'P': p1547.LAP})]
+        steps += [('Step D_%s' % f, {'V': af.v_nom, 'F': f, 'P': 0.66}, {'P': p1547.FW}) for f in [59.0, af.f_nom]]
+        steps += [('Step E_%s' % f, {'V': af.v_nom, 'F': f, 'P': 0.66}, {'P': p1547.FW}) for f in [61.0, af.f_nom]]
+        steps += [('Step F_%s' % v, {'V': v, 'F': af.f_nom, 'P': 0.66}, {'P': p1547.VW})
+                  for v in [1.08 * af.v_nom, af.v_nom]]
+    elif script == p1547.PRI:
+        steps = []
+        for mode in [p1547.VV, p1547.CRP, p1547.CPF, p1547.WV]:
+            for i, step_dict in enumerate(af.create_pri_dict_steps(function=mode)):
+                steps.append(('Step %s' % chr(ord('G') + i), step_dict, {'Q': mode}))
+    else:
+        raise p1547.p1547Error('No benchmark steps for %s' % script)
+    return steps
+
+
+class CallTimer(object):
+    """
+    Replace methods of an object by wrappers recording the duration of each call. With trace_allocations, the
+    memory allocated during each call (peak of tracemalloc) is recorded for the outermost measured calls.
+    """
+
+    def __init__(self, obj, names, trace_allocations=False):
+        self.durations = collections.defaultdict(list)
+        self.allocations = collections.defaultdict(list)
+        self.trace_allocations = trace_allocations
+        self.depth = 0
+        for name in names:
+            if hasattr(obj, name):
+                setattr(obj, name, self.wrap(name, getattr(obj, name)))
+
+    def wrap(self, name, method):
+        def timed(*args, **kwargs):
+            outermost = self.depth == 0
+            if self.trace_allocations and outermost:
+                tracemalloc.reset_peak()
+                start_memory = tracemalloc.get_traced_memory()[0]
+            self.depth += 1
+            start = time.perf_counter_ns()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.durations[name].append(time.perf_counter_ns() - start)
+                self.depth -= 1
+                if self.trace_allocations and outermost:
+                    self.allocations[name].append(tracemalloc.get_traced_memory()[1] - start_memory)
+        return timed
+
+
+def run_script_benchmark(script, n_steps=2000, seed=0, trace_allocations=False):
+    """
+    Drive the ActiveFunction of a script through n_steps steps
+    :param script:              VV, VW, FW, CPF, CRP, WV, LAP or PRI
+    :param n_steps:             number of steps, the steps of the test are repeated
+    :param seed:                seed of the measurement noise
+    :param trace_allocations:   record the allocations (slower, the latencies are not representative)
+    :return: (CallTimer object, log call counter)
+    """
+    config = p1547.REPLAY_SCRIPTS[script]
+    ts = BenchmarkScript(params=dict(BENCHMARK_PARAMS))
+    af = p1547.ActiveFunction(ts=ts, script_name=config['script_name'], functions=config['functions'],
+                              criteria_mode=config['criteria_mode'])
+    af.reset_time_settings(tr=1.0, number_tr=2)
+    af.reset_curve(1)
+    af.reset_pwr(1.0)
+    af.reset_filename('BENCHMARK_%s' % script)
+    steps = create_benchmark_steps(af, script)
+    daq = BenchmarkDaq(phases=af.phases, v_nom=af.v_nom, f_nom=af.f_nom, p_rated=af.p_rated, seed=seed)
+
+    ts.log_calls.clear()
+    timer = CallTimer(af, BENCHMARK_CALLS, trace_allocations=trace_allocations)
+    for i in range(n_steps):
+        step_label, step_dict, y_criterias_mod = steps[i % len(steps)]
+        daq.set_step(step_dict)
+        af.start(daq=daq, step_label=step_label)
+        af.record_timeresponse(daq=daq)
+        af.evaluate_criterias(daq=daq, step_dict=step_dict, y_criterias_mod=y_criterias_mod)
+        af.write_rslt_sum()
+    return timer, ts.log_calls
+
+
+def run_benchmark(scripts=None, n_steps=2000, seed=0, trace_allocations=True):
+    """
+    Benchmark the library calls of every script
+    :param scripts:             list of scripts, all of them by default
+    :param n_steps:             number of steps per script
+    :param seed:                seed of the measurement noise
+    :param trace_allocations:   run a second pass to record the allocations
+    :return: pandas DataFrame with one row per script and call
+    """
+    if scripts is None:
+        scripts = BENCHMARK_SCRIPTS
+    rows = []
+    for script in scripts:
+        timer, log_calls = run_script_benchmark(script, n_steps=n_steps, seed=seed)
+        allocations = {}
+        if trace_allocations:
+            tracemalloc.start()
+            try:
+                alloc_timer, _ = run_script_benchmark(script, n_steps=max(n_steps // 10, 1), seed=seed,
+                                                      trace_allocations=True)
+            finally:
+                tracemalloc.stop()
+            allocations = alloc_timer.allocations
+        for name in BENCHMARK_CALLS:
+            durations = np.asarray(timer.durations.get(name, []), dtype=float) / 1e3
+            if durations.size == 0:
+                continue
+            alloc = allocations.get(name)
+            rows.append(collections.OrderedDict([
+                ('SCRIPT', script), ('CALL', name), ('CALLS_PER_STEP', durations.size / n_steps),
+                ('MEAN_US', durations.mean()), ('P50_US', np.percentile(durations, 50)),
+                ('P99_US', np.percentile(durations, 99)), ('MAX_US', durations.max()),
+                ('ALLOC_KIB', np.mean(alloc) / 1024. if alloc else np.nan)]))
+        for name, count in sorted(log_calls.items()):
+            rows.append(collections.OrderedDict([('SCRIPT', script), ('CALL', name),
+                                                 ('CALLS_PER_STEP', count / n_steps)]))
+    return pd.DataFrame(rows)
+
+
+def compare_baseline(result, baseline, tolerance=0.25):
+    """
+    Compare the median latencies with a previous benchmark
+    :param result:      DataFrame from run_benchmark()
+    :param baseline:    DataFrame from run_benchmark() (e.g. read from a file written with --output)
+    :param tolerance:   relative increase of the median latency reported as a regression
+    :return: DataFrame of the regressions
+    """
+    merged = result.merge(baseline, on=['SCRIPT', 'CALL'], suffixes=('', '_BASELINE'))
+    merged = merged.dropna(subset=['P50_US', 'P50_US_BASELINE'])
+    merged['RATIO'] = merged['P50_US'] / merged['P50_US_BASELINE']
+    return merged[merged['RATIO'] > 1. + tolerance][['SCRIPT', 'CALL', 'P50_US_BASELINE', 'P50_US', 'RATIO']]
+
+
+# Import statements timed in fresh interpreters by run_import_benchmark(). 'eager' imports the heavy dependencies
+# before p1547 like the module did before they were loaded lazily.
+IMPORT_CASES = collections.OrderedDict([
+    ('p1547', 'from svpelab import p1547'),
+    ('eager', 'import numpy, pandas, xml.etree.ElementTree; from svpelab import p1547'),
+])
+IMPORT_HEAVY_MODULES = ['numpy', 'pandas', 'xml.etree.ElementTree', 'xlsxwriter']
+
+IMPORT_TIMER = """
+import sys, time
+start = time.perf_counter()
+%s
+elapsed = time.perf_counter() - start
+print('%%f %%s' %% (elapsed, ','.join(m for m in %r if m in sys.modules)))
+"""
+
+
+def measure_import(statement, repeat=10):
+    """
+    Time an import statement in new interpreters, so nothing is already in sys.modules
+    :param statement:   python statement to time
+    :param repeat:      number of interpreters started
+    :return: (list of the durations in s, heavy modules loaded by the statement)
+    """
+    import subprocess
+
+    env = dict(os.environ)
+    lib_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join([lib_dir] + ([env['PYTHONPATH']] if env.get('PYTHONPATH') else []))
+    code = IMPORT_TIMER % (statement, IMPORT_HEAVY_MODULES)
+    durations = []
+    modules = ''
+    # the first run compiles the byte code and is not counted
+    for i in range(repeat + 1):
+        output = subprocess.check_output([sys.executable, '-W', 'ignore', '-c', code], env=env)
+        elapsed, _, modules = output.decode().strip().partition(' ')
+        if i > 0:
+            durations.append(float(elapsed))
+    return durations, modules
+
+
+def run_import_benchmark(repeat=10):
+    """
+    Compare the time taken to import p1547 with the time it took when numpy, pandas and ElementTree were imported
+    with it
+    :param repeat:  number of interpreters started per case
+    :return: DataFrame with one row per case of IMPORT_CASES
+    """
+    rows = []
+    for case, statement in IMPORT_CASES.items():
+        durations, modules = measure_import(statement, repeat=repeat)
+        durations = np.array(durations) * 1e3
+        rows.append(collections.OrderedDict([
+            ('CASE', case), ('MEAN_MS', durations.mean()), ('P50_MS', np.percentile(durations, 50)),
+            ('MIN_MS', durations.min()), ('MAX_MS', durations.max()), ('MODULES', modules or '-')]))
+    return pd.DataFrame(rows)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark the per-step overhead of the P1547 library')
+    parser.add_argument('--steps', type=int, default=2000, help='number of steps per script')
+    parser.add_argument('--scripts', nargs='+', default=None, choices=BENCHMARK_SCRIPTS,
+                        help='scripts to benchmark (default all)')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the measurement noise')
+    parser.add_argument('--no-allocations', action='store_true', help='skip the allocation pass')
+    parser.add_argument('--output', default=None, help='write the results in a csv file')
+    parser.add_argument('--baseline', default=None, help='csv file of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='relative increase of the median latency reported as a regression')
+    parser.add_argument('--imports', type=int, default=None, metavar='REPEAT',
+                        help='time the import of p1547 in REPEAT new interpreters instead')
+    args = parser.parse_args(argv)
+
+    if args.imports is not None:
+        result = run_import_benchmark(repeat=args.imports)
+        with pd.option_context('display.width', 200, 'display.float_format', '{:0.1f}'.format):
+            print(result.to_string(index=False))
+        p50 = result.set_index('CASE')['P50_MS']
+        print('\nImport of p1547: %0.1f ms (%0.1f ms with eager numpy/pandas/ElementTree)' %
+              (p50['p1547'], p50['eager']))
+        if args.output is not None:
+            result.to_csv(args.output, index=False)
+        return 0
+
+    result = run_benchmark(scripts=args.scripts, n_steps=args.steps, seed=args.seed,
+                           trace_allocations=not args.no_allocations)
+    with pd.option_context('display.max_rows', None, 'display.width', 200, 'display.float_format', '{:0.2f}'.format):
+        print(result.to_string(index=False))
+    if args.output is not None:
+        result.to_csv(args.output, index=False)
+
+    if args.baseline is not None:
+        regressions = compare_baseline(result, pd.read_csv(args.baseline), tolerance=args.tolerance)
+        if not regressions.empty:
+            print('\nRegressions (median latency more than %d%% above the baseline):' % (args.tolerance * 100))
+            print(regressions.to_string(index=False))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,803 @@
+"""
+Copyright (c) 2018, Sandia National Labs, SunSpec Alliance and CanmetENERGY(Natural Resources Canada)
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without modification,
+are permitted provided that the following conditions are met:
+
+Redistributions of source code must retain the above copyright notice, this
+list of conditions and the following disclaimer.
+
+Redistributions in binary form must reproduce the above copyright notice, this
+list of conditions and the following disclaimer in the documentation and/or
+other materials provided with the distribution.
+
+Neither the names of the Sandia National Labs, SunSpec Alliance and CanmetENERGY(Natural Resources Canada)
+nor the names of its contributors may be used to endorse or promote products derived from
+this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND
+ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR
+ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+(INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+(INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+Questions can be directed to support@sunspec.org
+"""
+
+"""
+Virtual-time simulation of the test station and command line of the P1547 library.
+
+The compliance scripts run unchanged on stand-ins for the test script (ts), the grid simulator, the PV simulator,
+the EUT and the data acquisition system. The sleeps advance a VirtualClock so a whole suite runs in seconds, and the
+datasets and result_summary.csv are written in the usual Results layout.
+
+    python p1547_sim.py RESULTS --simulate ../../Suites/VV.ste
+
+The same command line re-grades the recorded datasets of a Results tree (see p1547.regrade_results()) or computes
+the clearing times of the unintentional islanding waveforms:
+
+    python p1547_sim.py RESULTS --output regrade_summary.csv
+    python p1547_sim.py RESULTS --ui-clearing
+"""
+
+import os
+import sys
+import math
+import time
+import logging
+import contextlib
+import traceback
+from datetime import datetime, timedelta
+from collections import OrderedDict
+import xml.etree.ElementTree as ET
+import numpy as np
+import pandas as pd
+
+try:
+    from svpelab import p1547
+except ImportError:
+    # The compliance scripts import the library as svpelab.p1547
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from svpelab import p1547
+
+logger = logging.getLogger(__name__)
+
+
+class VirtualClock(object):
+    """
+    Clock of the simulated test station. The sleeps advance the time immediately so a test runs as fast as the
+    calculations allow.
+    """
+    # The sleeps end exactly at the deadlines of DeadlineScheduler, no busy wait is needed
+    spin = 0.0
+
+    def __init__(self, start=None):
+        """
+        :param start:   datetime of the start of the simulation
+        """
+        self.start = start if start is not None else datetime(2020, 1, 1)
+        self.ns = 0
+
+    def monotonic_ns(self):
+        return self.ns
+
+    def now(self):
+        return self.start + timedelta(microseconds=self.ns / 1e3)
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.ns += int(round(seconds * 1e9))
+
+    def elapsed(self):
+        """
+        :return: simulated time in seconds
+        """
+        return self.ns / 1e9
+
+
+class SimulatedScriptInfo(object):
+    """
+    Stand-in for script.ScriptInfo keeping the default value of the parameters declared by a compliance script
+    """
+
+    def __init__(self, name=None, run=None, version=None):
+        self.name = name
+        self.run = run
+        self.version = version
+        self.params = OrderedDict()
+
+    def param_group(self, name, label=None, **kwargs):
+        pass
+
+    def param(self, name, label=None, default=None, **kwargs):
+        self.params[name] = default
+
+    def logo(self, filename):
+        pass
+
+
+class SimulatedScript(p1547.OfflineScript):
+    """
+    Stand-in for the SVP test script object (ts) running on a VirtualClock. The log and the result files are written
+    in the result directory of the test.
+    """
+
+    def __init__(self, params=None, name=None, script=None, results_dir=None, result_dir=None, clock=None,
+                 verbose=False):
+        """
+        :param results_dir:     root directory of the results
+        :param result_dir:      directory of the test relative to results_dir (e.g. VV__VV_1)
+        :param clock:           VirtualClock object
+        """
+        p1547.OfflineScript.__init__(self, params=params, name=name, script=script, verbose=verbose)
+        self.clock = clock if clock is not None else VirtualClock()
+        self._results_dir = results_dir
+        self._result_dir = result_dir
+        self.info = None
+        self.station = None
+        self.log_file = None
+        self.result_value = None
+        self.result_files = []
+
+    def write_log(self, level, msg):
+        line = '%s %s %s' % (self.clock.now().strftime('%H:%M:%S.%f')[:-3], level, msg)
+        if self.log_file is not None:
+            self.log_file.write(line + '\n')
+        if level == 'ERROR' or self.verbose:
+            logger.log(getattr(logging, level), line)
+
+    def log(self, msg):
+        self.write_log('INFO', msg)
+
+    def log_debug(self, msg):
+        self.write_log('DEBUG', msg)
+
+    def log_warning(self, msg):
+        self.write_log('WARNING', msg)
+
+    def log_error(self, msg):
+        self.write_log('ERROR', msg)
+
+    def log_active_params(self):
+        for name, value in self.params.items():
+            self.log_debug('%s = %s' % (name, value))
+
+    def svp_version(self, required=None):
+        pass
+
+    def sleep(self, seconds):
+        self.clock.sleep(seconds)
+
+    def result(self, result):
+        self.result_value = result
+
+    def results_dir(self):
+        return self._results_dir
+
+    def result_dir(self):
+        return self._result_dir
+
+    def result_file_path(self, filename):
+        return os.path.join(self._results_dir, self._result_dir, filename)
+
+    def result_file(self, filename, params=None):
+        self.result_files.append(filename)
+
+
+class SimulatedStation(object):
+    """
+    Equipment of the simulated test station sharing the virtual clock of the test script: grid simulator, PV
+    simulator and EUT. The data acquisition systems are created by das_init() and read the EUT.
+    """
+
+    def __init__(self, ts, response_time=1.0):
+        """
+        :param ts:              SimulatedScript object
+        :param response_time:   open loop response time of the EUT functions without response time setting
+        """
+        self.ts = ts
+        self.clock = ts.clock
+        self.grid = SimulatedGrid(self)
+        self.pv = SimulatedPv(self)
+        self.eut = SimulatedEut(self, response_time=response_time)
+
+    def update(self):
+        """
+        Bring the EUT response up to the current time. It is called before any change of the EUT inputs so the
+        inputs are constant between two updates.
+        """
+        self.eut.update()
+
+    def read(self):
+        """
+        :return: dictionary of the DAQ channels (AC_VRMS_1, AC_P_1, etc.) for each phase of the grid simulator
+        """
+        meas = self.eut.measurements()
+        n_phases = len(self.grid.v)
+        p = meas['W'] / n_phases
+        q = meas['VAr'] / n_phases
+        s = math.hypot(p, q)
+        data = OrderedDict()
+        for i, v in enumerate(self.grid.v, start=1):
+            data['AC_VRMS_%d' % i] = v
+            data['AC_IRMS_%d' % i] = s / v if v else 0.
+            data['AC_P_%d' % i] = p
+            data['AC_Q_%d' % i] = q
+            data['AC_S_%d' % i] = s
+            data['AC_PF_%d' % i] = p / s if s else 1.
+            data['AC_FREQ_%d' % i] = self.grid.f
+        return data
+
+
+class SimulatedGrid(object):
+
+    def __init__(self, station):
+        self.station = station
+        ts = station.ts
+        eut_params = p1547.get_eut_params(ts)
+        phases = str(eut_params.phases).lower()
+        if phases.startswith('three'):
+            n_phases = 3
+        elif phases.startswith('split'):
+            n_phases = 2
+        else:
+            n_phases = 1
+        self.v = [eut_params.v_nom] * n_phases
+        self.f = eut_params.f_nom or 60.
+        self.rocof_value = None
+
+    def info(self):
+        return 'Simulated grid simulator'
+
+    def config(self):
+        pass
+
+    def voltage(self, voltage=None):
+        """
+        :param voltage: voltage of all phases or sequence of phase voltages
+        """
+        if voltage is not None:
+            self.station.update()
+            if isinstance(voltage, (list, tuple)):
+                self.v = [float(v) for v in voltage]
+            else:
+                self.v = [float(voltage)] * len(self.v)
+        return list(self.v)
+
+    def config_asymmetric_phase_angles(self, mag=None, angle=None):
+        """
+        :param mag:     phase voltages
+        :param angle:   phase angles (the EUT model only uses the voltages)
+        """
+        if mag is not None:
+            self.voltage(list(mag))
+
+    def freq(self, freq=None):
+        if freq is not None:
+            self.station.update()
+            self.f = float(freq)
+        return self.f
+
+    def rocof(self, param=None):
+        if param is not None:
+            self.rocof_value = param
+        return self.rocof_value
+
+    def close(self):
+        pass
+
+
+class SimulatedPv(object):
+
+    def __init__(self, station):
+        self.station = station
+        self.power = p1547.get_eut_params(station.ts).p_rated
+        self.irradiance = 1000.
+
+    def info(self):
+        return 'Simulated PV simulator'
+
+    def power_on(self):
+        pass
+
+    def power_set(self, power):
+        self.station.update()
+        self.power = float(power)
+
+    def iv_curve_config(self, pmp, vmp):
+        self.power_set(pmp)
+
+    def irradiance_set(self, irradiance=1000.):
+        self.station.update()
+        self.irradiance = float(irradiance)
+
+    def available_power(self):
+        return self.power * self.irradiance / 1000.
+
+    def close(self):
+        pass
+
+
+class SimulatedEut(object):
+    """
+    First order model of an EUT. The steady state of the enabled functions is given by the characteristic curves of
+    the library and the output reaches 90% of a step after the open loop response time (see
+    CriteriaValidation.calculate_open_loop_value()).
+
+    The curve of VV, VW, FW and WV is the curve number of the settings (ACTCRV, ActCrv or an integer 'curve') and
+    the FW settings dbf and kof replace the ones of the curve. Only one reactive power function is enabled at a time.
+    """
+    active_power_functions = [p1547.VW, p1547.FW, p1547.LAP]
+    reactive_power_functions = [p1547.VV, p1547.WV, p1547.CPF, p1547.CRP]
+    characteristic_functions = [p1547.VV, p1547.VW, p1547.FW, p1547.WV]
+
+    def __init__(self, station, response_time=1.0):
+        self.station = station
+        self.clock = station.clock
+        self.response_time = response_time
+        # The characteristics are evaluated with the library for the curve 0 holding the settings of the EUT. FW
+        # needs the nominal frequency, it is only modelled when the script declares eut.f_nom (not in WV.py)
+        functions = [function for function in self.characteristic_functions
+                     if function != p1547.FW or p1547.get_eut_params(station.ts).f_nom]
+        self.model = p1547.ActiveFunction(ts=station.ts, script_name='Simulated EUT', functions=functions,
+                                    criteria_mode=[False, False, False])
+        self.model.curve = 0
+        self.settings = OrderedDict()
+        self.update_ns = self.clock.monotonic_ns()
+        self.p, self.q = self.steady_state()
+
+    def info(self):
+        return 'Simulated EUT'
+
+    def config(self):
+        pass
+
+    def connect(self, params=None):
+        pass
+
+    def close(self):
+        pass
+
+    def deactivate_all_fct(self):
+        self.station.update()
+        self.settings = OrderedDict()
+
+    def vrt_stay_connected_high(self, params=None):
+        pass
+
+    def vrt_stay_connected_low(self, params=None):
+        pass
+
+    def frt_stay_connected_high(self, params=None):
+        pass
+
+    def frt_stay_connected_low(self, params=None):
+        pass
+
+    def volt_var(self, params=None):
+        return self.set_function(p1547.VV, params)
+
+    def volt_watt(self, params=None):
+        return self.set_function(p1547.VW, params)
+
+    def freq_watt(self, params=None):
+        return self.set_function(p1547.FW, params)
+
+    def watt_var(self, params=None):
+        return self.set_function(p1547.WV, params)
+
+    def fixed_pf(self, params=None):
+        return self.set_function(p1547.CPF, params)
+
+    def reactive_power(self, params=None):
+        return self.set_function(p1547.CRP, params)
+
+    def limit_max_power(self, params=None):
+        if params is not None:
+            params = dict(params)
+            params['Ena'] = params.get('MaxLimWEna', params.get('Ena', True))
+            if params.get('MaxLimW') is not None and params['MaxLimW'] < 0:
+                # Scripts/FW.py configures the absorption (P'min) of the EUT with a negative limit
+                self.station.update()
+                self.model.absorb_power = True
+                self.model.characteristics = {}
+                return self.set_function(p1547.LAP, {'Ena': False})
+        return self.set_function(p1547.LAP, params)
+
+    def set_function(self, function, params=None):
+        """
+        :param function:    function of the EUT (VV, VW, FW, WV, CPF, CRP or LAP)
+        :param params:      settings of the function, None to read them
+        :return: settings of the function
+        """
+        if params is None:
+            return self.settings.get(function, {'Ena': False})
+
+        self.station.update()
+        if not params.get('Ena', True):
+            self.settings.pop(function, None)
+            return {'Ena': False}
+
+        settings = dict(params)
+        settings['Ena'] = True
+        if function in self.characteristic_functions and function not in self.model.param:
+            raise p1547.p1547Error('The simulated EUT cannot model %s without the parameter eut.f_nom' % function)
+        if function in self.model.param:
+            curve = self.get_curve_number(params)
+            if curve not in self.model.param[function]:
+                curve = 1
+            pairs = dict(self.model.param[function][curve])
+            if function == p1547.FW:
+                pairs.update({key: params[key] for key in ('dbf', 'kof') if params.get(key) is not None})
+            self.model.param[function][0] = pairs
+            self.model.characteristics = {}
+            settings['curve_number'] = curve
+            settings['tr'] = self.get_response_time(params, default=pairs.get('TR'))
+        else:
+            settings['tr'] = self.get_response_time(params)
+
+        if function == p1547.LAP:
+            if params.get('MaxLimW') is not None:
+                settings['limit'] = float(params['MaxLimW'])
+            else:
+                settings['limit'] = self.model.p_rated * float(params.get('MaxLimW_PCT', params.get('WMaxPct', 100.)))\
+                                    / 100.
+        elif function in self.reactive_power_functions:
+            for other in self.reactive_power_functions:
+                self.settings.pop(other, None)
+
+        self.settings[function] = settings
+        return settings
+
+    @staticmethod
+    def get_curve_number(params):
+        for key in ('ACTCRV', 'ActCrv', 'curve'):
+            value = params.get(key)
+            if isinstance(value, int) and not isinstance(value, bool):
+                return value
+        return 1
+
+    def get_response_time(self, params, default=None):
+        curve_params = params.get('curve') if isinstance(params.get('curve'), dict) else {}
+        for key in ('RmpPtTms', 'RmpTms', 'RspTms'):
+            for source in (params, curve_params):
+                if source.get(key):
+                    return float(source[key])
+        return float(default) if default else self.response_time
+
+    def evaluate(self, function, value):
+        return self.model.get_characteristic(function).evaluate(value)
+
+    def steady_state(self):
+        """
+        :return: active and reactive power reached by the EUT with the present grid and PV simulator settings
+        """
+        grid = self.station.grid
+        v = float(np.mean(grid.v))
+        p_available = self.station.pv.available_power()
+        pwr = p_available / self.model.p_rated
+        if pwr != self.model.pwr:
+            self.model.pwr = pwr
+            self.model.characteristics = {}
+
+        p = p_available
+        if p1547.LAP in self.settings:
+            p = min(p, self.settings[p1547.LAP]['limit'])
+        if p1547.VW in self.settings:
+            p = min(p, self.evaluate(p1547.VW, v))
+        if p1547.FW in self.settings:
+            p = min(p, self.evaluate(p1547.FW, grid.f))
+
+        q = 0.
+        if p1547.VV in self.settings:
+            q = self.evaluate(p1547.VV, v)
+        elif p1547.WV in self.settings:
+            q = self.evaluate(p1547.WV, p)
+        elif p1547.CPF in self.settings:
+            pf = float(self.settings[p1547.CPF]['PF'])
+            q = math.copysign(abs(p) * math.sqrt(1. / pow(pf, 2) - 1.), pf)
+        elif p1547.CRP in self.settings:
+            q = float(self.settings[p1547.CRP]['Q'])
+        return p, q
+
+    def get_tr(self, functions):
+        trs = [self.settings[function]['tr'] for function in functions if function in self.settings]
+        return min(trs) if trs else self.response_time
+
+    def update(self):
+        """
+        Advance the first order response from the last update to the current time
+        """
+        now_ns = self.clock.monotonic_ns()
+        dt = (now_ns - self.update_ns) / 1e9
+        self.update_ns = now_ns
+        if dt <= 0:
+            return
+        p_ss, q_ss = self.steady_state()
+        # 90% of the step after Tr: time constant of Tr / ln(10)
+        self.p += (p_ss - self.p) * (1. - math.exp(-dt * math.log(10.) / self.get_tr(self.active_power_functions)))
+        self.q += (q_ss - self.q) * (1. - math.exp(-dt * math.log(10.) / self.get_tr(self.reactive_power_functions)))
+
+    def measurements(self):
+        self.update()
+        grid = self.station.grid
+        return {'W': self.p, 'VAr': self.q, 'VA': math.hypot(self.p, self.q), 'V': float(np.mean(grid.v)),
+                'Hz': grid.f}
+
+
+class SimulatedDas(object):
+    """
+    Data acquisition system of the simulated test station. The samples are timestamped with the virtual clock.
+    """
+
+    def __init__(self, station, sc_points=None):
+        self.station = station
+        self.clock = station.clock
+        self.sc = OrderedDict((point, None) for point in (sc_points or []))
+        self.capturing = False
+        self.capture_start_ns = 0
+        self.rows = []
+        self.data = None
+
+    def info(self):
+        return 'Simulated DAS'
+
+    def set_dc_measurement(self, obj=None):
+        pass
+
+    def data_read(self):
+        return self.station.read()
+
+    def data_sample(self):
+        self.data = self.data_read()
+        if self.capturing:
+            row = OrderedDict(TIME=(self.clock.monotonic_ns() - self.capture_start_ns) / 1e9)
+            row.update(self.data)
+            row.update(self.sc)
+            self.rows.append(row)
+
+    def data_capture(self, enable=True):
+        if enable and not self.capturing:
+            self.rows = []
+            self.capture_start_ns = self.clock.monotonic_ns()
+        self.capturing = enable
+
+    def data_capture_read(self):
+        if self.data is None:
+            self.data = self.data_read()
+        return self.data
+
+    def data_capture_dataset(self):
+        return SimulatedDataset(self.rows)
+
+    def close(self):
+        self.capturing = False
+
+
+class SimulatedDataset(object):
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+
+    def to_csv(self, filename):
+        pd.DataFrame(self.rows).to_csv(filename, index=False)
+
+
+def simulated_modules():
+    """
+    Create the modules imported by the compliance scripts (script and the svpelab equipment modules) for the
+    simulated test station. The equipment of the station is the 'station' attribute of the test script object.
+    :return: dictionary {module name: module}
+    """
+    import types
+
+    def no_params(info, *args, **kwargs):
+        pass
+
+    script_module = types.ModuleType('script')
+    script_module.RESULT_PASS = 'Pass'
+    script_module.RESULT_FAIL = 'Fail'
+    script_module.RESULT_COMPLETE = 'Complete'
+    script_module.ScriptFail = type('ScriptFail', (Exception,), {})
+    script_module.ScriptInfo = SimulatedScriptInfo
+    modules = {'script': script_module}
+
+    equipment = {
+        'der': ('der_init', 'DERError', lambda ts, kwargs: ts.station.eut),
+        'gridsim': ('gridsim_init', 'GridSimError', lambda ts, kwargs: ts.station.grid),
+        'pvsim': ('pvsim_init', 'PVSimError', lambda ts, kwargs: ts.station.pv),
+        'das': ('das_init', 'DASError', lambda ts, kwargs: SimulatedDas(ts.station, kwargs.get('sc_points'))),
+        'hil': ('hil_init', 'HILError', lambda ts, kwargs: None),
+        'loadsim': ('loadsim_init', 'LoadSimError', lambda ts, kwargs: None),
+    }
+    for name, (init_name, error_name, create) in equipment.items():
+        module = types.ModuleType('svpelab.%s' % name)
+        module.params = no_params
+        module.__dict__[init_name] = (lambda create: lambda ts, *args, **kwargs: create(ts, kwargs))(create)
+        module.__dict__[error_name] = type(error_name, (Exception,), {})
+        modules['svpelab.%s' % name] = module
+
+    result_module = types.ModuleType('svpelab.result')
+    # The result workbook is built by the SVP from its result files
+    result_module.result_workbook = lambda *args, **kwargs: None
+    modules['svpelab.result'] = result_module
+    return modules
+
+
+@contextlib.contextmanager
+def install_modules(modules):
+    """
+    Replace modules in sys.modules (and the svpelab package attributes) for the duration of the context
+    :param modules:     dictionary {module name: module}
+    """
+    import importlib
+
+    package = importlib.import_module('svpelab')
+    saved_modules = {name: sys.modules.get(name) for name in modules}
+    saved_attrs = {}
+    for name, module in modules.items():
+        sys.modules[name] = module
+        if name.startswith('svpelab.'):
+            attr = name.split('.', 1)[1]
+            saved_attrs[attr] = getattr(package, attr, None)
+            setattr(package, attr, module)
+    try:
+        yield
+    finally:
+        for name, module in saved_modules.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
+        for attr, value in saved_attrs.items():
+            if value is None:
+                delattr(package, attr)
+            else:
+                setattr(package, attr, value)
+
+
+def simulate_test(config_file, results_dir, scripts_dir=None, suite_params=None, verbose=False):
+    """
+    Run a compliance script on the simulated test station. The script, its datasets and result_summary.csv are the
+    same as in the lab, only the sleeps take no time.
+    :param config_file:     test configuration file (e.g. Tests/VV/VV_1.tst)
+    :param results_dir:     directory receiving the result directory of the test (e.g. VV__VV_1)
+    :param scripts_dir:     Scripts directory of the SVP project
+    :param suite_params:    global parameters of the suite, they replace the parameters of the test
+    :param verbose:         print the log of the test
+    :return: dictionary with the test, result, return code, simulated time and wall time
+    """
+    import importlib.util
+
+    if scripts_dir is None:
+        scripts_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Scripts')
+    root = ET.parse(config_file).getroot()
+    name = root.get('name')
+    script_name = root.get('script')
+    result_dir = '%s__%s' % (os.path.basename(os.path.dirname(os.path.abspath(config_file))), name)
+    os.makedirs(os.path.join(results_dir, result_dir), exist_ok=True)
+
+    ts = SimulatedScript(name=name, script=script_name, results_dir=results_dir, result_dir=result_dir,
+                         verbose=verbose)
+    wall_start = time.perf_counter()
+    rc = 0
+    with open(ts.result_file_path(name + '.log'), 'w') as ts.log_file, install_modules(simulated_modules()):
+        # A test which cannot be loaded or simulated fails alone, the suite continues with the next test
+        try:
+            spec = importlib.util.spec_from_file_location('simulated_%s' % script_name,
+                                                          os.path.join(scripts_dir, script_name + '.py'))
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+
+            ts.params = OrderedDict(module.info.params)
+            ts.params.update(p1547.OfflineScript.from_config(config_file).params)
+            ts.params.update(suite_params or {})
+            # The background sampler runs on the wall clock
+            ts.params['p1547.sampler_period'] = 0.0
+            ts.info = module.info
+            ts.station = SimulatedStation(ts)
+            module.run(ts)
+        except SystemExit as e:
+            rc = e.code
+        except Exception as e:
+            ts.log_error('Simulation of %s failed: %s' % (name, e))
+            ts.log_debug(traceback.format_exc())
+            ts.result_value = 'Fail'
+            rc = 1
+
+    return OrderedDict([('TEST', result_dir), ('RESULT', ts.result_value), ('RC', rc),
+                        ('SIMULATED_TIME', ts.clock.elapsed()), ('WALL_TIME', time.perf_counter() - wall_start)])
+
+
+def simulate_suite(suite_file, results_dir, tests_dir=None, scripts_dir=None, suite_params=None, verbose=False):
+    """
+    Run every test of a suite (e.g. Suites/VV.ste) on the simulated test station. The results of the suite are in
+    results_dir/<suite name> and can be re-graded with p1547.regrade_results().
+    :param suite_file:      .ste suite file, its members can be tests or suites
+    :param results_dir:     Results directory
+    :param tests_dir:       Tests directory of the SVP project
+    :param scripts_dir:     Scripts directory of the SVP project
+    :param suite_params:    global parameters of an enclosing suite
+    :param verbose:         print the log of the tests
+    :return: pandas DataFrame with one row per test (see simulate_test())
+    """
+    if tests_dir is None:
+        tests_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(suite_file))), 'Tests')
+    root = ET.parse(suite_file).getroot()
+    run_dir = os.path.join(results_dir, root.get('name'))
+
+    params = OrderedDict()
+    if root.get('globals') == 'True':
+        for param in root.iter('param'):
+            params[param.get('name')] = p1547.OfflineScript.convert_param(param.get('type'), param.text)
+    # The parameters of the enclosing suites have the priority
+    params.update(suite_params or {})
+
+    frames = []
+    for member in root.iter('member'):
+        member_name = member.get('name')
+        if member_name.endswith('.ste'):
+            frames.append(simulate_suite(os.path.join(os.path.dirname(suite_file), member_name), run_dir,
+                                         tests_dir=tests_dir, scripts_dir=scripts_dir, suite_params=params,
+                                         verbose=verbose))
+        else:
+            result = simulate_test(os.path.join(tests_dir, member_name), run_dir, scripts_dir=scripts_dir,
+                                   suite_params=params, verbose=verbose)
+            frames.append(pd.DataFrame([result]))
+    if not frames:
+        return pd.DataFrame(columns=['TEST', 'RESULT', 'RC', 'SIMULATED_TIME', 'WALL_TIME'])
+    return pd.concat(frames, ignore_index=True)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Re-grade the recorded datasets of IEEE 1547.1 test results or '
+                                                 'run a suite on the simulated test station')
+    parser.add_argument('results', help='Results directory (or a single run of it)')
+    parser.add_argument('--tests', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..',
+                                                        'Tests'),
+                        help='Tests directory holding the .tst configurations')
+    parser.add_argument('--output', default=None, help='merged summary file (default RESULTS/regrade_summary.csv)')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes (default all cores)')
+    parser.add_argument('--simulate', metavar='SUITE', default=None,
+                        help='run the tests of a suite on the simulated test station in RESULTS instead')
+    parser.add_argument('--verbose', action='store_true', help='print the log of the simulated tests')
+    parser.add_argument('--ui-clearing', action='store_true',
+                        help='compute the clearing times of the UI_Test_*_Q*.csv waveforms of RESULTS instead')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING, format='%(message)s')
+
+    if args.ui_clearing:
+        filenames = p1547.find_ui_waveform_files(args.results)
+        if not filenames:
+            print('No UI waveform files in %s' % args.results, file=sys.stderr)
+            return 1
+        results = p1547.IslandingClearingTime().evaluate_files(filenames)
+        output_file = args.output or os.path.join(args.results, 'ui_clearing_times.csv')
+        results.to_csv(output_file, index=False)
+        print(results.to_string(index=False))
+        return 1 if (results['RESULT'] != 'Pass').any() else 0
+
+    if args.simulate is not None:
+        summary = simulate_suite(args.simulate, args.results, tests_dir=os.path.normpath(args.tests),
+                                 verbose=args.verbose)
+        print(summary.to_string(index=False))
+        return 1 if (summary['RC'] != 0).any() else 0
+
+    summary, errors = p1547.regrade_results(args.results, os.path.normpath(args.tests), output_file=args.output,
+                                      workers=args.workers)
+    for test_dir, error in errors.items():
+        print('%s not re-graded: %s' % (test_dir, error), file=sys.stderr)
+    print('%d tests, %d steps re-graded' % (summary['TEST'].nunique(), len(summary)))
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -43,7 +43,6 @@ import script
 from svpelab import result as rslt
 from datetime import datetime, timedelta
 
-import numpy as np
 import collections
 import cmath
 import math
@@ -67,29 +66,30 @@ def test_run():
 
     try:
 
-        cat = ts.param_value('eut.cat')
-        cat2 = ts.param_value('eut.cat2')
-        sink_power = ts.param_value('eut.sink_power')
-        p_rated = ts.param_value('eut.p_rated')
-        p_rated_prime = ts.param_value('eut.p_rated_prime')
-        s_rated = ts.param_value('eut.s_rated')
+        eut_params = p1547.get_eut_params(ts)
+        cat = eut_params.cat
+        cat2 = eut_params.cat2
+        sink_power = eut_params.sink_power
+        p_rated = eut_params.p_rated
+        p_rated_prime = eut_params.p_rated_prime
+        s_rated = eut_params.s_rated
 
         # DC voltages
         v_nom_in_enabled = ts.param_value('cpf.v_in_nom')
         v_min_in_enabled = ts.param_value('cpf.v_in_min')
         v_max_in_enabled = ts.param_value('cpf.v_in_max')
 
-        v_nom_in = ts.param_value('eut.v_in_nom')
+        v_nom_in = eut_params.v_in_nom
         v_min_in = ts.param_value('eut_cpf.v_in_min')
         v_max_in = ts.param_value('eut_cpf.v_in_max')
 
         # AC voltages
-        v_nom = ts.param_value('eut.v_nom')
-        v_min = ts.param_value('eut.v_low')
-        v_max = ts.param_value('eut.v_high')
-        p_min = ts.param_value('eut.p_min')
-        p_min_prime = ts.param_value('eut.p_min_prime')
-        phases = ts.param_value('eut.phases')
+        v_nom = eut_params.v_nom
+        v_min = eut_params.v_low
+        v_max = eut_params.v_high
+        p_min = eut_params.p_min
+        p_min_prime = eut_params.p_min_prime
+        phases = eut_params.phases
         pf_response_time = ts.param_value('cpf.pf_response_time')
 
         # Imbalance configuration
@@ -482,6 +482,7 @@ def test_run():
                 pv.power_set(p_rated)
             pv.close()
         if daq is not None:
+            ActiveFunction.teardown()
             daq.close()
         if eut is not None:
             #eut.fixed_pf(params={'Ena': False, 'PF': 1.0})
@@ -584,6 +585,9 @@ info.param('eut_cpf.p_min_prime', label='P\'min: minimum active power while sink
 # Add the SIRFN logo
 info.logo('sirfn.png')
 
+# P1547 library parameters
+p1547.params(info)
+
 # Other equipment parameters
 der.params(info)
 gridsim.params(info)
@@ -72,34 +72,35 @@ def test_run():
     dataset_filename = None
 
     try:
-        sink_power = ts.param_value('eut.sink_power')
-        p_rated = ts.param_value('eut.p_rated')
-        p_rated_prime = ts.param_value('eut.p_rated_prime')
-        s_rated = ts.param_value('eut.s_rated')
-        var_rated = ts.param_value('eut.var_rated')
+        eut_params = p1547.get_eut_params(ts)
+        sink_power = eut_params.sink_power
+        p_rated = eut_params.p_rated
+        p_rated_prime = eut_params.p_rated_prime
+        s_rated = eut_params.s_rated
+        var_rated = eut_params.var_rated
 
         # DC voltages
         v_nom_in_enabled = ts.param_value('cpf.v_in_nom')
         v_min_in_enabled = ts.param_value('cpf.v_in_min')
         v_max_in_enabled = ts.param_value('cpf.v_in_max')
 
-        v_nom_in = ts.param_value('eut.v_in_nom')
+        v_nom_in = eut_params.v_in_nom
         v_min_in = ts.param_value('eut_cpf.v_in_min')
         v_max_in = ts.param_value('eut_cpf.v_in_max')
 
         # AC voltages
-        v_nom = ts.param_value('eut.v_nom')
-        v_min = ts.param_value('eut.v_low')
-        v_max = ts.param_value('eut.v_high')
-        f_nom = ts.param_value('eut.f_nom')
-        p_min = ts.param_value('eut.p_min')
-        p_min_prime = ts.param_value('eut.p_min_prime')
-        phases = ts.param_value('eut.phases')
+        v_nom = eut_params.v_nom
+        v_min = eut_params.v_low
+        v_max = eut_params.v_high
+        f_nom = eut_params.f_nom
+        p_min = eut_params.p_min
+        p_min_prime = eut_params.p_min_prime
+        phases = eut_params.phases
 
     
 
         # Pass/fail accuracies
-        pf_msa = ts.param_value('eut.pf_msa')
+        pf_msa = eut_params.pf_msa
 
         # EUI Absorb capabilities
         absorb = {}
@@ -156,6 +157,9 @@ def test_run():
             data_ena = False
 
         FreqRideThrough = p1547.FrequencyRideThrough(ts=ts, support_interfaces={"hil": phil})
+        waiter = p1547.SimulationWaiter(ts, phil)
+        wfm_file = ts.param_value('frt.wfm_file')
+        frt_tracker = p1547.FrequencyTracker(v_nom=v_nom, f_nom=f_nom, mra_f=FreqRideThrough.MRA['F'])
         # result params
         # result_params = lib_1547.get_rslt_param_plot()
         # ts.log(result_params
@@ -179,6 +183,7 @@ def test_run():
         daq = das.das_init(ts, support_interfaces={"hil": phil, "pvsim": pv})
         daq.waveform_config({"mat_file_name":"WAV.mat",
                             "wfm_channels": FreqRideThrough.get_wfm_file_header()})
+        wfm_file = wfm_file or p1547.get_waveform_file(daq, 'WAV.mat')
 
         if daq is not None:
             daq.sc['F_MEAS'] = 100
@@ -261,30 +266,27 @@ def test_run():
                     ts.log('Stop time set to %s' % phil.set_stop_time(frt_stop_time))
 
                     # The driver should take care of this by selecting "Yes" to "Load the model to target?"
-                    phil.load_model_on_hil()
+                    FreqRideThrough.load_model_on_hil()
                     # You need to first load the model, then configure the parameters
                     # Now that we have all the test_sequences its time to sent them to the model.
                     FreqRideThrough.set_frt_model_parameters(frt_test_sequences)
 
                     # The driver parameter "Execute the model on target?" should be set to "No"
+                    waiter.mark_file(wfm_file)
                     phil.start_simulation() 
                     ts.sleep(0.5)
-                    sim_time = phil.get_time()
-                    while (frt_stop_time - sim_time) > 1.0:  # final sleep will get to stop_time.
-                        sim_time = phil.get_time()
-                        ts.log('Sim Time: %0.3f.  Waiting another %0.3f sec before saving data.' % (
-                            sim_time, frt_stop_time - sim_time))
-                        ts.sleep(5)
+                    # final poll is within 1 s of stop_time.
+                    waiter.wait_stop_time(frt_stop_time, margin=1.0)
 
                     rms_dataset_filename = "No File"   
                     wave_start_filename = "No File"        
                     if data_ena:
                         rms_dataset_filename = dataset_filename + "_RMS.csv"
                         daq.data_capture(False)
-
+                    if data_ena or wfm_file:
                         # complete data capture
                         ts.log('Waiting for Opal to save the waveform data: {}'.format(dataset_filename))
-                        ts.sleep(10)
+                        waiter.wait_file(wfm_file)
                     if wav_ena:
                         # Convert and save the .mat file 
                         ts.log('Processing waveform dataset(s)')
@@ -295,6 +297,12 @@ def test_run():
                         if len(ds) > 0:
                             ds[0].to_csv(ts.result_file_path(wave_start_filename))
                             ts.result_file(wave_start_filename)
+                            # measured frequency, ROCOF and pass/fail of each test condition from the waveforms
+                            try:
+                                rt_results = frt_tracker.evaluate(frt_test_sequences, ds[0], names=[dataset_filename])
+                                frt_tracker.write_results(ts, rt_results)
+                            except p1547.p1547Error as e:
+                                ts.log_error('Ride-through evaluation of %s failed: %s' % (dataset_filename, e))
 
                     if data_ena:
                         ds = daq.data_capture_dataset()
@@ -394,8 +402,10 @@ info.param('frt.lf_period', label='Low frequency period (s):', default=299.0,act
 info.param('frt.hf_ena', label='High frequency mode settings:', default='Enabled', values=['Disabled', 'Enabled'])
 info.param('frt.hf_parameter', label='High frequency parameter (Hz):', default=61.8,active='frt.hf_ena', active_value=['Enabled'])
 info.param('frt.hf_period', label='High frequency period (s):', default=299.0,active='frt.hf_ena', active_value=['Enabled'])
+info.param('frt.rocof', label='Rate of change of frequency of the grid simulator (Hz/s):', default=3.0)
 info.param('frt.high_pwr_value', label='Power Output level (Over 90%):', default=0.9)
 info.param('frt.repetitions', label='Number of repetitions', default=3)
+info.param('frt.wfm_file', label='Waveform file saved by the model (empty for the one of the DAS)', default='')
 info.param('frt.wav_ena', label='Waveform acquisition needed (.mat->.csv)  ?', default='Yes', values=['Yes', 'No'])
 info.param('frt.data_ena', label='RMS acquisition needed (SVP creates .csv from block queries))?', default='No', values=['Yes', 'No'])
 
@@ -41,7 +41,6 @@ from svpelab import hil
 from svpelab import result as rslt
 from svpelab import p1547
 import script
-import numpy as np
 import collections
 
 FW = 'FW'  # Frequency-Watt
@@ -89,10 +88,11 @@ def test_run():
             absorb_powers = [False, True]
         else:
             absorb_powers = [False]
-        p_rated = ts.param_value('eut.p_rated')
-        s_rated = ts.param_value('eut.s_rated')
+        eut_params = p1547.get_eut_params(ts)
+        p_rated = eut_params.p_rated
+        s_rated = eut_params.s_rated
         # DC voltages
-        v_nom_in = ts.param_value('eut.v_in_nom')
+        v_nom_in = eut_params.v_in_nom
         irr = ts.param_value('fw.power_lvl')
         if mode == 'Above':
             if irr == 'All':
@@ -106,11 +106,11 @@ def test_run():
         else:
             pwr_lvls = [1.]
         # AC voltages
-        f_nom = ts.param_value('eut.f_nom')
-        f_min = ts.param_value('eut.f_min')
-        f_max = ts.param_value('eut.f_max')
-        p_min = ts.param_value('eut.p_min')
-        phases = ts.param_value('eut.phases')
+        f_nom = eut_params.f_nom
+        f_min = eut_params.f_min
+        f_max = eut_params.f_max
+        p_min = eut_params.p_min
+        phases = eut_params.phases
         # EUI FW parameters
         absorb_enable = ts.param_value('eut_fw.sink_power')
         p_rated_prime = ts.param_value('eut_fw.p_rated_prime')
@@ -195,6 +195,12 @@ def test_run():
         ts.result_file(result_summary_filename)
         result_summary.write(ActiveFunction.get_rslt_sum_col_name())
 
+        # Steps and targets of the whole test are compiled before any step is applied
+        step_plan = p1547.StepPlan.compile(ActiveFunction, function=FW, curves=fw_curves, pwrs=pwr_lvls,
+                                           modes=[mode], absorb=absorb_powers)
+        step_plan.save(ts.result_file_path('step_plan.csv'))
+        ActiveFunction.set_step_plan(step_plan)
+
         '''
         above_d) Adjust the EUT's available active power to Prated .
         below_d) ""         ""          "". Set the EUT's output power to 50% of P rated .
@@ -220,6 +226,7 @@ def test_run():
         below_p) ""                 ""                  "". Set the unit to absorb power at -50% of P rated . 
         '''
         for absorb_power in absorb_powers:
+            ActiveFunction.reset_absorb(absorb_power)
             if absorb_power:
                 if eut is not None:
                     if mode == 'Below':
@@ -348,6 +355,7 @@ def test_run():
 
     finally:
         if daq is not None:
+            ActiveFunction.teardown()
             daq.close()
         if pv is not None:
             if p_rated is not None:
@@ -446,6 +454,9 @@ info.param('eut_fw.p_min_prime', label='P\'min: minimum active power while sinki
            default=-0.2*3000.0, active='eut_vw.sink_power', active_value=['Yes'])
 
 
+# P1547 library parameters
+p1547.params(info)
+
 # Other equipment parameters
 der.params(info)
 gridsim.params(info)
@@ -147,13 +147,14 @@ def test_run():
         configuration_test = ts.param_value('iop_params.configuration_test') == 'Yes'
         monitoring_test = ts.param_value('iop_params.monitoring_test') == 'Yes'
 
-        v_nom = float(ts.param_value('eut.v_nom'))
-        p_rated = float(ts.param_value('eut.p_rated'))
+        eut_params = p1547.get_eut_params(ts)
+        v_nom = float(eut_params.v_nom)
+        p_rated = float(eut_params.p_rated)
         w_max = p_rated
-        s_rated = float(ts.param_value('eut.s_rated'))
-        var_rated = float(ts.param_value('eut.var_rated'))
+        s_rated = float(eut_params.s_rated)
+        var_rated = float(eut_params.var_rated)
         var_max = var_rated
-        wait_time = float(ts.param_value('eut.wait_time'))
+        wait_time = float(eut_params.wait_time)
 
         # initialize DER configuration
         eut = der1547.der1547_init(ts)
@@ -43,7 +43,6 @@ import script
 from svpelab import result as rslt
 from datetime import datetime, timedelta
 
-import numpy as np
 import collections
 import cmath
 import math
@@ -71,24 +70,25 @@ def test_run():
     result_params = None
 
     try:
-        cat = ts.param_value('eut.cat')
-        cat2 = ts.param_value('eut.cat2')
-        sink_power = ts.param_value('eut.sink_power')
-        p_rated = ts.param_value('eut.p_rated')
-        p_rated_prime = ts.param_value('eut.p_rated_prime')
-        s_rated = ts.param_value('eut.s_rated')
+        eut_params = p1547.get_eut_params(ts)
+        cat = eut_params.cat
+        cat2 = eut_params.cat2
+        sink_power = eut_params.sink_power
+        p_rated = eut_params.p_rated
+        p_rated_prime = eut_params.p_rated_prime
+        s_rated = eut_params.s_rated
 
         # DC voltages
-        v_nom_in = ts.param_value('eut.v_in_nom')
-        v_min_in = ts.param_value('eut.v_in_min')
-        v_max_in = ts.param_value('eut.v_in_max')
+        v_nom_in = eut_params.v_in_nom
+        v_min_in = eut_params.v_in_min
+        v_max_in = eut_params.v_in_max
 
         # AC voltages
-        v_nom = ts.param_value('eut.v_nom')
-        v_min = ts.param_value('eut.v_low')
-        v_max = ts.param_value('eut.v_high')
-        p_min = ts.param_value('eut.p_min')
-        phases = ts.param_value('eut.phases')
+        v_nom = eut_params.v_nom
+        v_min = eut_params.v_low
+        v_max = eut_params.v_high
+        p_min = eut_params.p_min
+        phases = eut_params.phases
 
         # EUI Absorb capabilities
         absorb = {}
@@ -97,11 +97,11 @@ def test_run():
         absorb['p_min_prime'] = ts.param_value('eut_vw.p_min_prime')
 
         # AC voltages
-        f_nom = ts.param_value('eut.f_nom')
-        f_min = ts.param_value('eut.f_min')
-        f_max = ts.param_value('eut.f_max')
-        p_min = ts.param_value('eut.p_min')
-        phases = ts.param_value('eut.phases')
+        f_nom = eut_params.f_nom
+        f_min = eut_params.f_min
+        f_max = eut_params.f_max
+        p_min = eut_params.p_min
+        phases = eut_params.phases
         # EUI FW parameters
         absorb_enable = ts.param_value('eut_fw.sink_power')
         p_rated_prime = ts.param_value('eut_fw.p_rated_prime')
@@ -427,6 +427,7 @@ def test_run():
                 pv.power_set(p_rated)
             pv.close()
         if daq is not None:
+            ActiveFunction.teardown()
             daq.close()
         if eut is not None:
             #eut.fixed_pf(params={'Ena': False, 'PF': 1.0})
@@ -509,6 +510,9 @@ info.param('eut.imbalance_resp', label='EUT response to phase imbalance is calcu
 # Add the SIRFN logo
 info.logo('sirfn.png')
 
+# P1547 library parameters
+p1547.params(info)
+
 # Other equipment parameters
 der.params(info)
 gridsim.params(info)
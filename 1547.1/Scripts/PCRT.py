@@ -40,12 +40,18 @@ def test_run():
         test_num = ts.param_value('phase_jump.test_num')
         n_iter = ts.param_value('phase_jump.n_iter')
         eut_startup_time = ts.param_value('phase_jump_startup.eut_startup_time')
+        wfm_file = ts.param_value('phase_jump.wfm_file')
+        direction = ts.param_value('phase_jump.direction')
+        f_nom = float(ts.param_value('phase_jump.f_nom') or 60.0)
 
         # initialize the hardware in the loop
         phil = hil.hil_init(ts)
+        waiter = p1547.SimulationWaiter(ts, phil)
+        pcrt_analyzer = p1547.PhaseJumpAnalyzer(f_nom=f_nom)
 
         # initialize the das
         daq = das.das_init(ts)
+        wfm_file = wfm_file or p1547.get_waveform_file(daq)
         ts.sleep(0.5)
 
         # initialize the pv
@@ -92,162 +98,17 @@ def test_run():
                  (lagging) phase shift, and either test condition may be used.
         -----------------------------------------------------------------------------------------------------------        
         '''
-        parameters = []
         phase_jump_time = eut_startup_time + 5.
-        if test_num == 1:
-            stop_time = phase_jump_time + 2.  # the end of the simulation
-            ts.log('Configuring the Opal Simulation to Run Test 1, Variation 1 (A-B-A).')
-            # Phase A Switching times and Phase Angles
-            parameters.append((model_name + '/SM_Source/Switch1/Threshold', phase_jump_time))
-            parameters.append((model_name + '/SM_Source/Switch2/Threshold', phase_jump_time + 0.5))
-            parameters.append((model_name + '/SM_Source/Phase Angle Phase A0/Value', 0))
-            parameters.append((model_name + '/SM_Source/Phase Angle Phase A1/Value', 60))
-            # Phase B Switching times and Phase Angles
-            parameters.append((model_name + '/SM_Source/Switch3/Threshold', stop_time))
-            parameters.append((model_name + '/SM_Source/Switch4/Threshold', stop_time))
-            parameters.append((model_name + '/SM_Source/Phase Angle Phase B0/Value', 120))
-            parameters.append((model_name + '/SM_Source/Phase Angle Phase B1/Value', 120))
-            # Phase C Switching times and Phase Angles
-            parameters.append((model_name + '/SM_Source/Switch7/Threshold', stop_time))
-            parameters.append((model_name + '/SM_Source/Switch8/Threshold', stop_time))
-            parameters.append((model_name + '/SM_Source/Phase Angle Phase C0/Value', -120))
-            parameters.append((model_name + '/SM_Source/Phase Angle Phase C1/Value', -120))
-            # Trigger Signal Switching times and Magnitude
-            parameters.append((model_name + '/SM_Source/Switch5/Threshold', phase_jump_time))
-            parameters.append((model_name + '/SM_Source/Switch6/Threshold', phase_jump_time + 0.5))
-            parameters.append((model_name + '/SM_Source/Trigger Low/Value', 0))
-            parameters.append((model_name + '/SM_Source/Trigger High/Value', 5))
-
-            ''' RTLab OpWriteFile Math
-            Duration of acquisition in number of points: Npoints = (Tend - Tstart) / (Ts * dec) = 4/((0.000040*5) = 2e4
-            Acquisition frame duration: Tframe = Nbss * Ts * dec = 1000*0.000040*5 = 0.2 sec
-            Number of buffers to be acquired: Nbuffers = Npoints / Nbss = (Tend - Tstart) / Tframe = 20
-            Minimum file size: MinSize= Nbuffers x SizeBuf = [(Tend - Tstart) / Ts ] * (Nsig+1) * 8 * Nbss 
-                SizeBuf = 1/Nbuffers * {[(Tend - Tstart) / Ts ]*(Nsig+1)*8*Nbss} = [(4/0.000040)*8*8*1e3]/20 = 3.2e8
-            Size of one buffer in bytes (SizeBuf) = (Nsig+1) * 8 * Nbss (Minimum) = 8*8*20 = 1280
-            '''
-            # Configure when the waveform captures start and stop.
-            parameters.append((model_name + '/SM_Source/Start Capture Pulse Start/Threshold', phase_jump_time - 0.5))
-            parameters.append((model_name + '/SM_Source/Start Capture Pulse End/Threshold', phase_jump_time + 1.5))
-            parameters.append((model_name + '/SM_Source/End Capture Pulse Start/Threshold', stop_time + 1))
-            parameters.append((model_name + '/SM_Source/End Capture Pulse End/Threshold', stop_time + 1))
-        elif test_num == 2:
-            stop_time = phase_jump_time + 2
-            ts.log('Configuring the Opal Simulation to Run Test 2, Variation 1 (A-C-A).')
-            # Phase A Switching times and Phase Angles
-            parameters.append((model_name + '/SM_Source/Switch1/Threshold', stop_time))
-            parameters.append((model_name + '/SM_Source/Switch2/Threshold', stop_time))
-            parameters.append((model_name + '/SM_Source/Phase Angle Phase A0/Value', 0))
-            parameters.append((model_name + '/SM_Source/Phase Angle Phase A1/Value', 0))
-            # Phase B Switching times and Phase Angles
-            parameters.append((model_name + '/SM_Source/Switch3/Threshold', phase_jump_time))
-            parameters.append((model_name + '/SM_Source/Switch4/Threshold', phase_jump_time + 0.5))
-            parameters.append((model_name + '/SM_Source/Phase Angle Phase B0/Value', 120))
-            parameters.append((model_name + '/SM_Source/Phase Angle Phase B1/Value', 180))
-            # Phase C Switching times and Phase Angles
-            parameters.append((model_name + '/SM_Source/Switch7/Threshold', stop_time))
-            parameters.append((model_name + '/SM_Source/Switch8/Threshold', stop_time))
-            parameters.append((model_name + '/SM_Source/Phase Angle Phase C0/Value', -120))
-            parameters.append((model_name + '/SM_Source/Phase Angle Phase C1/Value', -120))
-            # Trigger Signal Switching times and Magnitude
-            parameters.append((model_name + '/SM_Source/Switch5/Threshold', phase_jump_time))
-            parameters.append((model_name + '/SM_Source/Switch6/Threshold', phase_jump_time + 0.5))
-            parameters.append((model_name + '/SM_Source/Trigger Low/Value', 0))
-            parameters.append((model_name + '/SM_Source/Trigger High/Value', 5))
-
-            # Configure when the waveform captures start and stop.
-            parameters.append((model_name + '/SM_Source/Start Capture Pulse Start/Threshold', phase_jump_time - 0.5))
-            parameters.append((model_name + '/SM_Source/Start Capture Pulse End/Threshold', phase_jump_time + 1.5))
-            parameters.append((model_name + '/SM_Source/End Capture Pulse Start/Threshold', stop_time + 1))
-            parameters.append((model_name + '/SM_Source/End Capture Pulse End/Threshold', stop_time + 1))
-        elif test_num == 3:
-            stop_time = phase_jump_time + 2
-            ts.log('Configuring the Opal Simulation to Run Test 3, Variation 1 (A-D-A).')
-            # Phase A Switching times and Phase Angles
-            parameters.append((model_name + '/SM_Source/Switch1/Threshold', stop_time))
-            parameters.append((model_name + '/SM_Source/Switch2/Threshold', stop_time))
-            parameters.append((model_name + '/SM_Source/Phase Angle Phase A0/Value', 0))
-            parameters.append((model_name + '/SM_Source/Phase Angle Phase A1/Value', 0))
-            # Phase B Switching times and Phase Angles
-            parameters.append((model_name + '/SM_Source/Switch3/Threshold', stop_time))
-            parameters.append((model_name + '/SM_Source/Switch4/Threshold', stop_time))
-            parameters.append((model_name + '/SM_Source/Phase Angle Phase B0/Value', 120))
-            parameters.append((model_name + '/SM_Source/Phase Angle Phase B1/Value', 120))
-            # Phase C Switching times and Phase Angles
-            parameters.append((model_name + '/SM_Source/Switch7/Threshold', phase_jump_time))
-            parameters.append((model_name + '/SM_Source/Switch8/Threshold', phase_jump_time + 0.5))
-            parameters.append((model_name + '/SM_Source/Phase Angle Phase C0/Value', -120))
-            parameters.append((model_name + '/SM_Source/Phase Angle Phase C1/Value', -60))
-            # Trigger Signal Switching times and Magnitude
-            parameters.append((model_name + '/SM_Source/Switch5/Threshold', phase_jump_time))
-            parameters.append((model_name + '/SM_Source/Switch6/Threshold', phase_jump_time + 0.5))
-            parameters.append((model_name + '/SM_Source/Trigger Low/Value', 0))
-            parameters.append((model_name + '/SM_Source/Trigger High/Value', 5))
-
-            # Configure when the waveform captures start and stop.
-            parameters.append((model_name + '/SM_Source/Start Capture Pulse Start/Threshold', phase_jump_time - 0.5))
-            parameters.append((model_name + '/SM_Source/Start Capture Pulse End/Threshold', phase_jump_time + 1.5))
-            parameters.append((model_name + '/SM_Source/End Capture Pulse Start/Threshold', stop_time + 1))
-            parameters.append((model_name + '/SM_Source/End Capture Pulse End/Threshold', stop_time + 1))
-        elif test_num == 4:
-            stop_time = phase_jump_time + 61
-            ts.log('Configuring the Opal Simulation to Run Test 4, Variation 1 (A-E-A).')
-            # Phase A Switching times and Phase Angles
-            parameters.append((model_name + '/SM_Source/Switch1/Threshold', phase_jump_time))
-            parameters.append((model_name + '/SM_Source/Switch2/Threshold', phase_jump_time + 60.))
-            parameters.append((model_name + '/SM_Source/Phase Angle Phase A0/Value', 0))
-            parameters.append((model_name + '/SM_Source/Phase Angle Phase A1/Value', 20))
-            # Phase B Switching times and Phase Angles
-            parameters.append((model_name + '/SM_Source/Switch3/Threshold', phase_jump_time))
-            parameters.append((model_name + '/SM_Source/Switch4/Threshold', phase_jump_time + 60.))
-            parameters.append((model_name + '/SM_Source/Phase Angle Phase B0/Value', 120))
-            parameters.append((model_name + '/SM_Source/Phase Angle Phase B1/Value', 140))
-            # Phase C Switching times and Phase Angles
-            parameters.append((model_name + '/SM_Source/Switch7/Threshold', phase_jump_time))
-            parameters.append((model_name + '/SM_Source/Switch8/Threshold', phase_jump_time + 60.))
-            parameters.append((model_name + '/SM_Source/Phase Angle Phase C0/Value', -120))
-            parameters.append((model_name + '/SM_Source/Phase Angle Phase C1/Value', -100))
-            # Trigger Signal Switching times and Magnitude
-            parameters.append((model_name + '/SM_Source/Switch5/Threshold', phase_jump_time))
-            parameters.append((model_name + '/SM_Source/Switch6/Threshold', phase_jump_time + 60.))
-            parameters.append((model_name + '/SM_Source/Trigger Low/Value', 0))
-            parameters.append((model_name + '/SM_Source/Trigger High/Value', 5))
-
-            # Configure when the waveform captures start and stop.
-            parameters.append((model_name + '/SM_Source/Start Capture Pulse Start/Threshold', phase_jump_time - 0.5))
-            parameters.append((model_name + '/SM_Source/Start Capture Pulse End/Threshold', phase_jump_time + 1.5))
-            parameters.append((model_name + '/SM_Source/End Capture Pulse Start/Threshold', phase_jump_time + 59))
-            parameters.append((model_name + '/SM_Source/End Capture Pulse End/Threshold', stop_time))
-
-        else:
-            # phase jump is 60 seconds
-            stop_time = phase_jump_time + 61.
-            ts.log('Configuring the Opal Simulation to Run Test 5, Variation 1 (A-F-A).')
-            # Phase A Switching times and Phase Angles
-            parameters.append((model_name + '/SM_Source/Switch1/Threshold', phase_jump_time))
-            parameters.append((model_name + '/SM_Source/Switch2/Threshold', phase_jump_time + 60.))
-            parameters.append((model_name + '/SM_Source/Phase Angle Phase A0/Value', 0))
-            parameters.append((model_name + '/SM_Source/Phase Angle Phase A1/Value', -20))
-            # Phase B Switching times and Phase Angles
-            parameters.append((model_name + '/SM_Source/Switch3/Threshold', phase_jump_time))
-            parameters.append((model_name + '/SM_Source/Switch4/Threshold', phase_jump_time + 60.))
-            parameters.append((model_name + '/SM_Source/Phase Angle Phase B0/Value', 120))
-            parameters.append((model_name + '/SM_Source/Phase Angle Phase B1/Value', 100))
-            # Phase C Switching times and Phase Angles
-            parameters.append((model_name + '/SM_Source/Switch7/Threshold', phase_jump_time))
-            parameters.append((model_name + '/SM_Source/Switch8/Threshold', phase_jump_time + 60.))
-            parameters.append((model_name + '/SM_Source/Phase Angle Phase C0/Value', -120))
-            parameters.append((model_name + '/SM_Source/Phase Angle Phase C1/Value', -140))
-            # Trigger Signal Switching times and Magnitude
-            parameters.append((model_name + '/SM_Source/Switch5/Threshold', phase_jump_time))
-            parameters.append((model_name + '/SM_Source/Switch6/Threshold', phase_jump_time + 60.))
-            parameters.append((model_name + '/SM_Source/Trigger Low/Value', 0))
-            parameters.append((model_name + '/SM_Source/Trigger High/Value', 5))
-
-            parameters.append((model_name + '/SM_Source/Start Capture Pulse Start/Threshold', phase_jump_time - 0.5))
-            parameters.append((model_name + '/SM_Source/Start Capture Pulse End/Threshold', phase_jump_time + 1.5))
-            parameters.append((model_name + '/SM_Source/End Capture Pulse Start/Threshold', phase_jump_time + 59))
-            parameters.append((model_name + '/SM_Source/End Capture Pulse End/Threshold', stop_time))
+        # the parameters of all the tests are derived from Table 9 and their captures validated before the first run
+        pcrt_tests = p1547.get_pcrt_tests(model_name, phase_jump_time, reverse=(direction == 'Reverse'))
+        try:
+            pcrt_test = pcrt_tests[int(test_num)]
+        except (KeyError, ValueError):
+            raise script.ScriptFail('PCRT test %s is not defined' % test_num)
+        stop_time = pcrt_test.stop_time  # the end of the simulation
+        ts.log('Configuring the Opal Simulation to Run Test %d, Variation 1 (%s, %s).'
+               % (pcrt_test.test_num, pcrt_test.label, 'reverse' if pcrt_test.reverse else 'forward'))
+        ts.log_debug(pcrt_test)
 
         if phil is not None:
             # phil.get_signals(verbose=True)
@@ -263,9 +124,8 @@ def test_run():
 
             for n in range(n_iter):
                 # write the parameters each test iteration
-                for p, v in parameters:
-                    ts.log_debug('Setting %s = %s' % (p, v))
-                    phil.set_params(p, v)
+                pcrt_test.push(ts, phil)
+                waiter.mark_file(wfm_file)
 
                 if load == 'Yes':
                     ts.sleep(1)
@@ -274,17 +134,14 @@ def test_run():
                     ts.log("    {}".format(phil.start_simulation()))
                     daq.data_capture(True)  # Start RMS data capture
 
-                sim_time = phil.get_time()
-                while (stop_time-sim_time) > 1.0:  # final sleep will get to stop_time.
-                    sim_time = phil.get_time()
-                    ts.log('Sim Time: %s.  Waiting another %s sec before saving data.' % (sim_time, stop_time-sim_time))
-                    ts.sleep(1)
+                # final poll is within 1 s of stop_time.
+                waiter.wait_stop_time(stop_time, margin=1.0)
 
                 daq.data_capture(False)
 
                 # complete data capture
-                ts.log('Waiting 10 seconds for Opal to save the waveform data.')
-                ts.sleep(10)
+                ts.log('Waiting for Opal to save the waveform data.')
+                waiter.wait_file(wfm_file)
 
                 test_filename = 'PhaseJump_Test%s_Num%s' % (test_num, n+1)
                 ts.log('------------{}------------'.format(test_filename))
@@ -298,7 +155,7 @@ def test_run():
                 ds[0].to_csv(ts.result_file_path(wave_start_filename))
                 ts.result_file(wave_start_filename)
 
-                if test_num in [4, 5]:
+                if len(pcrt_test.captures) > 1:
                     wave_end_filename = '%s_endwave.csv' % test_filename
                     ts.log('Saving file: %s' % wave_end_filename)
                     ds[1].to_csv(ts.result_file_path(wave_end_filename))
@@ -306,6 +163,14 @@ def test_run():
                 else:
                     wave_end_filename = None
 
+                # locate the phase jumps and grade the current recovery of the EUT
+                wave_datasets = ds[:len(pcrt_test.captures)]
+                try:
+                    pcrt_results = pcrt_analyzer.evaluate([(test_filename, test_num, wave_datasets)])
+                    pcrt_analyzer.write_results(ts, pcrt_results)
+                except p1547.p1547Error as e:
+                    ts.log_error('Phase jump evaluation of %s failed: %s' % (test_filename, e))
+
                 ts.log('Sampling RMS complete')
                 rms_dataset_filename = test_filename + "_RMS.csv"
                 ds = daq.data_capture_dataset()
@@ -398,6 +263,10 @@ info.param('hil_config.model_name', label='Model Name', default="Phase_Jump_A_B_
 info.param_group('phase_jump', label='IEEE 1547.1 Phase Jump Configuration')
 info.param('phase_jump.test_num', label='Test Number (1-5)', default=1)
 info.param('phase_jump.n_iter', label='Number of Iterations', default=5)
+info.param('phase_jump.direction', label='Phase jump direction of the tests 1-3', default='Forward',
+           values=['Forward', 'Reverse'])
+info.param('phase_jump.f_nom', label='Nominal frequency (Hz)', default=60.0)
+info.param('phase_jump.wfm_file', label='Waveform file saved by the model (empty for the one of the DAS)', default='')
 info.param_group('phase_jump_startup', label='IEEE 1547.1 Phase Jump Startup Time', glob=True)
 info.param('phase_jump_startup.eut_startup_time', label='EUT Startup Time (s)', default=85, glob=True)
 
@@ -68,30 +68,31 @@ def test_run():
 
 
     try:
-        cat = ts.param_value('eut.cat')
-        cat2 = ts.param_value('eut.cat2')
-        sink_power = ts.param_value('eut.sink_power')
-        p_rated = ts.param_value('eut.p_rated')
-        p_rated_prime = ts.param_value('eut.p_rated_prime')
-        s_rated = ts.param_value('eut.s_rated')
-        var_rated = ts.param_value('eut.var_rated')
+        eut_params = p1547.get_eut_params(ts)
+        cat = eut_params.cat
+        cat2 = eut_params.cat2
+        sink_power = eut_params.sink_power
+        p_rated = eut_params.p_rated
+        p_rated_prime = eut_params.p_rated_prime
+        s_rated = eut_params.s_rated
+        var_rated = eut_params.var_rated
 
         # DC voltages
         v_nom_in_enabled = ts.param_value('cpf.v_in_nom')
         v_min_in_enabled = ts.param_value('cpf.v_in_min')
         v_max_in_enabled = ts.param_value('cpf.v_in_max')
 
-        v_nom_in = ts.param_value('eut.v_in_nom')
+        v_nom_in = eut_params.v_in_nom
         v_min_in = ts.param_value('eut_cpf.v_in_min')
         v_max_in = ts.param_value('eut_cpf.v_in_max')
 
         # AC voltages
-        v_nom = ts.param_value('eut.v_nom')
-        v_min = ts.param_value('eut.v_low')
-        v_max = ts.param_value('eut.v_high')
-        p_min = ts.param_value('eut.p_min')
-        p_min_prime = ts.param_value('eut.p_min_prime')
-        phases = ts.param_value('eut.phases')
+        v_nom = eut_params.v_nom
+        v_min = eut_params.v_low
+        v_max = eut_params.v_high
+        p_min = eut_params.p_min
+        p_min_prime = eut_params.p_min_prime
+        phases = eut_params.phases
         pri_response_time = ts.param_value('pri.pri_response_time')
 
         #Reactive power
@@ -101,7 +102,7 @@ def test_run():
         wv_status = ts.param_value('pri.wv_status')
 
         # Pass/fail accuracies
-        pf_msa = ts.param_value('eut.pf_msa')
+        pf_msa = eut_params.pf_msa
 
         # Imbalance configuration
         imbalance_fix = ts.param_value('cpf.imbalance_fix')
@@ -199,6 +200,11 @@ def test_run():
         ts.result_file(result_summary_filename)
         result_summary.write(ActiveFunction.get_rslt_sum_col_name())
 
+        # Steps and targets of the whole test are compiled before any step is applied
+        step_plan = p1547.StepPlan.compile(ActiveFunction, function=PRI, modes=mode)
+        step_plan.save(ts.result_file_path('step_plan.csv'))
+        ActiveFunction.set_step_plan(step_plan)
+
         """
         d) Adjust the EUT's available active power to Prated. For an EUT with an input voltage range, set the input
         voltage to Vin_nom. The EUT may limit active power throughout the test to meet reactive power requirements.
@@ -444,6 +450,7 @@ def test_run():
                 pv.power_set(p_rated)
             pv.close()
         if daq is not None:
+            ActiveFunction.teardown()
             daq.close()
         if eut is not None:
             # eut.fixed_pf(params={'Ena': False, 'PF': 1.0})
@@ -515,6 +522,9 @@ info.param('eut.f_nom', label='Nominal AC frequency (Hz)', default=60.0)
 # Add the SIRFN logo
 info.logo('sirfn.png')
 
+# P1547 library parameters
+p1547.params(info)
+
 # Other equipment parameters
 der.params(info)
 gridsim.params(info)
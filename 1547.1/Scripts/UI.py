@@ -34,25 +34,6 @@ import time
 import pprint
 
 
-def find_rlc(p_utility, q_utility, r_set, l_set, c_set):
-    """
-    Proportional controllers for adjusting the resistance and capacitance values in the RLC load bank
-
-    :param p_utility: utility/source active power in watts
-    :param q_utility: utility/source reactive power in var
-    :param r_set: prior resistor % change
-    :param l_set: prior inductor % change
-    :param c_set: prior capacitor % change
-    :return:
-    """
-
-    smoothing_factor = 0.50  # only move a small percentage of the desired change for stability
-    cap = c_set + (6./1300. * q_utility) * smoothing_factor
-    res = r_set + (50.5/11700. * p_utility) * smoothing_factor
-
-    return res, l_set, cap
-
-
 def set_grid_support_functions(eut, cat, cat2, test_params):
     """
     Configure EUT for experiment
@@ -308,9 +289,9 @@ def run_ui_test(phil, model_name, daq, test_num, t_trips, q_inc, high_freq_count
     """
 
     # adjust reactive load
-    ctrl_sigs = phil.get_control_signals(details=False)
-    ctrl_sigs[17] = c_set * q_inc  # Capacitor Pot
-    phil.set_control_signals(values=ctrl_sigs)
+    ctrl_sigs = p1547.get_hil_control_signals(ts, phil, names=p1547.UI_CONTROL_SIGNALS)
+    ctrl_sigs['CAP_POT'] = c_set * q_inc  # Capacitor Pot
+    ctrl_sigs.push()
 
     '''
     2) With the EUT and load operating at stable conditions, record the voltage and current at switch
@@ -333,8 +314,8 @@ def run_ui_test(phil, model_name, daq, test_num, t_trips, q_inc, high_freq_count
     '''
     ts.log('Step e)3) Opening switch s3')
     # waveform OpWrite configured to capture when S3 is opened
-    ctrl_sigs[2] = 1  #3 = Islanding Test
-    phil.set_control_signals(values=ctrl_sigs)
+    ctrl_sigs['ISLANDING_TEST'] = 1  #3 = Islanding Test
+    ctrl_sigs.push()
 
     ts.log('Waiting 10 seconds to determine trip time and island frequency.')
     ts.sleep(10)
@@ -343,7 +324,6 @@ def run_ui_test(phil, model_name, daq, test_num, t_trips, q_inc, high_freq_count
     daq.data_sample()
     t_trip = daq.data_read()['TRIP_TIME']
     freq = daq.data_read()['ISLAND_FREQ']  # calculate fundamental frequency after S3 is open
-    t_trips[q_inc] = t_trip  # append trip time in dict with reactive power increment value key
     ts.log('For reactive power setpoint %0.3f, the island frequency was %0.2f Hz and the trip time was %0.2f s' %
            (q_inc, freq, t_trip))
 
@@ -376,13 +356,32 @@ def run_ui_test(phil, model_name, daq, test_num, t_trips, q_inc, high_freq_count
     ds[0].to_csv(ts.result_file_path(ui_wave))
     ts.result_file(ui_wave)
 
+    eut_params = p1547.get_eut_params(ts)
+    f_nom = eut_params.f_nom
+    # clearing time and island frequency from the waveforms, they replace the values measured by the model
+    try:
+        clearing = p1547.IslandingClearingTime(v_nom=eut_params.v_nom, f_nom=f_nom).evaluate(ds[0],
+                                                                                             name=test_filename)
+    except p1547.p1547Error as e:
+        # e.g. the trigger never changed in the capture: the trip time and frequency of the console are kept
+        ts.log_warning('No clearing time from the waveforms (%s), keeping the trip time of %s s and the island '
+                       'frequency of %s Hz measured by the model' % (e, t_trip, freq))
+    else:
+        ts.log('From the waveforms, S3 opened at %0.4f s, the island frequency was %0.2f Hz and the clearing time '
+               'was %0.4f s (%s)' % (clearing['S3_OPEN_TIME'], clearing['ISLAND_FREQ'], clearing['CLEARING_TIME'],
+                                     clearing['RESULT']))
+        if clearing['CLEARED']:
+            t_trip = clearing['CLEARING_TIME']
+        if clearing['ISLAND_FREQ'] > 0:  # NaN when the island did not last one cycle
+            freq = clearing['ISLAND_FREQ']
+    t_trips[q_inc] = t_trip  # append trip time in dict with reactive power increment value key
+
     '''
     If at any point at least three test instances show island frequency increasing above the
     fundamental frequency of the ac test source after S3 was opened and at least three instances
     show island frequency decreasing below the fundamental frequency of the ac test source after
     S3 was opened S3 was opened, the remaining 1% steps and step e)5) may be omitted.
     '''
-    f_nom = ts.param_value('eut.f_nom')
     if freq > f_nom:
         high_freq_count += 1
     else:
@@ -398,18 +397,18 @@ def energize_system(ctrl_sigs, phil, daq, eut_startup_time, p_rated):
     """
     Power on amplifier and wait for EUT to start
 
-    :param ctrl_sigs: control signals from Console
+    :param ctrl_sigs: control signals of the Console (p1547.ControlSignals)
     :param phil: phil object
     :param daq: daq object
     :param eut_startup_time: maximum time to wait for EUT start up
     :param p_rated: power rating of EUT
     :return: None
     """
-    ctrl_sigs[2] = 0.  # close S3
-    ctrl_sigs[3] = 1.  # energize amplifier
+    ctrl_sigs['ISLANDING_TEST'] = 0.  # close S3
+    ctrl_sigs['AMETEK_OUTPUT'] = 1.  # energize amplifier
     # if not ts.confirm('ABOUT TO ENERGIZE AMPLIFIER - OK?'):
     #     raise Exception
-    phil.set_control_signals(values=ctrl_sigs)
+    ctrl_sigs.push()
 
     count = 0
     while count < eut_startup_time:
@@ -493,17 +492,30 @@ def test_run():
         n_iter = ts.param_value('phase_jump.n_iter')
         eut_startup_time = ts.param_value('phase_jump_startup.eut_startup_time')
 
-        v_ll = ts.param_value('eut.v_ll')
-        v_nom = ts.param_value('eut.v_nom')
-        s_rated = ts.param_value('eut.s_rated')
+        eut_params = p1547.get_eut_params(ts)
+        v_ll = eut_params.v_ll
+        v_nom = eut_params.v_nom
+        s_rated = eut_params.s_rated
         p_rated = s_rated
         phase_comp = ts.param_value('phase_jump.phase_comp')
         v_tranducer_scale = ts.param_value('phase_jump.transducer_gain')
-
-        cat = ts.param_value('eut.cat')
-        cat2 = ts.param_value('eut.cat2')
-        var_rated = ts.param_value('eut.var_rated')
-        phases = ts.param_value('eut.phases')
+        q_sweep = ts.param_value('phase_jump.q_sweep')
+        prescreen_ena = q_sweep == 'Search' and ts.param_value('phase_jump.prescreen') == 'Yes'
+        if prescreen_ena:
+            sfs_gain = ts.param_value('ui_prescreen.sfs_gain')
+            # the limits are in p.u. of the nominal voltage and frequency
+            trip_settings = dict(
+                (name, (quantity, comparison, ts.param_value('ui_prescreen.%s_limit' % name.lower()),
+                        ts.param_value('ui_prescreen.%s_time' % name.lower())))
+                for name, (quantity, comparison, _, _) in p1547.UI_TRIP_SETTINGS.items())
+            if not sfs_gain:
+                ts.log_warning('No active anti-islanding method in the island prescreen (SFS gain = 0), the balanced '
+                               'islands only trip on the passive protection')
+
+        cat = eut_params.cat
+        cat2 = eut_params.cat2
+        var_rated = eut_params.var_rated
+        phases = eut_params.phases
 
         '''
         a) Test circuit configuration:
@@ -773,6 +785,20 @@ def test_run():
                 test = str(test_number) + 'B'
                 test_params = cat_b_tests[test]  # This is completed by the RT-Lab Code
 
+            # offline prediction of the island of each reactive load setting of step e)4), it gives the first
+            # setting of the search
+            q_start = 1.0
+            if prescreen_ena:
+                prescreen = p1547.IslandSimulator(f_nom=eut_params.f_nom, sfs_gain=sfs_gain,
+                                                  trip_settings=trip_settings).prescreen(test_params)
+                prescreen_file = 'UI_Test_%s_prescreen.csv' % test
+                prescreen.to_csv(ts.result_file_path(prescreen_file), index=False)
+                ts.result_file(prescreen_file)
+                ts.log('Predicted clearing times of test %s (s): %s' %
+                       (test, ', '.join('Q%0.2f: %0.3f-%0.3f' % (row.Q_INC, row.T_MIN, row.T_MAX)
+                                        for row in prescreen.sort_values('PRIORITY').itertuples())))
+                q_start = prescreen.loc[prescreen['PRIORITY'].idxmin(), 'Q_INC']
+
             if compilation == 'Yes':
                 ts.sleep(1)
                 ts.log("    Model ID: {}".format(phil.compile_model().get("modelId")))
@@ -790,14 +816,14 @@ def test_run():
                 daq.data_capture(True)  # Start RMS data capture
 
             # Set test number to initialize the RLC parameter based on Table 12 or 13 - done with test num update
-            ctrl_sigs = phil.get_control_signals(details=False)
+            ctrl_sigs = p1547.get_hil_control_signals(ts, phil, names=p1547.UI_CONTROL_SIGNALS).read()
             # ts.log_debug('Control signals on load: %s' % str(ctrl_sigs))
-            ctrl_sigs[0] = float(test_number)  # test num
-            ctrl_sigs[4] = v_ll  # set line-line voltage
-            ctrl_sigs[5] = s_rated  # set EUT apparent power
-            ctrl_sigs[7] = 12  # degrees, must be determined beforehand
-            ctrl_sigs[17] = 0  # cap pot
-            ctrl_sigs[8] = 0  # r pot
+            ctrl_sigs['TEST_NUM'] = float(test_number)  # test num
+            ctrl_sigs['INV_VLL'] = v_ll  # set line-line voltage
+            ctrl_sigs['INV_VAMAX'] = s_rated  # set EUT apparent power
+            ctrl_sigs['PHASE_COMP'] = 12  # degrees, must be determined beforehand
+            ctrl_sigs['CAP_POT'] = 0  # cap pot
+            ctrl_sigs['RES_POT'] = 0  # r pot
             ts.log_debug('ctrl_sigs: %s' % ctrl_sigs)
 
             energize_system(ctrl_sigs, phil, daq, eut_startup_time, p_rated)
@@ -815,8 +841,9 @@ def test_run():
             qs3_pu = meas['AC_Q_S3_PU']
 
             v_out_of_band = True
-            # tune RLC to get target P/Q levels through switch 3
-            c = 0
+            # tune RLC to get target P/Q levels through switch 3, starting from the proportional gains of the load
+            # bank: 50.5% of the resistor pot per 11700 W and 6% of the capacitor pot per 1300 var
+            balancer = p1547.RlcBalancer(ts, gains=(50.5/11700.*p_rated, 6./1300.*p_rated))
             while not(-0.02 < ps3_pu < 0.02) or not(-0.02 < qs3_pu < 0.02) or v_out_of_band:
                 # calculations to determine RLC adjustments
                 daq.data_sample()
@@ -825,13 +852,14 @@ def test_run():
                 q_load = meas['AC_Q_LOAD']
                 p_utility = meas['AC_SOURCE_P']
                 q_utility = meas['AC_SOURCE_Q']
+                ps3_pu = meas['AC_P_S3_PU']
+                qs3_pu = meas['AC_Q_S3_PU']
 
                 # Adjust
-                ctrl_sigs = phil.get_control_signals()
                 ts.log_debug('ctrl_sigs: %s' % ctrl_sigs)
-                r_set = ctrl_sigs[8]
-                l_set = ctrl_sigs[14]
-                c_set = ctrl_sigs[17]
+                r_set = ctrl_sigs['RES_POT']
+                l_set = ctrl_sigs['IND_POT']
+                c_set = ctrl_sigs['CAP_POT']
                 ts.log_debug('Prior p_load = %s W, q_load = %s var, p_utility = %s W, q_utility = %s var, '
                              'RLC = [%s, %s, %s]%%' % (p_load, q_load, p_utility, q_utility,
                                                                 r_set, l_set, c_set))
@@ -839,12 +867,13 @@ def test_run():
                              'RLC = [%0.3f, %0.3f, %0.3f]%%' % (p_load, q_load, p_utility, q_utility,
                                                                 r_set, l_set, c_set))
 
-                r, l, c = find_rlc(p_utility, q_utility, r_set, l_set, c_set)
+                r, c = balancer.step(r_set, c_set, ps3_pu, qs3_pu)
+                l = l_set
                 # ts.log('Setting R to change %0.3f%%, L to change %0.3f%%, C to change %0.3f%%' % (r, l, c))
-                ctrl_sigs[8] = r  # Resistors Pot
-                ctrl_sigs[14] = l  # Inductor Pot
-                ctrl_sigs[17] = c  # Capacitor Pot
-                phil.set_control_signals(values=ctrl_sigs)
+                ctrl_sigs['RES_POT'] = r  # Resistors Pot
+                ctrl_sigs['IND_POT'] = l  # Inductor Pot
+                ctrl_sigs['CAP_POT'] = c  # Capacitor Pot
+                ctrl_sigs.push()
 
                 ts.sleep(5)  # wait to see how changes affect P/Q
                 daq.data_sample()
@@ -877,6 +906,7 @@ def test_run():
                 ts.log_debug('WHILE LOOP LOGIC: not(-0.02 < ps3_pu < 0.02) = %s' % (not(-0.02 < qs3_pu < 0.02)))
                 ts.log_debug('WHILE LOOP LOGIC: v_out_of_band = %s' % (v_out_of_band))
 
+            balancer.done()
             ts.log_debug('\t\t TARGET \t Value')
             ts.log_debug('EUT P \t\t %0.5f \t\t %0.5f' % (test_params['p_eut'], meas['AC_P']/p_rated))
             ts.log_debug('EUT Q \t\t %0.5f \t\t %0.5f' % (test_params['q_eut'], meas['AC_Q']/p_rated))
@@ -914,10 +944,9 @@ def test_run():
             4) Open switch S3. If, after 10 s, the island circuit remains energized, the test setup is considered
             verified. Measure and record the voltage and frequency of the islanding operation.
             '''
-            ctrl_sigs = phil.get_control_signals()
             ts.log('Step d)4): Opening switch S3 to verify the EUT will island for 10 seconds.')
-            ctrl_sigs[2] = 1  # open S3 switch (for islanding test execution)
-            phil.set_control_signals(values=ctrl_sigs)
+            ctrl_sigs['ISLANDING_TEST'] = 1  # open S3 switch (for islanding test execution)
+            ctrl_sigs.push()
             start = time.time()
             end = start + 10
             ts.log('Step d)4): Measuring voltage and frequency of the island.')
@@ -933,8 +962,8 @@ def test_run():
             5) De-energize the island.
             '''
             ts.log('Step d)5): De-energizing the island.')
-            ctrl_sigs[3] = 0.  # de-energize amplifier
-            phil.set_control_signals(values=ctrl_sigs)
+            ctrl_sigs['AMETEK_OUTPUT'] = 0.  # de-energize amplifier
+            ctrl_sigs.push()
             # phil.stop_simulation()
 
             '''
@@ -963,60 +992,80 @@ def test_run():
             # be completed with logic in the RT-Lab simulation
 
             ts.sleep(2.)  # wait
-            ctrl_sigs[2] = 1.  # open S3
-            phil.set_control_signals(values=ctrl_sigs)
+            ctrl_sigs['ISLANDING_TEST'] = 1.  # open S3
+            ctrl_sigs.push()
 
             counter = 0
             high_freq_count = 0
             low_freq_count = 0
             t_trips = {}
-            for q_inc in [1.0, 0.99, 0.98, 0.97, 0.96, 0.95, 1.01, 1.02, 1.03, 1.04, 1.05]:
-                ts.log('Running step e)4) with reactive power setpoint = %0.3f' % q_inc)
-                counter += 1
-                t_trips, t_trip, high_freq_count, low_freq_count = \
-                    run_ui_test(phil, model_name, daq, test_num, t_trips, q_inc, high_freq_count,
-                                low_freq_count, result_summary, c)
-
-                ''' 
-                e)4) If clearing times are still increasing at the 95% or 105% points, additional 1% increments 
-                shall be taken until clearing times begin decreasing.
-                '''
-                min_unreached = True
-                q_min = 0.95
-                while min_unreached:
-                    if q_inc == q_min:
-                        if t_trip > t_trips[round(q_min+0.01, 2)]:  # must run a lower q_inc test
-                            counter += 1
-                            t_trips, t_trip, high_freq_count, low_freq_count = \
-                                run_ui_test(phil, model_name, daq, test_num, t_trips, q_min, high_freq_count,
-                                            low_freq_count, result_summary, c)
-                            if t_trip < t_trips[round(q_min, 2)]:
-                                min_unreached = False
-                            else:
-                                q_min -= 0.01
-                    else:
-                        break
-
-                max_unreached = True
-                q_max = 1.05
-                while max_unreached:
-                    if q_inc == q_max:
-                        if t_trip > t_trips[round(q_min+0.01, 2)]:  # must run a lower q_inc test
-                            counter += 1
-                            t_trips, t_trip, high_freq_count, low_freq_count = \
-                                run_ui_test(phil, model_name, daq, test_num, t_trips, q_max, high_freq_count,
-                                            low_freq_count, result_summary, c)
-                            if t_trip < t_trips[round(q_min, 2)]:
-                                max_unreached = False
-                            else:
-                                q_min -= 0.01
-                    else:
-                        break
-
-                ctrl_sigs[3] = 0.  # de-energize amplifier
-                phil.set_control_signals(values=ctrl_sigs)
-                # re-energize system and wait for EUT to start for next q_inc
-                energize_system(ctrl_sigs, phil, daq, eut_startup_time, p_rated)
+            if q_sweep == 'Search':
+                # unimodal search of the longest clearing time over the 1% settings instead of the full sweep
+                search = p1547.ClearingTimeSearch(ts, q_start=q_start)
+                q_inc = search.next()
+                while q_inc is not None:
+                    ts.log('Running step e)4) with reactive power setpoint = %0.3f' % q_inc)
+                    counter += 1
+                    t_trips, t_trip, high_freq_count, low_freq_count = \
+                        run_ui_test(phil, model_name, daq, test_num, t_trips, q_inc, high_freq_count,
+                                    low_freq_count, result_summary, c)
+                    search.tell(q_inc, t_trip)
+
+                    ctrl_sigs['AMETEK_OUTPUT'] = 0.  # de-energize amplifier
+                    ctrl_sigs.push()
+                    # re-energize system and wait for EUT to start for next q_inc
+                    energize_system(ctrl_sigs, phil, daq, eut_startup_time, p_rated)
+                    q_inc = search.next()
+                search.log_summary()
+            else:
+                search = None
+                for q_inc in [1.0, 0.99, 0.98, 0.97, 0.96, 0.95, 1.01, 1.02, 1.03, 1.04, 1.05]:
+                    ts.log('Running step e)4) with reactive power setpoint = %0.3f' % q_inc)
+                    counter += 1
+                    t_trips, t_trip, high_freq_count, low_freq_count = \
+                        run_ui_test(phil, model_name, daq, test_num, t_trips, q_inc, high_freq_count,
+                                    low_freq_count, result_summary, c)
+
+                    ''' 
+                    e)4) If clearing times are still increasing at the 95% or 105% points, additional 1% increments 
+                    shall be taken until clearing times begin decreasing.
+                    '''
+                    min_unreached = True
+                    q_min = 0.95
+                    while min_unreached:
+                        if q_inc == q_min:
+                            if t_trip > t_trips[round(q_min+0.01, 2)]:  # must run a lower q_inc test
+                                counter += 1
+                                t_trips, t_trip, high_freq_count, low_freq_count = \
+                                    run_ui_test(phil, model_name, daq, test_num, t_trips, q_min, high_freq_count,
+                                                low_freq_count, result_summary, c)
+                                if t_trip < t_trips[round(q_min, 2)]:
+                                    min_unreached = False
+                                else:
+                                    q_min -= 0.01
+                        else:
+                            break
+
+                    max_unreached = True
+                    q_max = 1.05
+                    while max_unreached:
+                        if q_inc == q_max:
+                            if t_trip > t_trips[round(q_min+0.01, 2)]:  # must run a lower q_inc test
+                                counter += 1
+                                t_trips, t_trip, high_freq_count, low_freq_count = \
+                                    run_ui_test(phil, model_name, daq, test_num, t_trips, q_max, high_freq_count,
+                                                low_freq_count, result_summary, c)
+                                if t_trip < t_trips[round(q_min, 2)]:
+                                    max_unreached = False
+                                else:
+                                    q_min -= 0.01
+                        else:
+                            break
+
+                    ctrl_sigs['AMETEK_OUTPUT'] = 0.  # de-energize amplifier
+                    ctrl_sigs.push()
+                    # re-energize system and wait for EUT to start for next q_inc
+                    energize_system(ctrl_sigs, phil, daq, eut_startup_time, p_rated)
 
             '''
             5) After reviewing the results of the previous step, the 1% setting increments that yielded the
@@ -1024,8 +1073,11 @@ def test_run():
             longest clearing times occur at nonconsecutive 1% load setting increments, the additional two
             iterations shall be run for all load settings in between.
             '''
-            t_trips_sorted = [(q, t) for q, t in sorted(t_trips.items(), key=lambda item: item[1])]
-            q_repeats = t_trips_sorted[0:2][0]
+            if search is not None:
+                q_repeats = search.get_longest(n=3) * 2  # two additional iterations
+            else:
+                t_trips_sorted = [(q, t) for q, t in sorted(t_trips.items(), key=lambda item: item[1])]
+                q_repeats = t_trips_sorted[0:2][0]
 
             for q_inc in q_repeats:
                 counter += 1
@@ -1125,6 +1177,18 @@ info.param('phase_jump.test_num', label='Comma-seperated Test Numbers (1-10)', d
 info.param('phase_jump.n_iter', label='Number of Iterations', default=5)
 info.param('phase_jump.phase_comp', label='Phase compensation(deg)', default=0.)
 info.param('phase_jump.transducer_gain', label='PHIL transducer gain', default=43.1)
+info.param('phase_jump.q_sweep', label='Reactive load sweep of step e)4)', default='Standard',
+           values=['Standard', 'Search'])
+info.param('phase_jump.prescreen', label='Start the search at the longest island simulated offline?', default='No',
+           values=['Yes', 'No'], active='phase_jump.q_sweep', active_value=['Search'])
+
+info.param_group('ui_prescreen', label='Island Prescreen (EUT Model)', active='phase_jump.prescreen',
+                 active_value=['Yes'])
+info.param('ui_prescreen.sfs_gain', label='Sandia frequency shift gain (rad per p.u. of frequency error)', default=0.)
+for name, (quantity, comparison, limit, t_clear) in p1547.UI_TRIP_SETTINGS.items():
+    info.param('ui_prescreen.%s_limit' % name.lower(), label='%s trip limit (p.u. of %s %s)' %
+               (name, 'voltage' if quantity == 'V' else 'frequency', comparison), default=limit)
+    info.param('ui_prescreen.%s_time' % name.lower(), label='%s clearing time (s)' % name, default=t_clear)
 
 info.param_group('phase_jump_startup', label='IEEE 1547.1 Phase Jump Startup Time', glob=True)
 info.param('phase_jump_startup.eut_startup_time', label='EUT Startup Time (s)', default=85, glob=True)
@@ -73,29 +73,30 @@ def test_run():
     dataset_filename = None
 
     try:
-        sink_power = ts.param_value('eut.sink_power')
-        p_rated = ts.param_value('eut.p_rated')
-        p_rated_prime = ts.param_value('eut.p_rated_prime')
-        s_rated = ts.param_value('eut.s_rated')
-        var_rated = ts.param_value('eut.var_rated')
+        eut_params = p1547.get_eut_params(ts)
+        sink_power = eut_params.sink_power
+        p_rated = eut_params.p_rated
+        p_rated_prime = eut_params.p_rated_prime
+        s_rated = eut_params.s_rated
+        var_rated = eut_params.var_rated
 
         # DC voltages
         v_nom_in_enabled = ts.param_value('cpf.v_in_nom')
         v_min_in_enabled = ts.param_value('cpf.v_in_min')
         v_max_in_enabled = ts.param_value('cpf.v_in_max')
 
-        v_nom_in = ts.param_value('eut.v_in_nom')
+        v_nom_in = eut_params.v_in_nom
         v_min_in = ts.param_value('eut_cpf.v_in_min')
         v_max_in = ts.param_value('eut_cpf.v_in_max')
 
         # AC voltages
-        v_nom = ts.param_value('eut.v_nom')
-        v_min = ts.param_value('eut.v_low')
-        v_max = ts.param_value('eut.v_high')
-        f_nom = ts.param_value('eut.f_nom')
-        p_min = ts.param_value('eut.p_min')
-        p_min_prime = ts.param_value('eut.p_min_prime')
-        phases = ts.param_value('eut.phases')
+        v_nom = eut_params.v_nom
+        v_min = eut_params.v_low
+        v_max = eut_params.v_high
+        f_nom = eut_params.f_nom
+        p_min = eut_params.p_min
+        p_min_prime = eut_params.p_min_prime
+        phases = eut_params.phases
 
         low_pwr_ena = ts.param_value('vrt.low_pwr_ena')
         high_pwr_ena = ts.param_value('vrt.high_pwr_ena')
@@ -103,7 +104,7 @@ def test_run():
         high_pwr_value = ts.param_value('vrt.high_pwr_value')
 
         # Pass/fail accuracies
-        pf_msa = ts.param_value('eut.pf_msa')
+        pf_msa = eut_params.pf_msa
 
         # EUI Absorb capabilities
         absorb = {}
@@ -189,6 +190,9 @@ def test_run():
         Configure settings in 1547.1 Standard module for the Voltage Ride Through Tests
         """
         VoltRideThrough = p1547.VoltageRideThrough(ts=ts, support_interfaces={"hil": phil})
+        waiter = p1547.SimulationWaiter(ts, phil)
+        wfm_file = ts.param_value('vrt.wfm_file')
+        rt_evaluator = p1547.RideThroughEvaluator(v_nom=v_nom, f_nom=f_nom)
         # result params
         # result_params = lib_1547.get_rslt_param_plot()
         # ts.log(result_params
@@ -211,6 +215,7 @@ def test_run():
         daq = das.das_init(ts, support_interfaces={"hil": phil, "pvsim": pv})
         daq.waveform_config({"mat_file_name":"Data.mat",
                             "wfm_channels": VoltRideThrough.get_wfm_file_header()})
+        wfm_file = wfm_file or p1547.get_waveform_file(daq, 'Data.mat')
 
         if daq is not None:
             daq.sc['V_MEAS'] = 100
@@ -275,13 +280,26 @@ def test_run():
             EUT nameplate active power rating at nominal voltage. ... Low-power tests shall be performed at any 
             convenient power level between 25% to 50% of EUT nameplate  apparent power rating at nominal voltage.
             """
-            for pwr in pwr_lvl:  
-                for phase in phase_comb_list :  
-             
+            # One test per power level and phase combination. With vrt.single_session, the tests of a phase
+            # combination are joined in timelines run in a single load of the model (as many as fit in the VRT
+            # vectors of the model), the power level being changed during the settling gap between two tests.
+            tests = [(pwr, phase) for pwr in pwr_lvl for phase in phase_comb_list]
+            if VoltRideThrough.params["single_session"]:
+                groups = [[test for test in tests if test[1] == phase] for phase in phase_comb_list]
+            else:
+                groups = [[test] for test in tests]
+            for group in groups:
+                group_sequences = [VoltRideThrough.set_test_conditions(current_mode) for test in group]
+                sessions = VoltRideThrough.get_sessions(group_sequences, gap=VoltRideThrough.params["session_gap"],
+                                                        size=VoltRideThrough.params["vector_size"])
+                for session_tests, vrt_test_sequences in sessions:
+                    session = [group[k] for k in session_tests]
+                    pwr, phase = session[0]
                     phase_combination_label = "PH" + ''.join(phase)
 
-                    dataset_filename = f'{current_mode}_{round(pwr*100)}PCT_{phase_combination_label}_{consecutive_label}'
-                    ts.log_debug(15 * "*" + f"Starting {dataset_filename}" + 15 * "*")
+                    dataset_filenames = [f'{current_mode}_{round(p*100)}PCT_{phase_combination_label}_{consecutive_label}'
+                                         for p, _ in session]
+                    ts.log_debug(15 * "*" + f"Starting {dataset_filenames}" + 15 * "*")
                     if data_ena:
                         daq.data_capture(True)
 
@@ -297,7 +315,6 @@ def test_run():
                     """
                     Initiating voltage sequence for VRT
                     """
-                    vrt_test_sequences = VoltRideThrough.set_test_conditions(current_mode)
                     VoltRideThrough.set_phase_combination(phase)
                     vrt_stop_time = VoltRideThrough.get_vrt_stop_time(vrt_test_sequences)
                     if phil is not None:
@@ -308,7 +325,7 @@ def test_run():
                         ts.log('Stop time set to %s' % phil.set_stop_time(vrt_stop_time))
                         # The driver should take care of this by selecting "Yes" to "Load the model to target?"
                         ts.sleep(2.0)
-                        phil.load_model_on_hil()
+                        VoltRideThrough.load_model_on_hil()
                         # You need to first load the model, then configure the parameters
                         # Now that we have all the test_sequences its time to sent them to the model.
                         VoltRideThrough.set_vrt_model_parameters(vrt_test_sequences)
@@ -346,53 +363,79 @@ def test_run():
                             ts.log_debug('Initial EUT VV settings are %s' % eut.volt_var())
 
                         # The driver parameter "Execute the model on target?" should be set to "No"
+                        waiter.mark_file(wfm_file)
                         phil.start_simulation() 
                         ts.sleep(0.5)
-                        sim_time = phil.get_time()
-                        while (vrt_stop_time - sim_time) > 1.0:  # final sleep will get to stop_time.
-                            sim_time = phil.get_time()
-                            ts.log('Sim Time: %0.3f.  Waiting another %0.3f sec before saving data.' % (
-                                sim_time, vrt_stop_time - sim_time))
-                            ts.sleep(5)
-
-                    
-                        rms_dataset_filename = "No File"   
-                        wave_start_filename = "No File"        
+                        next_test = 1
+
+                        def set_next_power(sim_time):
+                            nonlocal next_test
+                            # the power level of the next test is set at the start of its settling gap
+                            while next_test < len(session) and \
+                                    sim_time >= vrt_test_sequences.get_test_range(next_test)[0]:
+                                if pv is not None:
+                                    ts.log_debug(f'Setting power level to {session[next_test][0]}')
+                                    pv.power_set(p_rated * session[next_test][0])
+                                next_test += 1
+                            if next_test < len(session):
+                                return vrt_test_sequences.get_test_range(next_test)[0]
+
+                        # final poll is within 1 s of stop_time.
+                        waiter.wait_stop_time(vrt_stop_time, margin=1.0, callback=set_next_power)
+
+                        rms_dataset_filenames = ["No File"] * len(session)
+                        wave_start_filenames = ["No File"] * len(session)
                         if data_ena:
-                            rms_dataset_filename = dataset_filename + "_RMS.csv"
+                            rms_dataset_filenames = [name + "_RMS.csv" for name in dataset_filenames]
                             daq.data_capture(False)
-
+                        if data_ena or wfm_file:
                             # complete data capture
-                            ts.log('Waiting for Opal to save the waveform data: {}'.format(dataset_filename))
-                            ts.sleep(10)
+                            ts.log('Waiting for Opal to save the waveform data: {}'.format(dataset_filenames))
+                            waiter.wait_file(wfm_file)
                         if wav_ena:
                             # Convert and save the .mat file 
                             ts.log('Processing waveform dataset(s)')
-                            wave_start_filename = dataset_filename + "_WAV.csv"
 
                             ds = daq.waveform_capture_dataset()  # returns list of databases of waveforms (overloaded)
                             ts.log(f'Number of waveforms to save {len(ds)}')
                             if len(ds) > 0:
-                                ds[0].to_csv(ts.result_file_path(wave_start_filename))
-                                ts.result_file(wave_start_filename)
+                                # the waveforms of a session are split by the VRT_CONDITION of each sample
+                                wave_datasets = [ds[0]] if len(session) == 1 else \
+                                    vrt_test_sequences.split_dataset(ds[0])
+                                wave_start_filenames = [name + "_WAV.csv" for name in dataset_filenames]
+                                for wave_start_filename, wave_ds in zip(wave_start_filenames, wave_datasets):
+                                    wave_ds.to_csv(ts.result_file_path(wave_start_filename))
+                                    ts.result_file(wave_start_filename)
+                                # pass/fail of each test condition from the waveforms of the session
+                                try:
+                                    rt_results = rt_evaluator.evaluate(vrt_test_sequences, ds[0],
+                                                                       names=dataset_filenames,
+                                                                       current_mode=current_mode)
+                                    rt_evaluator.write_results(ts, rt_results)
+                                except p1547.p1547Error as e:
+                                    ts.log_error('Ride-through evaluation of %s failed: %s' % (dataset_filenames, e))
 
                         if data_ena:
                             ds = daq.data_capture_dataset()
-                            ts.log('Saving file: %s' % rms_dataset_filename)
-                            ds.to_csv(ts.result_file_path(rms_dataset_filename))
-                            ds.remove_none_row(ts.result_file_path(rms_dataset_filename), "TIME")
-                            result_params = {
-                                'plot.title': rms_dataset_filename.split('.csv')[0],
-                                'plot.x.title': 'Time (sec)',
-                                'plot.x.points': 'TIME',
-                                'plot.y.points': 'AC_VRMS_1, AC_VRMS_2, AC_VRMS_3',
-                                'plot.y.title': 'Voltage (V)',
-                                'plot.y2.points': 'AC_IRMS_1, AC_IRMS_2, AC_IRMS_3',
-                                'plot.y2.title': 'Current (A)',
-                            }
-                            ts.result_file(rms_dataset_filename, params=result_params)
-                        result_summary.write('%s, %s, %s,\n' % (dataset_filename, wave_start_filename,
-                                                                rms_dataset_filename))
+                            rms_datasets = [ds] if len(session) == 1 else vrt_test_sequences.split_dataset(ds)
+                            for rms_dataset_filename, rms_ds in zip(rms_dataset_filenames, rms_datasets):
+                                ts.log('Saving file: %s' % rms_dataset_filename)
+                                rms_ds.to_csv(ts.result_file_path(rms_dataset_filename))
+                                rms_ds.remove_none_row(ts.result_file_path(rms_dataset_filename), "TIME")
+                                result_params = {
+                                    'plot.title': rms_dataset_filename.split('.csv')[0],
+                                    'plot.x.title': 'Time (sec)',
+                                    'plot.x.points': 'TIME',
+                                    'plot.y.points': 'AC_VRMS_1, AC_VRMS_2, AC_VRMS_3',
+                                    'plot.y.title': 'Voltage (V)',
+                                    'plot.y2.points': 'AC_IRMS_1, AC_IRMS_2, AC_IRMS_3',
+                                    'plot.y2.title': 'Current (A)',
+                                }
+                                ts.result_file(rms_dataset_filename, params=result_params)
+                        for dataset_filename, wave_start_filename, rms_dataset_filename in zip(
+                                dataset_filenames, wave_start_filenames, rms_dataset_filenames):
+                            result_summary.write('%s, %s, %s,\n' % (dataset_filename, wave_start_filename,
+                                                                    rms_dataset_filename))
 
                         phil.stop_simulation()
 
@@ -492,6 +535,16 @@ info.param('vrt.two_phase_value_2', label="Which phase ?" , active='vrt.two_phas
 info.param('vrt.three_phase_mode', label="Apply disturbance to all phases" , default='Enabled', values=['Disabled', 'Enabled'])
 info.param('vrt.range_steps', label='Ride-Through Profile ("Figure" is following the RT images from standard)',
            default='Figure', values=['Figure', 'Random'])
+info.param('vrt.random_seed', label='Seed of the random profiles (0 for a new seed, see the log)', default=0,
+           active='vrt.range_steps', active_value=['Random'])
+info.param('vrt.random_pool', label='Number of random profiles generated per mode', default=1000,
+           active='vrt.range_steps', active_value=['Random'])
+info.param('vrt.single_session', label='Run the power levels of a phase combination in a single model load?',
+           default='Disabled', values=['Disabled', 'Enabled'])
+info.param('vrt.session_gap', label='Settling time between the tests of a single model load (s)', default=10.0,
+           active='vrt.single_session', active_value=['Enabled'])
+info.param('vrt.vector_size', label='Size of the VRT vectors of the model', default=20)
+info.param('vrt.wfm_file', label='Waveform file saved by the model (empty for the one of the DAS)', default='')
 info.param('vrt.wav_ena', label='Waveform acquisition needed (.mat->.csv) ?', default='Yes', values=['Yes', 'No'])
 info.param('vrt.data_ena', label='RMS acquisition needed (SVP creates .csv from block queries)?', default='No', values=['Yes', 'No'])
 
@@ -44,7 +44,6 @@ import script
 from svpelab import result as rslt
 from datetime import datetime, timedelta
 
-import numpy as np
 import collections
 import cmath
 import math
@@ -68,27 +67,28 @@ def volt_vars_mode(vv_curves, vv_response_time, pwr_lvls, v_ref_value):
     dataset_filename = None
 
     try:
-        cat = ts.param_value('eut.cat')
-        cat2 = ts.param_value('eut.cat2')
-        sink_power = ts.param_value('eut.sink_power')
-        p_rated = ts.param_value('eut.p_rated')
-        p_rated_prime = ts.param_value('eut.p_rated_prime')
-        var_rated = ts.param_value('eut.var_rated')
-        s_rated = ts.param_value('eut.s_rated')
+        eut_params = p1547.get_eut_params(ts)
+        cat = eut_params.cat
+        cat2 = eut_params.cat2
+        sink_power = eut_params.sink_power
+        p_rated = eut_params.p_rated
+        p_rated_prime = eut_params.p_rated_prime
+        var_rated = eut_params.var_rated
+        s_rated = eut_params.s_rated
 
         #absorb_enable = ts.param_value('eut.abs_enabled')
         # DC voltages
-        v_in_nom = ts.param_value('eut.v_in_nom')
+        v_in_nom = eut_params.v_in_nom
         #v_min_in = ts.param_value('eut.v_in_min')
         #v_max_in = ts.param_value('eut.v_in_max')
 
         # AC voltages
-        v_nom = ts.param_value('eut.v_nom')
-        v_low = ts.param_value('eut.v_low')
-        v_high = ts.param_value('eut.v_high')
-        p_min = ts.param_value('eut.p_min')
-        p_min_prime = ts.param_value('eut.p_min_prime')
-        phases = ts.param_value('eut.phases')
+        v_nom = eut_params.v_nom
+        v_low = eut_params.v_low
+        v_high = eut_params.v_high
+        p_min = eut_params.p_min
+        p_min_prime = eut_params.p_min_prime
+        phases = eut_params.phases
 
         """
         Version validation
@@ -211,6 +211,12 @@ def volt_vars_mode(vv_curves, vv_response_time, pwr_lvls, v_ref_value):
         ts.result_file(result_summary_filename)
         result_summary.write(ActiveFunction.get_rslt_sum_col_name())
 
+        # Steps and targets of the whole test are compiled before any step is applied
+        step_plan = p1547.StepPlan.compile(ActiveFunction, function=VV, curves=vv_curves, pwrs=pwr_lvls,
+                                           v_refs=v_ref_value)
+        step_plan.save(ts.result_file_path('step_plan.csv'))
+        ActiveFunction.set_step_plan(step_plan)
+
         '''
         d) Adjust the EUT's available active power to Prated. For an EUT with an input voltage range, set the input
         voltage to Vin_nom. The EUT may limit active power throughout the test to meet reactive power requirements.
@@ -356,6 +362,7 @@ def volt_vars_mode(vv_curves, vv_response_time, pwr_lvls, v_ref_value):
 
     finally:
         if daq is not None:
+            ActiveFunction.teardown()
             daq.close()
         if pv is not None:
             pv.close()
@@ -395,25 +402,26 @@ def volt_var_mode_imbalanced_grid(imbalance_resp, vv_curves, vv_response_time):
         #cat = ts.param_value('eut.cat')
         #cat2 = ts.param_value('eut.cat2')
         #sink_power = ts.param_value('eut.sink_power')
-        p_rated = ts.param_value('eut.p_rated')
+        eut_params = p1547.get_eut_params(ts)
+        p_rated = eut_params.p_rated
         #p_rated_prime = ts.param_value('eut.p_rated_prime')
-        var_rated = ts.param_value('eut.var_rated')
-        s_rated = ts.param_value('eut.s_rated')
+        var_rated = eut_params.var_rated
+        s_rated = eut_params.s_rated
 
         #absorb_enable = ts.param_value('eut.abs_enabled')
 
         # DC voltages
-        v_in_nom = ts.param_value('eut.v_in_nom')
+        v_in_nom = eut_params.v_in_nom
         #v_min_in = ts.param_value('eut.v_in_min')
         #v_max_in = ts.param_value('eut.v_in_max')
 
         # AC voltages
-        v_nom = ts.param_value('eut.v_nom')
-        v_min = ts.param_value('eut.v_low')
-        v_max = ts.param_value('eut.v_high')
-        p_min = ts.param_value('eut.p_min')
-        p_min_prime = ts.param_value('eut.p_min_prime')
-        phases = ts.param_value('eut.phases')
+        v_nom = eut_params.v_nom
+        v_min = eut_params.v_low
+        v_max = eut_params.v_high
+        p_min = eut_params.p_min
+        p_min_prime = eut_params.p_min_prime
+        phases = eut_params.phases
         pf_response_time = ts.param_value('vv.test_1_t_r')
 
         imbalance_fix = ts.param_value('vv.imbalance_fix')
@@ -655,6 +663,7 @@ def volt_var_mode_imbalanced_grid(imbalance_resp, vv_curves, vv_response_time):
 
     finally:
         if daq is not None:
+            ActiveFunction.teardown()
             daq.close()
         if pv is not None:
             if p_rated is not None:
@@ -685,6 +694,7 @@ def test_run():
         """
 
         mode = ts.param_value('vv.mode')
+        eut_params = p1547.get_eut_params(ts)
 
         """
         Test Configuration
@@ -702,9 +712,9 @@ def test_run():
 
         # Section 5.14.6
         if mode == 'Imbalanced grid':
-            if ts.param_value('eut.imbalance_resp') == 'EUT response to the individual phase voltages':
+            if eut_params.imbalance_resp == 'EUT response to the individual phase voltages':
                 imbalance_resp.append('INDIVIDUAL_PHASES_VOLTAGES')
-            elif ts.param_value('eut.imbalance_resp') == 'EUT response to the average of the three-phase effective (RMS)':
+            elif eut_params.imbalance_resp == 'EUT response to the average of the three-phase effective (RMS)':
                 imbalance_resp.append('AVG_3PH_RMS')
             else:  # 'EUT response to the positive sequence of voltages'
                 imbalance_resp.append('POSITIVE_SEQUENCE_VOLTAGES')
@@ -720,7 +730,7 @@ def test_run():
         else:
             irr = ts.param_value('vv.irr')
             vref = ts.param_value('vv.vref')
-            v_nom = ts.param_value('eut.v_nom')
+            v_nom = eut_params.v_nom
             if ts.param_value('vv.test_1') == 'Enabled':
                 vv_curves.append(1)
                 vv_response_time[1] = ts.param_value('vv.test_1_t_r')
@@ -840,6 +850,9 @@ info.param('eut.imbalance_resp', label='EUT response to phase imbalance is calcu
 
 
 
+# P1547 library parameters
+p1547.params(info)
+
 # Other equipment parameters
 der.params(info)
 gridsim.params(info)
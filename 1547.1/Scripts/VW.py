@@ -43,7 +43,6 @@ from svpelab import p1547
 from datetime import datetime, timedelta
 import script
 import math
-import numpy as np
 import collections
 import cmath
 
@@ -70,20 +69,21 @@ def volt_watt_mode(vw_curves, vw_response_time, pwr_lvls):
 
     try:
 
-        p_rated = ts.param_value('eut.p_rated')
-        s_rated = ts.param_value('eut.s_rated')
+        eut_params = p1547.get_eut_params(ts)
+        p_rated = eut_params.p_rated
+        s_rated = eut_params.s_rated
 
         # DC voltages
-        v_in_nom = ts.param_value('eut.v_in_nom')
-        v_min_in = ts.param_value('eut.v_in_min')
-        v_max_in = ts.param_value('eut.v_in_max')
+        v_in_nom = eut_params.v_in_nom
+        v_min_in = eut_params.v_in_min
+        v_max_in = eut_params.v_in_max
 
         # AC voltages
-        v_nom = ts.param_value('eut.v_nom')
-        v_min = ts.param_value('eut.v_low')
-        v_max = ts.param_value('eut.v_high')
-        p_min = ts.param_value('eut.p_min')
-        phases = ts.param_value('eut.phases')
+        v_nom = eut_params.v_nom
+        v_min = eut_params.v_low
+        v_max = eut_params.v_high
+        p_min = eut_params.p_min
+        phases = eut_params.phases
 
         # EUI Absorb capabilities
         absorb = {}
@@ -184,6 +184,11 @@ def volt_watt_mode(vw_curves, vw_response_time, pwr_lvls):
         ts.result_file(result_summary_filename)
         result_summary.write(ActiveFunction.get_rslt_sum_col_name())
 
+        # Steps and targets of the whole test are compiled before any step is applied
+        step_plan = p1547.StepPlan.compile(ActiveFunction, function=VW, curves=vw_curves, pwrs=pwr_lvls)
+        step_plan.save(ts.result_file_path('step_plan.csv'))
+        ActiveFunction.set_step_plan(step_plan)
+
         '''
         v) Test may be repeated for EUT's that can also absorb power using the P' values in the characteristic
         definition.
@@ -315,6 +320,7 @@ def volt_watt_mode(vw_curves, vw_response_time, pwr_lvls):
 
     finally:
         if daq is not None:
+            ActiveFunction.teardown()
             daq.close()
         if pv is not None:
             if p_rated is not None:
@@ -346,20 +352,21 @@ def volt_watt_mode_imbalanced_grid(imbalance_resp, vw_curves, vw_response_time):
     result_summary = None
 
     try:
-        cat = ts.param_value('eut.cat')
-        cat2 = ts.param_value('eut.cat2')
-        p_rated = ts.param_value('eut.p_rated')
-        s_rated = ts.param_value('eut.s_rated')
+        eut_params = p1547.get_eut_params(ts)
+        cat = eut_params.cat
+        cat2 = eut_params.cat2
+        p_rated = eut_params.p_rated
+        s_rated = eut_params.s_rated
 
         # DC voltages
-        v_in_nom = ts.param_value('eut.v_in_nom')
+        v_in_nom = eut_params.v_in_nom
 
         # AC voltages
-        v_nom = ts.param_value('eut.v_nom')
-        v_min = ts.param_value('eut.v_low')
-        v_max = ts.param_value('eut.v_high')
-        p_min = ts.param_value('eut.p_min')
-        phases = ts.param_value('eut.phases')
+        v_nom = eut_params.v_nom
+        v_min = eut_params.v_low
+        v_max = eut_params.v_high
+        p_min = eut_params.p_min
+        phases = eut_params.phases
         imbalance_fix = ts.param_value('vw.imbalance_fix')
 
 
@@ -609,6 +616,7 @@ def volt_watt_mode_imbalanced_grid(imbalance_resp, vw_curves, vw_response_time):
 
     finally:
         if daq is not None:
+            ActiveFunction.teardown()
             daq.close()
         if pv is not None:
             if p_rated is not None:
@@ -642,6 +650,7 @@ def test_run():
 
         # Initialize VW EUT specified parameters variables
         mode = ts.param_value('vw.mode')
+        eut_params = p1547.get_eut_params(ts)
         """
         Test Configuration
         """
@@ -650,9 +659,9 @@ def test_run():
         imbalance_resp = None
         vw_response_time = [0, 0, 0, 0]
         if mode == 'Imbalanced grid':
-            if ts.param_value('eut.imbalance_resp') == 'EUT response to the individual phase voltages':
+            if eut_params.imbalance_resp == 'EUT response to the individual phase voltages':
                 imbalance_resp = ['INDIVIDUAL_PHASES_VOLTAGES']
-            elif ts.param_value('eut.imbalance_resp') == 'EUT response to the average of the three-phase effective (RMS)':
+            elif eut_params.imbalance_resp == 'EUT response to the average of the three-phase effective (RMS)':
                 imbalance_resp = ['AVG_3PH_RMS']
             else:  # 'EUT response to the positive sequence of voltages'
                 imbalance_resp = ['POSITIVE_SEQUENCE_VOLTAGES']
@@ -782,6 +791,9 @@ info.param('eut_vw.p_rated_prime', label='P\'rated: Output power rating while ab
 info.param('eut_vw.p_min_prime', label='P\'min: minimum active power while sinking power(W) (negative)',
            default=-0.2*3000.0, active='eut_vw.sink_power', active_value=['Yes'])
 
+# P1547 library parameters
+p1547.params(info)
+
 # Other equipment parameters
 der.params(info)
 gridsim.params(info)
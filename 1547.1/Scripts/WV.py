@@ -44,7 +44,6 @@ import script
 from svpelab import result as rslt
 from datetime import datetime, timedelta
 
-import numpy as np
 import collections
 import cmath
 import math
@@ -64,26 +63,27 @@ def watt_var_mode(wv_curves, wv_response_time, pwr_lvls):
     dataset_filename = None
 
     try:
-        cat = ts.param_value('eut.cat')
-        cat2 = ts.param_value('eut.cat2')
-        sink_power = ts.param_value('eut.sink_power')
-        p_rated = ts.param_value('eut.p_rated')
-        p_rated_prime = ts.param_value('eut.p_rated_prime')
-        var_rated = ts.param_value('eut.var_rated')
-        s_rated = ts.param_value('eut.s_rated')
+        eut_params = p1547.get_eut_params(ts)
+        cat = eut_params.cat
+        cat2 = eut_params.cat2
+        sink_power = eut_params.sink_power
+        p_rated = eut_params.p_rated
+        p_rated_prime = eut_params.p_rated_prime
+        var_rated = eut_params.var_rated
+        s_rated = eut_params.s_rated
 
         # DC voltages
-        v_in_nom = ts.param_value('eut.v_in_nom')
+        v_in_nom = eut_params.v_in_nom
         #v_min_in = ts.param_value('eut.v_in_min')
         #v_max_in = ts.param_value('eut.v_in_max')
 
         # AC voltages
-        v_nom = ts.param_value('eut.v_nom')
-        v_low = ts.param_value('eut.v_low')
-        v_high = ts.param_value('eut.v_high')
-        p_min = ts.param_value('eut.p_min')
-        p_min_prime = ts.param_value('eut.p_min_prime')
-        phases = ts.param_value('eut.phases')
+        v_nom = eut_params.v_nom
+        v_low = eut_params.v_low
+        v_high = eut_params.v_high
+        p_min = eut_params.p_min
+        p_min_prime = eut_params.p_min_prime
+        phases = eut_params.phases
 
         # EUI Absorb capabilities
         absorb = {}
@@ -123,7 +123,7 @@ def watt_var_mode(wv_curves, wv_response_time, pwr_lvls):
         # initialize data acquisition system
         daq = das.das_init(ts, sc_points=das_points['sc'], support_interfaces={'hil': chil}) 
 
-        ts.log_debug(0.05 * ts.param_value('eut.s_rated'))
+        ts.log_debug(0.05 * eut_params.s_rated)
         daq.sc['P_TARGET'] = v_nom
         daq.sc['Q_TARGET'] = 100
         daq.sc['Q_TARGET_MIN'] = 100
@@ -197,6 +197,11 @@ def watt_var_mode(wv_curves, wv_response_time, pwr_lvls):
         ts.result_file(result_summary_filename)
         result_summary.write(ActiveFunction.get_rslt_sum_col_name())
 
+        # Steps and targets of the whole test are compiled before any step is applied
+        step_plan = p1547.StepPlan.compile(ActiveFunction, function=WV, curves=wv_curves, pwrs=pwr_lvls)
+        step_plan.save(ts.result_file_path('step_plan.csv'))
+        ActiveFunction.set_step_plan(step_plan)
+
         '''
         d) Adjust the EUT's available active power to Prated. For an EUT with an input voltage range, set the input
         voltage to Vin_nom. The EUT may limit active power throughout the test to meet reactive power requirements.
@@ -325,6 +330,7 @@ def watt_var_mode(wv_curves, wv_response_time, pwr_lvls):
 
     finally:
         if daq is not None:
+            ActiveFunction.teardown()
             daq.close()
         if pv is not None:
             pv.power_set(p_rated)
@@ -468,6 +474,9 @@ info.param('eut.v_high', label='Maximum AC voltage (V)', default=132.0)
 info.param('eut.v_in_nom', label='V_in_nom: Nominal input voltage (Vdc)', default=400)
 
 
+# P1547 library parameters
+p1547.params(info)
+
 # Other equipment parameters
 der.params(info)
 gridsim.params(info)
@@ -0,0 +1,90 @@
+"""
+Pass/fail bounds of the characteristic functions (VV, VW, WV, FW)
+"""
+import os
+
+import numpy as np
+import pytest
+
+from svpelab import p1547
+
+from conftest import ROOT
+
+VV_1 = 'VV_1_PWR_100_vref_100'
+
+
+@pytest.fixture
+def volt_var():
+    ts = p1547.OfflineScript.from_config(os.path.join(ROOT, 'Tests', 'VV', 'VV_1.tst'))
+    af = p1547.ActiveFunction(ts, 'Volt-Var', [p1547.VV], [True, True, True])
+    af.phases = 'Three phase'
+    af.reset_curve(1)
+    af.reset_pwr(1.0)
+    return af
+
+
+def set_pre_step_sample(af, v, q=0.):
+    # sample taken by start() before the step is applied
+    af.data = {}
+    for phase in (1, 2, 3):
+        af.data['AC_VRMS_%d' % phase] = v
+        af.data['AC_Q_%d' % phase] = q / 3.
+        af.data['AC_P_%d' % phase] = 0.
+
+
+def test_characteristic_bounds():
+    characteristic = p1547.Characteristic(p1547.VV, x='V', y='Q', xp=[100., 110., 120., 130.],
+                                          fp=[100., 0., 0., -100.], mra_x=1., mra_y=5.)
+    assert characteristic.evaluate(125.) == -50.
+    assert characteristic.bounds(125.) == (-60. - 5., -40. + 5.)
+    target_min, target_max = characteristic.bounds(np.array([105., 115.]))
+    np.testing.assert_allclose(target_min, [40. - 5., -5.])
+    np.testing.assert_allclose(target_max, [60. + 5., 5.])
+
+
+def test_step_h_bounds_use_the_commanded_voltage(volt_var):
+    af = volt_var
+    plan = p1547.StepPlan.compile(af, p1547.VV, curves=[1], pwrs=[1.0], v_refs=[1.0])
+    step_dict = plan.get_steps(VV_1)['Step H']
+    # the sample of start() is still at the voltage of the previous step
+    set_pre_step_sample(af, v=af.v_nom)
+    af.step_dict = step_dict
+    target = af.update_target_value(function=p1547.VV)
+    target_min, target_max = af.calculate_min_max_values(function=p1547.VV)
+
+    assert target == plan.get_target(plan.get_index(VV_1, 'Step H'), 'Q')
+    assert target < 0
+    assert target_min <= target <= target_max
+    assert (target_min, target_max) == af.get_characteristic(p1547.VV).bounds(step_dict['V'])
+
+
+def test_every_vv_step_target_is_within_its_bounds(volt_var):
+    af = volt_var
+    plan = p1547.StepPlan.compile(af, p1547.VV, curves=[1], pwrs=[1.0], v_refs=[1.0])
+    steps = plan.get_steps(VV_1)
+    set_pre_step_sample(af, v=af.v_nom)
+    live = []
+    for step, step_dict in steps.items():
+        af.step_dict = step_dict
+        target = af.update_target_value(function=p1547.VV)
+        target_min, target_max = af.calculate_min_max_values(function=p1547.VV)
+        assert target_min <= target <= target_max, step
+        live.append((target_min, target_max))
+
+    # the replay evaluates the bounds at the same commanded voltage
+    replay = p1547.DatasetReplay.from_config(os.path.join(ROOT, 'Tests', 'VV', 'VV_1.tst'))
+    replay.reset_curve(1)
+    replay.reset_pwr(1.0)
+    stimuli = {'V': np.array([step_dict['V'] for step_dict in steps.values()])}
+    meas = {'V': np.full((len(steps), 2), af.v_nom)}
+    target_min, target_max = replay.calculate_min_max_arrays(p1547.VV, meas, np.zeros(len(steps)), stimuli=stimuli)
+    np.testing.assert_allclose(target_min, np.repeat([[b[0]] for b in live], 2, axis=1))
+    np.testing.assert_allclose(target_max, np.repeat([[b[1]] for b in live], 2, axis=1))
+
+
+def test_bounds_without_step_use_the_measured_x(volt_var):
+    af = volt_var
+    af.step_dict = None
+    set_pre_step_sample(af, v=af.v_nom * 1.08)
+    assert af.calculate_min_max_values(function=p1547.VV) == \
+        af.get_characteristic(p1547.VV).bounds(af.v_nom * 1.08)
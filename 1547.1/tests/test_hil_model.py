@@ -0,0 +1,78 @@
+"""
+MATLAB variables sent to the HIL model by the ride-through scripts
+"""
+import os
+
+import pytest
+
+from svpelab import p1547
+
+from conftest import ROOT
+
+
+class RecordingHil(object):
+    rt_lab_model = 'IEEE_1547_Fast_Functions'
+
+    def __init__(self):
+        self.sent = []
+        self.loads = 0
+
+    def set_time_sig(self, path):
+        pass
+
+    def set_matlab_variables(self, parameters):
+        self.sent.append(list(parameters))
+
+    def load_model_on_hil(self):
+        self.loads += 1
+
+
+@pytest.fixture
+def vrt():
+    ts = p1547.OfflineScript.from_config(os.path.join(ROOT, 'Tests', 'VRT', 'LVRT_CAT2.tst'))
+    hil = RecordingHil()
+    return p1547.VoltageRideThrough(ts=ts, support_interfaces={'hil': hil}), hil
+
+
+def test_padded_vectors_are_sent_as_lists(vrt):
+    model, hil = vrt
+    model.set_vrt_model_parameters(model.set_test_conditions('LV_CAT_2'))
+    vectors = dict(hil.sent[-1])
+    for column in ('VRT_CONDITION', 'VRT_START_TIMING', 'VRT_END_TIMING', 'VRT_VALUES'):
+        assert type(vectors[column]) is list
+        assert all(type(value) is float for value in vectors[column])
+
+
+def test_variables_are_sent_again_after_a_load(vrt):
+    model, hil = vrt
+    sequence = model.set_test_conditions('LV_CAT_2')
+    model.set_vrt_model_parameters(sequence)
+    pushes = len(hil.sent)
+    # unchanged variables are not sent again
+    model.set_vrt_model_parameters(sequence)
+    assert len(hil.sent) == pushes
+    model.load_model_on_hil()
+    model.set_vrt_model_parameters(sequence)
+    assert hil.loads == 1
+    assert len(hil.sent) == pushes + 1
+    assert [name for name, _ in hil.sent[-1]] == [name for name, _ in hil.sent[pushes - 1]]
+
+
+def test_sessions_fit_in_the_model_vectors(vrt):
+    model, hil = vrt
+    sequence = model.set_test_conditions('LV_CAT_2')
+    gap = model.params["session_gap"]
+    size = model.params["vector_size"]
+    # each test after the first one of a session adds its conditions and the settling gap
+    per_session = 1 + (size - len(sequence)) // (len(sequence) + 1)
+    sessions = model.get_sessions([sequence] * 5, gap=gap, size=size)
+    assert [tests for tests, _ in sessions] == [list(range(k, min(k + per_session, 5)))
+                                                for k in range(0, 5, per_session)]
+    for tests, timeline in sessions:
+        assert len(timeline) <= size
+        assert timeline.get_test_count() == len(tests)
+        timeline.get_padded('VRT_CONDITION', size)
+
+    # one test per session when a single test fills the vectors
+    sessions = model.get_sessions([sequence] * 3, gap=gap, size=len(sequence))
+    assert [tests for tests, _ in sessions] == [[0], [1], [2]]
@@ -0,0 +1,187 @@
+"""
+Unintentional islanding test: clearing time on synthetic waveforms, RLC load balancing and reactive load search
+"""
+import numpy as np
+import pytest
+
+from svpelab import p1547
+
+
+def island_capture(open_time=2.5, clearing=0.8, island_freq=61., trigger=True, length=5.5, step=200e-6):
+    """
+    Waveforms of an island opened at open_time, running at island_freq until the EUT ceases to energize it
+    """
+    time = np.arange(0., length, step)
+    islanded = time >= open_time
+    # phase continuous at the opening
+    phase = 2 * np.pi * np.where(islanded, 60. * open_time + island_freq * (time - open_time), 60. * time)
+    energized = time < open_time + clearing
+    ds = {'TIME': time}
+    for k in range(3):
+        angle = phase - 2 * np.pi * k / 3.
+        ds['AC_V_%d' % (k + 1)] = np.where(energized, 120. * np.sqrt(2) * np.cos(angle), 0.)
+        ds['AC_I_%d' % (k + 1)] = np.where(energized, 20. * np.sqrt(2) * np.cos(angle), 0.)
+    ds['TRIGGER'] = np.where(islanded, 1., 0.) if trigger else np.zeros(time.size)
+    return ds
+
+
+@pytest.fixture
+def clearing_time():
+    return p1547.IslandingClearingTime(v_nom=120., f_nom=60.)
+
+
+def test_clearing_time_and_island_frequency(clearing_time):
+    row = clearing_time.evaluate(island_capture(), name='UI_Test_1_Q1.00')
+    assert row['S3_OPEN_TIME'] == pytest.approx(2.5, abs=1e-3)
+    assert row['CLEARING_TIME'] == pytest.approx(0.8, abs=2. / 60.)
+    assert row['ISLAND_FREQ'] == pytest.approx(61., abs=0.05)
+    assert row['CLEARED']
+    assert row['RESULT'] == 'Pass'
+
+
+def test_island_not_cleared_within_2_s(clearing_time):
+    late = clearing_time.evaluate(island_capture(clearing=2.4))
+    assert late['CLEARING_TIME'] == pytest.approx(2.4, abs=2. / 60.)
+    assert late['RESULT'] == 'Fail'
+    never = clearing_time.evaluate(island_capture(clearing=10.))
+    assert not never['CLEARED']
+    assert np.isnan(never['CLEARING_TIME'])
+    assert never['RESULT'] == 'Fail'
+
+
+def test_trigger_that_never_changes_raises(clearing_time):
+    # UI.py keeps the trip time and island frequency of the console for such a capture
+    with pytest.raises(p1547.p1547Error):
+        clearing_time.evaluate(island_capture(trigger=False))
+
+
+def test_capture_without_trigger_channel_uses_the_pre_trigger(clearing_time):
+    ds = island_capture()
+    del ds['TRIGGER']
+    row = clearing_time.evaluate(ds)
+    assert row['S3_OPEN_TIME'] == pytest.approx(2.5, abs=1e-3)
+    assert row['CLEARING_TIME'] == pytest.approx(0.8, abs=2. / 60.)
+
+
+class Script(object):
+    def __init__(self):
+        self.messages = []
+
+    def log(self, msg):
+        self.messages.append(msg)
+
+    log_debug = log
+
+
+P_RATED = 10000.
+GAINS = (50.5 / 11700. * P_RATED, 6. / 1300. * P_RATED)
+
+
+def s3_power(r_set, c_set, sensitivity, offset):
+    # S3 active and reactive power (p.u.) of a linear load bank with coupled pots
+    return np.asarray(sensitivity).dot([r_set, c_set]) + offset
+
+
+def balance(balancer, sensitivity, offset, max_iterations=100):
+    r_set = c_set = 0.
+    ps3, qs3 = s3_power(r_set, c_set, sensitivity, offset)
+    while not balancer.is_balanced(ps3, qs3) and balancer.iterations < max_iterations:
+        r_set, c_set = balancer.step(r_set, c_set, ps3, qs3)
+        ps3, qs3 = s3_power(r_set, c_set, sensitivity, offset)
+    return r_set, c_set, ps3, qs3
+
+
+@pytest.mark.parametrize('sensitivity, offset', [
+    ([[-1. / GAINS[0], 0.], [0., -1. / GAINS[1]]], [0.3, -0.2]),
+    # coupled pots and gains off by a factor 2.5
+    ([[-2.5 / GAINS[0], 0.1 / GAINS[1]], [0.15 / GAINS[0], -0.4 / GAINS[1]]], [-0.4, 0.3])])
+def test_rlc_load_is_balanced(sensitivity, offset):
+    ts = Script()
+    balancer = p1547.RlcBalancer(ts, gains=GAINS)
+    _, _, ps3, qs3 = balance(balancer, sensitivity, offset)
+    assert balancer.is_balanced(ps3, qs3)
+    assert balancer.iterations <= 10
+    balancer.done()
+    assert 'RLC load balanced in %d iterations' % balancer.iterations in ts.messages[-1]
+
+
+def test_rlc_steps_are_limited():
+    balancer = p1547.RlcBalancer(Script(), gains=GAINS, max_step=5., lower=(0., 0.), upper=(100., 100.))
+    r_set, c_set = balancer.step(50., 50., 0.5, -0.5)
+    assert max(abs(r_set - 50.), abs(c_set - 50.)) == pytest.approx(5.)
+    balancer.reset()
+    r_set, c_set = balancer.step(1., 99., -0.5, 0.5)
+    assert (r_set, c_set) == (0., 100.)
+
+
+def search(clearing_time, **kwargs):
+    searcher = p1547.ClearingTimeSearch(Script(), **kwargs)
+    runs = []
+    q_inc = searcher.next()
+    while q_inc is not None:
+        runs.append(q_inc)
+        searcher.tell(q_inc, clearing_time(q_inc))
+        q_inc = searcher.next()
+    return searcher, runs
+
+
+@pytest.mark.parametrize('peak', [0.93, 0.95, 0.97, 1.0, 1.03, 1.05, 1.08])
+def test_search_finds_the_longest_clearing_time(peak):
+    searcher, runs = search(lambda q: 1. - 5. * abs(q - peak))
+    k_peak, left, right = searcher.get_peak()
+    assert searcher.to_q(k_peak) == peak
+    # both neighbors of the longest clearing time were run
+    assert (left, right) == (k_peak - 1, k_peak + 1)
+    assert len(runs) == len(set(runs))
+    assert searcher.get_longest() == [round(peak - 0.01, 2), peak, round(peak + 0.01, 2)]
+    if 0.95 < peak < 1.05:
+        # the full sweep runs the 11 settings from 0.95 to 1.05
+        assert len(runs) + searcher.get_avoided() == 11
+        assert len(runs) < 11
+
+
+def test_search_starts_at_the_given_setting():
+    _, runs = search(lambda q: 1. - abs(q - 1.02), q_start=1.02)
+    assert runs[0] == 1.02
+
+
+BALANCED_1B = {'p_eut': 1., 'q_eut': 0., 'ql': 1., 'qf': 1.}
+
+
+def test_island_frequency_of_the_rlc_load():
+    results = p1547.IslandSimulator(duration=1.0).simulate(BALANCED_1B, [0.95, 1.0, 1.05])
+    # resonance of the load: f_nom / sqrt(q_inc)
+    np.testing.assert_allclose(results['F_ISLAND'], 60. / np.sqrt([0.95, 1.0, 1.05]), atol=0.05)
+    assert np.isinf(results['CLEARING_TIME']).all()
+    assert (results['TRIP'] == '').all()
+
+
+def test_island_trips_on_the_trip_settings():
+    results = p1547.IslandSimulator(duration=1.0).simulate(BALANCED_1B, [0.9])
+    # 63.2 Hz island, OF2 (62 Hz, 0.16 s)
+    assert results['TRIP'][0] == 'OF2'
+    assert 0.16 < results['CLEARING_TIME'][0] < 0.3
+    trip_settings = {'OF1': ('F', '>', 61. / 60., 0.2)}
+    results = p1547.IslandSimulator(duration=1.0, trip_settings=trip_settings).simulate(BALANCED_1B, [0.95, 1.0])
+    assert list(results['TRIP']) == ['OF1', '']
+
+
+def test_frequency_shift_ends_the_island():
+    passive = p1547.IslandSimulator(duration=1.0).simulate(BALANCED_1B, [0.95])
+    active = p1547.IslandSimulator(duration=1.0, sfs_gain=0.5).simulate(BALANCED_1B, [0.95])
+    assert np.isinf(passive['CLEARING_TIME'][0])
+    assert active['TRIP'][0] == 'OF2'
+    assert active['CLEARING_TIME'][0] < 1.0
+
+
+def test_prescreen_runs_the_balanced_load_first():
+    prescreen = p1547.IslandSimulator(duration=0.5).prescreen(BALANCED_1B)
+    assert list(prescreen['Q_INC']) == [round(0.95 + 0.01 * k, 2) for k in range(11)]
+    assert prescreen.loc[prescreen['PRIORITY'].idxmin(), 'Q_INC'] == 1.0
+    assert sorted(prescreen['PRIORITY']) == list(range(1, 12))
+    assert prescreen['QF'][5] == pytest.approx(1.0)
+
+
+def test_unbalanced_load_is_rejected():
+    with pytest.raises(p1547.p1547Error):
+        p1547.IslandSimulator().simulate({'p_eut': 1., 'q_eut': 1.5, 'ql': 1.}, [1.0])
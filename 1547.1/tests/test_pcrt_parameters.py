@@ -0,0 +1,77 @@
+"""
+Parameters of the phase jump model built from PCRT_CONDITIONS, against the values of the former hand-written
+if/elif chain of Scripts/PCRT.py
+"""
+import pytest
+
+from svpelab import p1547
+
+MODEL = 'IEEE_1547_Phase_Jump'
+JUMP_TIME = 35.
+
+
+def hand_written_parameters(test_num, phase_jump_time):
+    """
+    :return: (parameters, stop time) as set by Scripts/PCRT.py before PhaseJumpTest
+    """
+    t = phase_jump_time
+    if test_num in (1, 2, 3):
+        stop_time = t + 2.
+        back = t + 0.5
+    else:
+        stop_time = t + 61.
+        back = t + 60.
+    # (switch on, switch off, initial angle, jump angle) of the phases A, B and C
+    phases = {
+        1: [(t, back, 0, 60), (stop_time, stop_time, 120, 120), (stop_time, stop_time, -120, -120)],
+        2: [(stop_time, stop_time, 0, 0), (t, back, 120, 180), (stop_time, stop_time, -120, -120)],
+        3: [(stop_time, stop_time, 0, 0), (stop_time, stop_time, 120, 120), (t, back, -120, -60)],
+        4: [(t, back, 0, 20), (t, back, 120, 140), (t, back, -120, -100)],
+        5: [(t, back, 0, -20), (t, back, 120, 100), (t, back, -120, -140)],
+    }[test_num]
+    parameters = {}
+    for (on, off, angle_0, angle_1), (switch_on, switch_off, block_0, block_1) in \
+            zip(phases, [('Switch1', 'Switch2', 'A0', 'A1'), ('Switch3', 'Switch4', 'B0', 'B1'),
+                         ('Switch7', 'Switch8', 'C0', 'C1')]):
+        parameters[switch_on + '/Threshold'] = on
+        parameters[switch_off + '/Threshold'] = off
+        parameters['Phase Angle Phase %s/Value' % block_0] = angle_0
+        parameters['Phase Angle Phase %s/Value' % block_1] = angle_1
+    parameters['Switch5/Threshold'] = t
+    parameters['Switch6/Threshold'] = back
+    parameters['Trigger Low/Value'] = 0
+    parameters['Trigger High/Value'] = 5
+    parameters['Start Capture Pulse Start/Threshold'] = t - 0.5
+    parameters['Start Capture Pulse End/Threshold'] = t + 1.5
+    if test_num in (1, 2, 3):
+        parameters['End Capture Pulse Start/Threshold'] = stop_time + 1
+        parameters['End Capture Pulse End/Threshold'] = stop_time + 1
+    else:
+        parameters['End Capture Pulse Start/Threshold'] = t + 59
+        parameters['End Capture Pulse End/Threshold'] = stop_time
+    return {'%s/SM_Source/%s' % (MODEL, block): float(value) for block, value in parameters.items()}, stop_time
+
+
+@pytest.mark.parametrize('test_num', [1, 2, 3, 4, 5])
+def test_parameters_match_the_hand_written_values(test_num):
+    test = p1547.get_pcrt_tests(MODEL, JUMP_TIME)[test_num]
+    parameters, stop_time = hand_written_parameters(test_num, JUMP_TIME)
+    assert dict(test.parameters) == parameters
+    assert test.stop_time == stop_time
+    assert len(test.captures) == (1 if test_num <= 3 else 2)
+
+
+@pytest.mark.parametrize('test_num, phase, angle', [(1, 'A', -60.), (2, 'B', 60.), (3, 'C', 180.)])
+def test_reverse_jump(test_num, phase, angle):
+    # NOTE 2 of Table 9: 300, 60 and 180 deg are the lagging angles of the tests 1 to 3
+    test = p1547.get_pcrt_tests(MODEL, JUMP_TIME, reverse=True)[test_num]
+    assert test.parameters['%s/SM_Source/Phase Angle Phase %s1/Value' % (MODEL, phase)] == angle
+    # the 60 s jumps have a single direction
+    assert not p1547.get_pcrt_tests(MODEL, JUMP_TIME, reverse=True)[4].reverse
+
+
+def test_undefined_test_is_rejected():
+    with pytest.raises(p1547.p1547Error):
+        p1547.PhaseJumpTest(MODEL, 6, JUMP_TIME)
+    with pytest.raises(p1547.p1547Error):
+        p1547.PhaseJumpTest(MODEL, 4, JUMP_TIME, reverse=True)
@@ -0,0 +1,86 @@
+"""
+Grading of the phase-angle change ride-through captures on synthetic waveforms
+"""
+import numpy as np
+import pytest
+
+from svpelab import p1547
+
+
+def capture(jump, t_jump=1.0, duration=0.5, length=3.0, current=None, f_nom=60., step=200e-6):
+    """
+    Three phase waveforms whose angles change by jump (deg) from t_jump for duration, with the current in phase with
+    the voltage and scaled by current(time)
+    """
+    time = np.arange(0., length, step)
+    on = (time >= t_jump) & (time < t_jump + duration)
+    scale = current(time) if current is not None else 1.
+    ds = {'TIME': time}
+    for k, initial in enumerate((0., -120., 120.)):
+        phase = 2 * np.pi * f_nom * time + np.radians(initial + np.where(on, jump[k], 0.))
+        ds['AC_V_%d' % (k + 1)] = 120. * np.sqrt(2) * np.cos(phase)
+        ds['AC_I_%d' % (k + 1)] = 10. * np.sqrt(2) * scale * np.cos(phase)
+    return ds
+
+
+@pytest.fixture
+def analyzer():
+    return p1547.PhaseJumpAnalyzer(f_nom=60.)
+
+
+@pytest.mark.parametrize('sign', [1., -1.])
+def test_leading_or_lagging_jump_passes(analyzer, sign):
+    row = analyzer.analyze([capture((sign * 60., 0., 0.))], 1, name='PhaseJump_Test1')
+    assert row['JUMPS'] == 2
+    assert row['JUMP_TIME'] == pytest.approx(1.0, abs=1e-3)
+    assert row['RETURN_TIME'] == pytest.approx(1.5, abs=1e-3)
+    assert row['JUMP_STEP_1'] == pytest.approx(sign * 60., abs=1.)
+    assert row['RETURN_STEP_1'] == pytest.approx(-sign * 60., abs=1.)
+    assert row['JUMP_STEP_2'] == pytest.approx(0., abs=1.)
+    assert row['ANGLE_ERROR'] < 1.
+    assert row['RECOVERY_TIME'] == 0.
+    assert not row['TRIP']
+    assert row['RESULT'] == 'Pass'
+
+
+def test_wrong_angle_is_invalid(analyzer):
+    row = analyzer.analyze([capture((30., 0., 0.))], 1)
+    assert row['ANGLE_ERROR'] == pytest.approx(30., abs=1.)
+    assert row['RESULT'] == 'Invalid'
+
+
+def test_lagging_jump_is_invalid_for_test_4(analyzer):
+    # tests 4 and 5 (60 s jumps) are only leading or lagging
+    row = analyzer.analyze([capture((-20., -20., -20.), duration=1.0)], 4)
+    assert row['ANGLE_ERROR'] == pytest.approx(40., abs=1.)
+    assert row['RESULT'] == 'Invalid'
+
+
+def test_lost_current_is_a_trip(analyzer):
+    row = analyzer.analyze([capture((60., 0., 0.), current=lambda t: np.where(t >= 1.0, 0., 1.))], 1)
+    assert row['TRIP']
+    assert row['DISTURBANCE'] == pytest.approx(1., abs=0.01)
+    assert row['RESULT'] == 'Fail'
+
+
+@pytest.mark.parametrize('recovered, result', [(2.3, 'Pass'), (2.8, 'Fail')])
+def test_recovery_time(analyzer, recovered, result):
+    # the current is halved from the jump until recovered, the recovery is measured from the return jump
+    row = analyzer.analyze([capture((60., 0., 0.), current=lambda t: np.where((t >= 1.0) & (t < recovered), .5, 1.))],
+                           1)
+    assert row['DISTURBANCE'] == pytest.approx(0.5, abs=0.01)
+    assert row['RECOVERY_TIME'] == pytest.approx(recovered - 1.5, abs=2. / 60.)
+    assert not row['TRIP']
+    assert row['RESULT'] == result
+
+
+def test_start_and_end_captures_of_test_5(analyzer):
+    # the jump and the return jump of the 60 s condition are in two captures
+    start = capture((-20., -20., -20.), t_jump=1.0, duration=10.)
+    end = capture((-20., -20., -20.), t_jump=-9.0, duration=10.)
+    results = analyzer.evaluate([('PhaseJump_Test5', 5, [start, end])])
+    row = results.iloc[0]
+    assert row['JUMPS'] == 2
+    assert row['JUMP_STEP_1'] == pytest.approx(-20., abs=1.)
+    assert row['RETURN_STEP_1'] == pytest.approx(20., abs=1.)
+    assert row['RESULT'] == 'Pass'
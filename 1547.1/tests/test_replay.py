@@ -0,0 +1,143 @@
+"""
+Re-grading of recorded datasets (DatasetReplay)
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from svpelab import p1547
+
+from conftest import ROOT
+
+VV_1 = 'VV_1_PWR_100_vref_100'
+SLOW_STEP = 'Step K'
+VERDICTS = ['90%_BY_TR=1', 'WITHIN_BOUNDS_BY_TR=1', 'WITHIN_BOUNDS_BY_LAST_TR']
+
+
+@pytest.fixture
+def replay():
+    replay = p1547.DatasetReplay.from_config(os.path.join(ROOT, 'Tests', 'VV', 'VV_1.tst'))
+    replay.reset_curve(1)
+    replay.reset_pwr(1.0)
+    return replay
+
+
+def vv_dataset(replay, tr=1.):
+    """
+    Dataset of VV_1 at 100% power as logged by start() and record_timeresponse(): the pre-step sample, the initial
+    sample tagged with the bare step label, 3 Tr samples and the sample of the script after the last Tr. The EUT
+    reaches 90% of the step at Tr 1 except for SLOW_STEP, then settles 2 VAr + 1 VAr per Tr above the target.
+    :return: DataFrame of the dataset, expected result summary, initial rows and Tr rows
+    """
+    characteristic = replay.get_characteristic(p1547.VV)
+    rows = []
+    summary = []
+    initial_index = []
+    tr_index = []
+    v_prev, q_prev, event = replay.v_nom, 0., None
+    time = 0.
+
+    def sample(event, v, q, elapsed=0.):
+        rows.append(dict([('TIME', time + elapsed)] +
+                         [('AC_VRMS_%d' % phase, v) for phase in (1, 2, 3)] +
+                         [('AC_Q_%d' % phase, q / 3.) for phase in (1, 2, 3)] +
+                         [('AC_P_%d' % phase, 0.) for phase in (1, 2, 3)] +
+                         [('EVENT', event)]))
+        return len(rows) - 1
+
+    for label, v in replay.create_vv_dict_steps(v_ref=1.0).items():
+        q = float(characteristic.evaluate(v))
+        sample(event, v_prev, q_prev)
+        initial_index.append(sample(label, v_prev, q_prev))
+        q_tr1 = q_prev if label == SLOW_STEP else q_prev + 0.9 * (q - q_prev)
+        tr_index.append([sample('%s_TR_1' % label, v, q_tr1, tr),
+                         sample('%s_TR_2' % label, v, q + 2., 2 * tr),
+                         sample('%s_TR_3' % label, v, q + 3., 3 * tr)])
+        sample('%s_TR_3' % label, v, q + 3., 3 * tr)
+
+        target_min, target_max = characteristic.bounds(v)
+        verdicts = ['Fail', 'Fail', 'Pass'] if label == SLOW_STEP else ['Pass'] * 3
+        summary.append(verdicts + [v, v, q + 2., q, target_min, target_max, label, VV_1])
+        v_prev, q_prev, event = v, q + 3., '%s_TR_3' % label
+        time += 3 * tr
+
+    columns = replay.get_rslt_sum_col_name().rstrip('\n').split(',')
+    return pd.DataFrame(rows), pd.DataFrame(summary, columns=columns), np.array(initial_index), np.array(tr_index)
+
+
+def former_layout(dataset):
+    """
+    Same dataset as logged before the EVENT labels were set ahead of the samples: the bare step labels are in the
+    lowercase event column and each Tr label is only seen from the sample following its Tr.
+    """
+    dataset = dataset.copy()
+    events = dataset['EVENT'].astype(str)
+    is_tr = events.str.contains('_TR_')
+    dataset['event'] = dataset['EVENT'].where(~is_tr).ffill()
+    dataset['EVENT'] = dataset['EVENT'].where(is_tr).ffill().shift(1)
+    return dataset
+
+
+def assert_summary_equal(result, expected):
+    result = result.reset_index(drop=True)
+    expected = expected.reset_index(drop=True)
+    for column in expected.columns:
+        if column in VERDICTS + ['STEP', 'FILENAME']:
+            assert list(result[column].astype(str).str.strip()) == list(expected[column].astype(str)), column
+        else:
+            np.testing.assert_allclose(result[column].astype(float), expected[column].astype(float), atol=1e-3,
+                                       err_msg=column)
+
+
+def test_step_segments(replay):
+    dataset, expected, initial_index, tr_index = vv_dataset(replay)
+    labels, initial, tr = replay.get_step_segments(dataset)
+    assert labels == list(expected['STEP'])
+    np.testing.assert_array_equal(initial, initial_index)
+    np.testing.assert_array_equal(tr, tr_index)
+
+
+def test_former_layout_tr_rows_are_moved_back(replay):
+    dataset, expected, initial_index, tr_index = vv_dataset(replay)
+    former = former_layout(dataset)
+    # the first row of each Tr label is the following sample
+    assert list(former['EVENT'].iloc[tr_index[:, 1]]) == ['%s_TR_1' % label for label in expected['STEP']]
+    labels, initial, tr = replay.get_step_segments(former)
+    assert labels == list(expected['STEP'])
+    np.testing.assert_array_equal(initial, initial_index)
+    np.testing.assert_array_equal(tr, tr_index)
+
+    # without the lowercase event column the initial sample is the row preceding Tr 1
+    labels, initial, tr = replay.get_step_segments(former.drop(columns='event'))
+    np.testing.assert_array_equal(initial, initial_index)
+    np.testing.assert_array_equal(tr, tr_index)
+
+
+def test_replay_former_layout_dataset(replay, tmp_path):
+    dataset, expected, initial_index, tr_index = vv_dataset(replay)
+    filename = str(tmp_path / (VV_1 + '.csv'))
+    former_layout(dataset).to_csv(filename, index=False)
+    result = replay.replay_dataset(filename)
+    assert_summary_equal(result, expected)
+    assert result.loc[result['STEP'] == SLOW_STEP, VERDICTS].values.tolist() == [['Fail', 'Fail', 'Pass']]
+
+
+def test_regrade_directory_matches_the_result_summary(replay, tmp_path):
+    dataset, expected, initial_index, tr_index = vv_dataset(replay)
+    test_dir = tmp_path / 'VV__VV_1'
+    output_dir = tmp_path / 'regraded'
+    test_dir.mkdir()
+    output_dir.mkdir()
+    dataset.to_csv(str(test_dir / (VV_1 + '.csv')), index=False)
+    expected.to_csv(str(test_dir / 'result_summary.csv'), index=False)
+
+    replay.regrade_directory(str(test_dir), output_dir=str(output_dir))
+    regraded = replay.load_result_summary(str(output_dir / 'result_summary.csv'))
+    assert_summary_equal(regraded, replay.load_result_summary(str(test_dir / 'result_summary.csv')))
+
+    # in place, the original summary is kept as a backup
+    replay.regrade_directory(str(test_dir))
+    assert os.path.isfile(str(test_dir / 'result_summary.csv.bak'))
+    assert_summary_equal(replay.load_result_summary(str(test_dir / 'result_summary.csv')), expected)
@@ -0,0 +1,166 @@
+"""
+Randomized VRT profiles and ride-through grading
+"""
+import numpy as np
+import pytest
+
+from svpelab import p1547
+
+MRA_V_PU = 0.01
+
+
+@pytest.mark.parametrize('current_mode', ['LV_CAT_2', 'LV_CAT_3', 'HV_CAT_2', 'HV_CAT_3'])
+def test_pool_is_regenerated_from_its_seed(current_mode):
+    pool = p1547.VrtSequencePool(current_mode, MRA_V_PU, size=200)
+    again = p1547.VrtSequencePool(current_mode, MRA_V_PU, size=200, seed=pool.seed)
+    assert again.seed == pool.seed
+    np.testing.assert_array_equal(again.values, pool.values)
+    assert again.get_conditions(17) == pool.get_conditions(17)
+
+
+@pytest.mark.parametrize('current_mode', ['LV_CAT_2', 'LV_CAT_3', 'HV_CAT_2', 'HV_CAT_3'])
+def test_pool_is_within_the_vrt_conditions_bands(current_mode):
+    pool = p1547.VrtSequencePool(current_mode, MRA_V_PU, size=500, seed=1547)
+    conditions = p1547.VRT_CONDITIONS[p1547.get_vrt_key(current_mode)]
+    assert pool.labels == list(conditions)
+    for column, (label, (condition, duration, _, low, high)) in enumerate(conditions.items()):
+        values = pool.values[:, column]
+        assert np.all(values >= low[0] + low[1] * MRA_V_PU), label
+        assert np.all(values <= high[0] + high[1] * MRA_V_PU), label
+        assert pool.get_conditions(0)[label][:2] == (condition, duration)
+    assert pool.validate(pool.values).all()
+
+
+def test_modes_get_their_own_profiles_from_one_seed():
+    cat_2 = p1547.VrtSequencePool('LV_CAT_2', MRA_V_PU, size=10, seed=1547)
+    cat_3 = p1547.VrtSequencePool('LV_CAT_3', MRA_V_PU, size=10, seed=1547)
+    assert not np.array_equal(cat_2.values[:, 0], cat_3.values[:, 0])
+
+
+def test_mra_larger_than_a_band_is_rejected():
+    with pytest.raises(p1547.p1547Error):
+        p1547.VrtSequencePool('HV_CAT_2', 0.2, size=10, seed=1547)
+
+
+def vrt_capture(sequence, lost=(), restore_after=0.1, step=0.01, i_nom=10.):
+    """
+    RMS capture of a VRT sequence: the current is lost during the conditions of the labels in lost and restored
+    restore_after seconds after their end
+    """
+    time = np.arange(sequence.start_timing[0], sequence.end_timing[-1] + 1., step)
+    row = np.clip(np.searchsorted(sequence.start_timing, time, side='right') - 1, 0, len(sequence) - 1)
+    current = np.full(time.size, i_nom)
+    for k, label in enumerate(sequence.labels):
+        if label in lost:
+            current[(time >= sequence.start_timing[k]) &
+                    (time < sequence.end_timing[k] + restore_after)] = 0.
+    capture = {'TIME': time}
+    for phase in (1, 2, 3):
+        capture['AC_VRMS_%d' % phase] = 120. * sequence.values[row]
+        capture['AC_IRMS_%d' % phase] = current
+    return capture
+
+
+def lv_sequence(residual):
+    conditions = {'A': (1, 1., 1.0), 'B': (2, 1., residual), 'C': (3, 2., 1.0)}
+    return p1547.TestSequence('VRT', conditions, [(['A', 'B', 'C'], 1)])
+
+
+class Dataset(object):
+    # columns with their names, as the svpelab Dataset
+    def __init__(self, points, data):
+        self.points = points
+        self.data = data
+
+
+def test_join_with_a_settling_gap():
+    # condition numbers 1, 2, 3 then 4, 5, 6 then 7, 8, 9
+    sequences = [p1547.TestSequence('VRT', {'A': (k + 1, 1., 1.0), 'B': (k + 2, 2., 0.5), 'C': (k + 3, 3., 1.0)},
+                                    [(['A', 'B', 'C'], 1)], start_time=5.) for k in (0, 3, 6)]
+    timeline = p1547.TestSequence.join(sequences, gap=10.)
+    assert len(timeline) == 3 + 4 + 4
+    assert timeline.get_test_count() == 3
+    np.testing.assert_array_equal(timeline.test, [0] * 3 + [1] * 4 + [2] * 4)
+    # the gap holds the first condition of the next test
+    np.testing.assert_array_equal(timeline.condition, [1, 2, 3, 4, 4, 5, 6, 7, 7, 8, 9])
+    assert timeline.labels[3:5] == ['A', 'A']
+    assert [timeline.get_test_range(k) for k in range(3)] == [(5., 11.), (11., 27.), (27., 43.)]
+    assert timeline.get_stop_time() == 43.
+    np.testing.assert_array_equal(timeline.start_timing[1:], timeline.end_timing[:-1])
+
+    unjoined = p1547.TestSequence.join(sequences)
+    assert len(unjoined) == 9
+    assert [unjoined.get_test_range(k) for k in range(3)] == [(5., 11.), (11., 17.), (17., 23.)]
+
+
+def test_test_at_times_outside_the_timeline():
+    timeline = p1547.TestSequence.join([lv_sequence(0.5), lv_sequence(0.2)], gap=1.)
+    # 0 to 4 s: first test, 4 to 5 s: gap, 5 to 9 s: second test
+    test, condition = timeline.get_test_at([-1., 0., 1.5, 3.99, 4.5, 5.5, 8.99, 9., 20., np.nan])
+    np.testing.assert_array_equal(test, [0, 0, 0, 0, 1, 1, 1, 1, 1, -1])
+    np.testing.assert_array_equal(condition, [0, 1, 2, 3, 1, 1, 3, 0, 0, 0])
+
+
+def test_split_dataset_into_the_tests():
+    timeline = p1547.TestSequence.join([lv_sequence(0.5), lv_sequence(0.2)], gap=1.)
+    times = [None, -0.5] + list(np.arange(0., 10., 0.25)) + [np.nan, 12.]
+    ds = Dataset(['TIME', 'AC_VRMS_1'], [times, list(range(len(times)))])
+    first, second = timeline.split_dataset(ds)
+
+    assert first.points == ['TIME', 'AC_VRMS_1', 'VRT_CONDITION']
+    assert second.points == first.points
+    assert ds.points == ['TIME', 'AC_VRMS_1']
+    # every sample with a time is in one test, the samples without a time are dropped
+    assert len(first.data[0]) + len(second.data[0]) == len(times) - 2
+    assert first.data[0][0] == -0.5 and max(first.data[0]) == 3.75
+    assert min(second.data[0]) == 4. and second.data[0][-1] == 12.
+    # the gap (4 to 5 s) holds the condition 1 of the second test
+    bounds = [(0., 0), (1., 1), (2., 2), (4., 3), (6., 1), (7., 2), (9., 3), (np.inf, 0)]
+    for split in (first, second):
+        for t, row, condition in zip(*split.data):
+            assert t == times[row]
+            assert condition == next(number for end, number in bounds if t < end), t
+
+
+def test_cessation_band_of_the_mode():
+    evaluator = p1547.RideThroughEvaluator(v_nom=120., waveform=False)
+    assert evaluator.get_cessation_band('LV_CAT_2') == (0.45, 1.1)
+    assert evaluator.get_cessation_band('HV_CAT_3') == (0.5, 1.1)
+    with pytest.raises(p1547.p1547Error):
+        evaluator.get_cessation_band()
+    fixed = p1547.RideThroughEvaluator(v_nom=120., waveform=False, cessation_band=(0.3, 1.2))
+    assert fixed.get_cessation_band('LV_CAT_3') == (0.3, 1.2)
+
+
+@pytest.mark.parametrize('current_mode, mandatory, result', [('LV_CAT_2', True, 'Fail'),
+                                                             ('LV_CAT_3', False, 'Pass')])
+def test_cessation_at_0_47_pu(current_mode, mandatory, result):
+    # 0.47 p.u. is in the mandatory operation region of Category II and the momentary cessation region of Category III
+    sequence = lv_sequence(0.47)
+    evaluator = p1547.RideThroughEvaluator(v_nom=120., waveform=False)
+    results = evaluator.evaluate(sequence, vrt_capture(sequence, lost=['B']), current_mode=current_mode)
+    row = results.set_index('LABEL').loc['B']
+    assert bool(row['MANDATORY']) is mandatory
+    assert row['RESULT'] == result
+    assert row['CESSATION_TIME'] == pytest.approx(1.0, abs=0.02)
+    assert row['RESTORATION_TIME'] == pytest.approx(0.1, abs=0.02)
+    assert list(results['RESULT'][results['LABEL'] != 'B']) == ['Pass', 'Pass']
+
+
+def test_trip_and_slow_restoration_fail():
+    sequence = lv_sequence(0.2)
+    evaluator = p1547.RideThroughEvaluator(v_nom=120., waveform=False)
+    slow = evaluator.evaluate(sequence, vrt_capture(sequence, lost=['B'], restore_after=0.6), current_mode='LV_CAT_2')
+    assert list(slow['RESULT']) == ['Pass', 'Fail', 'Pass']
+    trip = evaluator.evaluate(sequence, vrt_capture(sequence, lost=['B'], restore_after=10.), current_mode='LV_CAT_2')
+    assert bool(trip.set_index('LABEL').loc['B', 'TRIP'])
+    assert trip.set_index('LABEL').loc['B', 'RESULT'] == 'Fail'
+
+
+def test_missing_current_channels_raise():
+    sequence = lv_sequence(0.2)
+    capture = vrt_capture(sequence)
+    for phase in (1, 2, 3):
+        del capture['AC_IRMS_%d' % phase]
+    with pytest.raises(p1547.p1547Error):
+        p1547.RideThroughEvaluator(v_nom=120., waveform=False).evaluate(sequence, capture, current_mode='LV_CAT_2')
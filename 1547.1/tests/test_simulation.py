@@ -0,0 +1,27 @@
+"""
+Compliance scripts run on the simulated test station
+"""
+import os
+
+from svpelab import p1547_sim
+
+from conftest import ROOT
+
+
+def test_watt_var_test_without_nominal_frequency(tmp_path):
+    # WV.py declares no eut.f_nom, the simulated EUT does not model FW
+    result = p1547_sim.simulate_test(os.path.join(ROOT, 'Tests', 'WV', 'WV_1.tst'), str(tmp_path),
+                                     scripts_dir=os.path.join(ROOT, 'Scripts'))
+    assert result['RC'] == 0
+    assert result['RESULT'] == 'Complete'
+
+
+def test_failing_test_is_reported_and_the_suite_continues(tmp_path):
+    scripts_dir = tmp_path / 'Scripts'
+    scripts_dir.mkdir()
+    # the script fails while it is loaded, before the station is built
+    (scripts_dir / 'VV.py').write_text("raise RuntimeError('broken script')\n")
+    result = p1547_sim.simulate_test(os.path.join(ROOT, 'Tests', 'VV', 'VV_1.tst'), str(tmp_path / 'results'),
+                                     scripts_dir=str(scripts_dir))
+    assert result['RC'] == 1
+    assert result['RESULT'] == 'Fail'
@@ -0,0 +1,79 @@
+"""
+Wait for the waveform file saved by the HIL model
+"""
+import os
+import struct
+
+import numpy as np
+
+from svpelab import p1547
+from svpelab import p1547_sim
+
+
+class Script(object):
+    """
+    Test script whose sleeps advance a virtual clock and write the file of the model when it is due
+    """
+    def __init__(self):
+        self.clock = p1547_sim.VirtualClock()
+        self.writes = {}
+        self.messages = []
+
+    def sleep(self, seconds):
+        self.clock.sleep(seconds)
+        for due in sorted(self.writes):
+            if due <= self.clock.elapsed():
+                self.writes.pop(due)()
+
+    def log(self, msg):
+        self.messages.append(msg)
+
+    log_debug = log_warning = log
+
+
+def write_mat_v4(filename, values):
+    # MATLAB v4 matrix as written by RT-LAB OpWriteFile
+    values = np.asarray(values, dtype='<f8')
+    with open(filename, 'wb') as f:
+        f.write(struct.pack('<5i', 0, values.shape[0], values.shape[1], 0, 5) + b'opvar' + values.tobytes())
+
+
+def test_file_of_the_previous_run_is_not_accepted(tmp_path):
+    filename = str(tmp_path / 'Data.mat')
+    write_mat_v4(filename, np.zeros((3, 10)))
+    os.utime(filename, ns=(0, 0))
+    ts = Script()
+    waiter = p1547.SimulationWaiter(ts, hil=None)
+    waiter.mark_file(filename)
+    assert not waiter.wait_file(filename, timeout=5.)
+
+    ts.writes[2.] = lambda: write_mat_v4(filename, np.ones((3, 10)))
+    ts.clock.ns = 0
+    assert waiter.wait_file(filename, timeout=5.)
+    # complete after the write at 2 s and stable_polls polls of 0.2 s
+    assert 2. <= ts.clock.elapsed() < 3.
+
+
+def test_partly_written_file_is_not_accepted(tmp_path):
+    filename = str(tmp_path / 'Data.mat')
+    ts = Script()
+    waiter = p1547.SimulationWaiter(ts, hil=None)
+    waiter.mark_file(filename)
+    write_mat_v4(filename, np.ones((3, 10)))
+    with open(filename, 'r+b') as f:
+        f.truncate(100)
+    assert p1547.get_file_status(filename) == (100, False)
+    assert not waiter.wait_file(filename, timeout=2.)
+
+
+def test_waveform_file_of_the_das(tmp_path):
+    class Device(object):
+        wfm_dir = str(tmp_path)
+        data_name = 'Data.mat'
+
+    class Das(object):
+        device = Device()
+
+    assert p1547.get_waveform_file(Das()) == os.path.join(str(tmp_path), 'Data.mat')
+    assert p1547.get_waveform_file(Das(), 'WAV.mat') == os.path.join(str(tmp_path), 'WAV.mat')
+    assert p1547.get_waveform_file(object()) is None